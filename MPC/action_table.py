@@ -0,0 +1,34 @@
+from map_actions import MapAction
+
+
+class ActionTable:
+    """
+    Immutable, indexed set of the drone and cleaner actions for one map layout.
+
+    The position of a drone action in drone_actions is its action id, which
+    stays the same for every map with the same number of windows and cleaners
+    and is used as the RL action space (same order as
+    MapSimulation.new_build_drone_actions and VectorMapSimulation).
+
+    Drone actions only hold parameters and are shared freely. Cleaner actions
+    keep their progress once started, so cleaner_actions are prototypes that
+    are copied before being put in Map.cleaning_processes.
+    """
+
+    def __init__(self, drone_actions: list[MapAction], cleaner_actions: list[list[MapAction]]):
+        self.drone_actions = tuple(drone_actions)
+        self.cleaner_actions = tuple(tuple(actions) for actions in cleaner_actions)
+        self._ids = {action.name: action_id for action_id, action in enumerate(self.drone_actions)}
+
+    def __len__(self):
+        return len(self.drone_actions)
+
+    def __getitem__(self, action_id: int) -> MapAction:
+        return self.drone_actions[action_id]
+
+    def __iter__(self):
+        return iter(self.drone_actions)
+
+    def id_of(self, action: MapAction) -> int:
+        """Action id of a drone action, looked up by name."""
+        return self._ids[action.name]
@@ -3,6 +3,7 @@ from basestation import Base_station
 from drone import Transport_drone
 from cleaner import Robot_cleaner
 import numpy as np
+from events import STATE_ERROR
 class actions:
     def __init__(self, name, duration, energy_cost ,target : Robot_cleaner| Transport_drone):
         self.name = name  # Name of the action
@@ -61,15 +62,20 @@ class actions:
         pass
 
     def when_start(self):
-        print(f"Starting action : {self}")
+        # The simulation reports starts and ends as events, see events.py
+        pass
 
     def when_done(self):
-        print(f"Done whit action : {self}")
+        pass
         
 
     def aplay_action_movment(self, delta_t):
         pass
 
+    def refresh(self):
+        # Recompute values that depend on the current state, called right before the action is started
+        pass
+
     def is_alowed(self):
         pass
 
@@ -96,6 +102,10 @@ class fly_to_window(actions):
     def calculate_energy_cost(self):
         return self.duration * self.power_consumption
 
+    def refresh(self):
+        self.duration = self.calculate_duration()
+        self.energy_cost = self.calculate_energy_cost()
+
     def aplay_action_movment(self, delta_t):
         direction = self.window.pos3d - self.drone.pos3d
         distance_to_travel = self.speed * delta_t
@@ -104,7 +114,7 @@ class fly_to_window(actions):
             self.drone.pos3d = self.window.pos3d.copy()
         else:
             direction_normalized = direction / distance_to_window
-            self.drone.pos3d += direction_normalized * distance_to_travel
+            self.drone.pos3d = self.drone.pos3d + direction_normalized * distance_to_travel
 
         if self.drone.load is not None:
             #print(self.drone.load)
@@ -123,10 +133,11 @@ class fly_to_window(actions):
         return self.drone.ucupied is False
     
 class clean_window(actions):
-    def __init__(self, cleaner: Robot_cleaner , power_consumption=100.0):
+    def __init__(self, cleaner: Robot_cleaner , power_consumption=100.0, events=None):
         super().__init__('clean_window', 0, 0, cleaner)
         self.cleaner = cleaner  # Reference to the cleaner performing the action
         self.power_consumption = power_consumption  # Power consumption in watts/joules per second
+        self.events = events  # EventStream (events.py) that hears about inconsistent states
         if self.cleaner.on_window is None:
             self.window = None
             self.duration = 0
@@ -138,6 +149,16 @@ class clean_window(actions):
         
     def calculate_energy_cost(self):
         return self.duration * self.power_consumption
+
+    def refresh(self):
+        if self.cleaner.on_window is None:
+            self.window = None
+            self.duration = 0
+            self.energy_cost = 0
+        else:
+            self.window = self.cleaner.on_window
+            self.duration = self.cleaner.on_window.cleaning_time
+            self.energy_cost = self.calculate_energy_cost()
     
     def when_start(self):
         super().when_done()
@@ -155,7 +176,11 @@ class clean_window(actions):
         if self.cleaner.battery_level <= 40.0:
             return False
         if not np.array_equal(self.cleaner.pos3d, self.window.pos3d):
-            print("there is a error if you see this message ")
+            # The cleaner left its window without the action being rebuilt, should not happen
+            if self.events is not None:
+                now = self.cleaner._map.time if self.cleaner._map is not None else 0.0
+                self.events.emit(STATE_ERROR, now, f'cleaner {self.cleaner.name}',
+                                 action=str(self), error='cleaner is not on the window it would clean')
             return False
         return self.window.state == 'dirty'
     
@@ -325,6 +350,10 @@ class return_to_base(actions):
 
     def calculate_energy_cost(self):
         return self.duration * self.power_consumption
+
+    def refresh(self):
+        self.duration = self.calculate_duration()
+        self.energy_cost = self.calculate_energy_cost()
     
 
     def aplay_action_movment(self, delta_t):
@@ -336,7 +365,7 @@ class return_to_base(actions):
             self.drone.pos3d = self.base_station.pos3d.copy()
         else:
             direction_normalized = direction / distance_to_window
-            self.drone.pos3d += direction_normalized * distance_to_travel
+            self.drone.pos3d = self.drone.pos3d + direction_normalized * distance_to_travel
 
         if self.drone.load is not None:
             self.drone.load.pos3d = self.drone.pos3d.copy()
@@ -361,6 +390,10 @@ class charge_cleaner(actions):
 
     def calculate_energy_cost(self):
         return -self.duration * self.charge_rate  # Negative because charging adds energy
+
+    def refresh(self):
+        self.duration = self.calculate_duration()
+        self.energy_cost = self.calculate_energy_cost()
     
     def when_start(self):
         self.cleaner.is_charging = True
@@ -390,6 +423,10 @@ class charge_drone(actions):
 
     def calculate_energy_cost(self):
         return -self.duration * self.charge_rate  # Negative because charging adds energy
+
+    def refresh(self):
+        self.duration = self.calculate_duration()
+        self.energy_cost = self.calculate_energy_cost()
     
     def when_start(self):
         pass
@@ -1,7 +1,28 @@
 import numpy as np
 from cleaner import Robot_cleaner
+from map_state import MapState
 
 class Base_station:
+    """View of the base station position in a MapState (see map_state.py)."""
+
     def __init__(self, pos3d, ):
+        # A base station made on its own gets its own state, Map rebinds it to the shared one
+        self._s = MapState(num_drones=0, num_cleaners=0, num_windows=0)
         self.pos3d = np.array(pos3d, dtype=np.float64)  # (x, y, z) position of the base station
-        self.states = [self.pos3d]
\ No newline at end of file
+
+    def _bind(self, state: MapState):
+        self._s = state
+
+    @property
+    def pos3d(self):
+        # A copy, writing into the row directly would bypass write() and the journal
+        return self._s.base_pos.copy()
+
+    @pos3d.setter
+    def pos3d(self, value):
+        self._s.write(self._s.base_pos, slice(None), value)
+        self._s.topology.invalidate()
+
+    @property
+    def states(self):
+        return [self.pos3d]
@@ -0,0 +1,367 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import numpy as np
+from map import Map, building_map_generater
+from map_simulation import MapSimulation
+from map_actions import NullAction
+from mcts_planner import HeuristicController, heuristic_action
+from mpc_controller import MPCController
+from rl_agent import QLearningAgent
+
+DEFAULT_SIZES = ((2, 10), (2, 100), (8, 10), (8, 100), (8, 300))  # step is about 1 s at 1000 windows
+
+
+# ---- Cases ----
+# Each case takes (sim, map) of a mission in progress and returns the call to time
+
+def _case_step(sim: MapSimulation, map_state: Map):
+    random.seed(0)  # step picks among the allowed actions at random
+    return lambda: sim.step(map_state)
+
+
+def _case_advance_allowedv2(sim: MapSimulation, map_state: Map):
+    allowed = sim._masked(sim.action_table(map_state).drone_actions, sim.allowed_mask(map_state))
+    return lambda: sim.advance_allowedv2(allowed, map_state)
+
+
+def _case_apply_action(sim: MapSimulation, map_state: Map):
+    table = sim.action_table(map_state)
+    action = heuristic_action(map_state, table, sim.allowed_mask(map_state)) or table[1]
+    return lambda: sim.apply_action(action, map_state)
+
+
+def _case_update_states(sim: MapSimulation, map_state: Map):
+    return map_state.update_states
+
+
+def _case_get_dqn_state(sim: MapSimulation, map_state: Map):
+    out = np.empty(sim.dqn_layout(map_state).size, dtype=np.float32)
+    return lambda: sim.get_dqn_state(map_state, out)
+
+
+def _case_q_update(sim: MapSimulation, map_state: Map):
+    table = sim.action_table(map_state)
+    agent = QLearningAgent(n_actions=len(table))
+    state = sim.get_state(map_state)
+    next_map = sim.apply_action(table[1], map_state)
+    next_state = sim.get_state(next_map)
+    return lambda: agent.update(state, 1, -1.0, next_state, False)
+
+
+CASES = {
+    'step': _case_step,
+    'advance_allowedv2': _case_advance_allowedv2,
+    'apply_action': _case_apply_action,
+    'update_states': _case_update_states,
+    'get_dqn_state': _case_get_dqn_state,
+    'q_update': _case_q_update,
+}
+
+
+def mission_map(num_cleaners: int, num_windows: int, seed: int = 0, warm_steps: int = 3):
+    """
+    (sim, map) of a building map a few heuristic drone actions into the
+    mission, by default with one cleaner dropped and the drone carrying the
+    next one. The same for a seed.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    map_state = building_map_generater(num_cleaners, num_windows)
+    sim = MapSimulation(map_state)
+    for _ in range(warm_steps):
+        table = sim.action_table(map_state)
+        action = heuristic_action(map_state, table, sim.allowed_mask(map_state))
+        if action is None:
+            break
+        map_state = sim.apply_action(action, map_state)
+    sim.map = map_state
+    return sim, map_state
+
+
+# ---- Measuring ----
+def time_call(call, min_time: float = 0.2, repeat: int = 3, warmup: int = 2):
+    """
+    (seconds per call of the best round, of the mean round, calls per round).
+    The calls per round are doubled until a round takes min_time.
+    """
+    for _ in range(warmup):
+        call()
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            call()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+    rounds = [elapsed]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            call()
+        rounds.append(time.perf_counter() - started)
+    return min(rounds) / number, sum(rounds) / len(rounds) / number, number
+
+
+def allocation_per_call(call, calls: int = 3):
+    """(peak bytes allocated during one call, bytes still held after it), averaged over calls, by tracemalloc."""
+    tracemalloc.start()
+    try:
+        peaks = []
+        held = []
+        for _ in range(calls):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            call()
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            held.append(current - before)
+    finally:
+        tracemalloc.stop()
+    return float(np.mean(peaks)), float(np.mean(held))
+
+
+def run(names=None, sizes=DEFAULT_SIZES, seed: int = 0, min_time: float = 0.2, repeat: int = 3, log=None) -> dict:
+    """Time every case in names (default all) on every (cleaners, windows) size, see CASES."""
+    names = list(CASES) if names is None else names
+    results = []
+    for num_cleaners, num_windows in sizes:
+        for name in names:
+            sim, map_state = mission_map(num_cleaners, num_windows, seed)
+            call = CASES[name](sim, map_state)
+            best, mean, number = time_call(call, min_time, repeat)
+            alloc_peak, alloc_held = allocation_per_call(call)
+            result = {
+                'name': name, 'cleaners': num_cleaners, 'windows': num_windows,
+                'ops_per_sec': 1.0 / best, 'best_us': best * 1e6, 'mean_us': mean * 1e6, 'calls': number,
+                'alloc_peak_bytes': alloc_peak, 'alloc_held_bytes': alloc_held,
+            }
+            results.append(result)
+            if log is not None:
+                print(format_result(result), file=log, flush=True)
+    return {
+        'meta': {
+            'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'seed': seed, 'min_time': min_time, 'repeat': repeat, 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+# ---- Scaling ----
+SCALING_WINDOWS = (10, 30, 100, 300, 1000, 3000, 10000, 50000)
+SCALING_CLEANERS = (1, 2, 4, 8, 16, 32, 64)
+POLICIES = {
+    'heuristic': HeuristicController,
+    'mpc': MPCController,
+    'default': None,  # advance_allowedv2 and a random choice, only for small maps
+}
+
+
+def _default_can_act(sim: MapSimulation, map_state: Map) -> bool:
+    """The default policy has a non-null action to choose from (it raises in step() otherwise)."""
+    allowed = sim._masked(sim.action_table(map_state).drone_actions, sim.allowed_mask(map_state))
+    return any(not isinstance(action, NullAction) for action in sim.advance_allowedv2(allowed, map_state))
+
+
+def step_cost(num_cleaners: int, num_windows: int, policy: str = 'heuristic', steps: int = 30, seed: int = 0,
+              warmup: int = 3):
+    """
+    (median seconds per MapSimulation.step over steps of a seeded mission,
+    bytes held by one Map.copy() snapshot, number of steps timed).
+
+    The first warmup steps are not timed, they build the topology tables
+    and the other one-off caches. The default policy stops early once it
+    has nothing left to do.
+    """
+    sim, map_state = mission_map(num_cleaners, num_windows, seed, warm_steps=0)
+    if POLICIES[policy] is not None:
+        sim.controller = POLICIES[policy](sim)
+    times = []
+    for step in range(warmup + steps):
+        if sim.controller is None and not _default_can_act(sim, map_state):
+            break
+        started = time.perf_counter()
+        map_state = sim.step(map_state)
+        if step >= warmup:
+            times.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        snapshot = map_state.copy()
+        snapshot_bytes = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return (float(np.median(times)) if times else float('nan')), snapshot_bytes, len(times)
+
+
+def fit_exponent(sizes, values, fit_from: int = 100) -> float:
+    """b of values ~ a * sizes ** b, least squares in log-log over the sizes from fit_from up."""
+    sizes = np.asarray(sizes, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    use = (sizes >= fit_from) & np.isfinite(values) & (values > 0)
+    if np.count_nonzero(use) < 2:
+        return float('nan')
+    return float(np.polyfit(np.log(sizes[use]), np.log(values[use]), 1)[0])
+
+
+def scaling(windows=SCALING_WINDOWS, cleaners=SCALING_CLEANERS, fixed_cleaners: int = 4, fixed_windows: int = 1000,
+            policy: str = 'heuristic', steps: int = 30, seed: int = 0, fit_from: int = 100, warmup: int = 3,
+            log=None) -> dict:
+    """
+    Median per-step time and snapshot memory against the number of windows (at
+    fixed_cleaners) and of cleaners (at fixed_windows), with the fitted
+    exponent of each curve. Cleaner curves are fitted from 1 cleaner up.
+    """
+    curves = {}
+    for axis, points in (('windows', [(fixed_cleaners, w) for w in windows]),
+                         ('cleaners', [(c, fixed_windows) for c in cleaners])):
+        rows = []
+        for num_cleaners, num_windows in points:
+            step_seconds, snapshot_bytes, timed = step_cost(num_cleaners, num_windows, policy, steps, seed, warmup)
+            row = {'cleaners': num_cleaners, 'windows': num_windows, 'steps': timed,
+                   'step_us': step_seconds * 1e6, 'snapshot_bytes': snapshot_bytes}
+            rows.append(row)
+            if log is not None:
+                print(f"{policy:<10} C={num_cleaners:<3} W={num_windows:<6} {row['step_us']:>12.1f} us/step "
+                      f"{snapshot_bytes / 1024:>10.1f} KiB/snapshot  {timed}/{steps} steps", file=log, flush=True)
+        curves[axis] = rows
+    fits = {}
+    for axis, start in (('windows', fit_from), ('cleaners', 1)):
+        sizes = [row[axis] for row in curves[axis]]
+        fits[f'time_vs_{axis}'] = fit_exponent(sizes, [row['step_us'] for row in curves[axis]], start)
+        fits[f'memory_vs_{axis}'] = fit_exponent(sizes, [row['snapshot_bytes'] for row in curves[axis]], start)
+    return {
+        'meta': {
+            'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'policy': policy, 'steps': steps, 'warmup': warmup, 'seed': seed, 'fit_from': fit_from,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'curves': curves,
+        'fits': fits,
+    }
+
+
+def compare_fits(results: dict, baseline: dict, tolerance: float = 0.15) -> list:
+    """(name, exponent, baseline exponent) of the fitted exponents that grew by more than tolerance."""
+    regressions = []
+    for name, exponent in results['fits'].items():
+        old = baseline.get('fits', {}).get(name)
+        if old is not None and np.isfinite(exponent) and np.isfinite(old) and exponent > old + tolerance:
+            regressions.append((name, exponent, old))
+    return regressions
+
+
+# ---- Reporting ----
+def _key(result):
+    return result['name'], result['cleaners'], result['windows']
+
+
+def format_result(result, baseline=None) -> str:
+    line = (f"{result['name']:<18} C={result['cleaners']:<3} W={result['windows']:<6} "
+            f"{result['ops_per_sec']:>12.1f} ops/s {result['best_us']:>12.1f} us "
+            f"{result['alloc_peak_bytes'] / 1024:>10.1f} KiB peak")
+    if baseline is not None:
+        line += f"  {result['ops_per_sec'] / baseline['ops_per_sec'] - 1.0:+7.1%} vs baseline"
+    return line
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.1) -> list:
+    """Results more than threshold (a fraction) slower than the same case and size in baseline."""
+    base = {_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        old = base.get(_key(result))
+        if old is not None and result['ops_per_sec'] < old['ops_per_sec'] * (1.0 - threshold):
+            regressions.append((result, old))
+    return regressions
+
+
+def _parse_sizes(text: str):
+    # "2x10,8x100" -> ((2, 10), (8, 100))
+    return tuple(tuple(int(n) for n in size.split('x')) for size in text.split(','))
+
+
+def _parse_ints(text: str):
+    return tuple(int(n) for n in text.split(','))
+
+
+def main_scaling(args) -> int:
+    results = scaling(args.windows, args.cleaners, args.fixed_cleaners, args.fixed_windows,
+                      args.policy, args.steps, args.seed, args.fit_from, args.warmup, log=sys.stdout)
+    for name, exponent in results['fits'].items():
+        print(f'{name:<20} exponent {exponent:.2f}')
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    failed = False
+    if args.max_exponent is not None and results['fits']['time_vs_windows'] > args.max_exponent:
+        print(f"REGRESSION time_vs_windows exponent {results['fits']['time_vs_windows']:.2f} > {args.max_exponent}")
+        failed = True
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for name, exponent, old in compare_fits(results, baseline, args.exponent_tolerance):
+            print(f'REGRESSION {name} exponent {exponent:.2f}, baseline {old:.2f}')
+            failed = True
+    return 1 if failed else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the simulation hot paths.')
+    parser.add_argument('--cases', help=f"comma separated, from {', '.join(CASES)} (default all)")
+    parser.add_argument('--sizes', type=_parse_sizes, default=DEFAULT_SIZES, help='CxW,... (default %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per timing round')
+    parser.add_argument('--repeat', type=int, default=3, help='timing rounds, the best one counts')
+    parser.add_argument('--out', help='write the results as JSON')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown that counts as a regression')
+    scaling_args = parser.add_argument_group('scaling mode', 'per-step cost against map size and its fitted exponent')
+    scaling_args.add_argument('--scaling', action='store_true', help='run the scaling sweep instead of the cases')
+    scaling_args.add_argument('--policy', choices=list(POLICIES), default='heuristic')
+    scaling_args.add_argument('--windows', type=_parse_ints, default=SCALING_WINDOWS, help='window counts to sweep')
+    scaling_args.add_argument('--cleaners', type=_parse_ints, default=SCALING_CLEANERS, help='cleaner counts to sweep')
+    scaling_args.add_argument('--fixed-cleaners', type=int, default=4, help='cleaners during the window sweep')
+    scaling_args.add_argument('--fixed-windows', type=int, default=1000, help='windows during the cleaner sweep')
+    scaling_args.add_argument('--steps', type=int, default=30, help='steps timed per point, the median counts')
+    scaling_args.add_argument('--warmup', type=int, default=3, help='untimed steps before them')
+    scaling_args.add_argument('--fit-from', type=int, default=100, help='smallest window count in the fit')
+    scaling_args.add_argument('--max-exponent', type=float, help='fail if time grows faster than windows ** this')
+    scaling_args.add_argument('--exponent-tolerance', type=float, default=0.15,
+                              help='exponent growth against --baseline that counts as a regression')
+    args = parser.parse_args(argv)
+    if args.scaling:
+        return main_scaling(args)
+
+    names = args.cases.split(',') if args.cases else None
+    results = run(names, args.sizes, args.seed, args.min_time, args.repeat, log=sys.stdout)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        base = {_key(result): result for result in baseline['results']}
+        print('\nAgainst', args.baseline)
+        for result in results['results']:
+            print(format_result(result, base.get(_key(result))))
+        regressions = compare(results, baseline, args.threshold)
+        for result, old in regressions:
+            print(f"REGRESSION {result['name']} C={result['cleaners']} W={result['windows']}: "
+                  f"{result['ops_per_sec']:.1f} ops/s, baseline {old['ops_per_sec']:.1f} ops/s")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    # python benchmarks.py --out results.json, later python benchmarks.py --baseline results.json
+    # python benchmarks.py --scaling --out scaling.json, later --scaling --baseline scaling.json
+    sys.exit(main())
@@ -1,16 +1,123 @@
-
 import numpy as np
+from map_state import MapState, NO_INDEX
+
+
 class Robot_cleaner:
+    """View of one cleaner row in a MapState (see map_state.py)."""
+
     def __init__(self, name, battery_capacity, pos3d=(0, 0, 0)):
+        # A cleaner made on its own gets a one-row state, Map rebinds it to the shared one
+        self._s = MapState(num_drones=0, num_cleaners=1, num_windows=0)
+        self._i = 0
+        self._map = None
         self.name = name
         self.battery_capacity = battery_capacity
         self.battery_level = battery_capacity
         self.is_cleaning = False
         self.is_charging = False
-        self.on_window = None
-        self.this_id=id(self)
         self.pos3d = np.array(pos3d)
-        self.states = [self.pos3d, self.battery_level, self.is_cleaning, self.is_charging, self.on_window]
         self.last_update_time = 0.0
+
+    @classmethod
+    def view(cls, state: MapState, index: int, owner_map):
+        cleaner = cls.__new__(cls)
+        cleaner._bind(state, index, owner_map)
+        return cleaner
+
+    def _bind(self, state: MapState, index: int, owner_map):
+        self._s = state
+        self._i = index
+        self._map = owner_map
+
+    def _set(self, array, value):
+        # Write this cleaner's row and flag it as changed (simulation.py re-checks its actions)
+        self._s.write(array, self._i, value)
+        self._s.cleaner_dirty[self._i] = True
+
+    @property
+    def this_id(self):
+        return id(self)
+
+    @property
+    def name(self):
+        return self._s.cleaner_names[self._i]
+
+    @name.setter
+    def name(self, value):
+        self._s.cleaner_names[self._i] = value
+
+    @property
+    def pos3d(self):
+        # A copy, writing into the row directly would bypass write() and the journal
+        return self._s.cleaner_pos[self._i].copy()
+
+    @pos3d.setter
+    def pos3d(self, value):
+        self._set(self._s.cleaner_pos, value)
+
+    @property
+    def battery_capacity(self):
+        return float(self._s.cleaner_capacity[self._i])
+
+    @battery_capacity.setter
+    def battery_capacity(self, value):
+        self._set(self._s.cleaner_capacity, value)
+
+    @property
+    def battery_level(self):
+        # Evaluated from the lazy battery model, see MapState
+        return self._s.cleaner_battery_level(self._i)
+
+    @battery_level.setter
+    def battery_level(self, value):
+        self._s.set_cleaner_battery(self._i, value)
+        self._s.cleaner_dirty[self._i] = True
+
+    @property
+    def is_cleaning(self):
+        return bool(self._s.cleaner_is_cleaning[self._i])
+
+    @is_cleaning.setter
+    def is_cleaning(self, value):
+        self._set(self._s.cleaner_is_cleaning, value)
+
+    @property
+    def is_charging(self):
+        return bool(self._s.cleaner_is_charging[self._i])
+
+    @is_charging.setter
+    def is_charging(self, value):
+        self._set(self._s.cleaner_is_charging, value)
+
+    @property
+    def on_window(self):
+        window_index = self._s.cleaner_on_window[self._i]
+        if window_index == NO_INDEX:
+            return None
+        return self._map.windows[window_index]
+
+    @on_window.setter
+    def on_window(self, window):
+        if window is None and self._s.cleaner_suction_on[self._i]:
+            # Stop the suction drain, Map.update_cleaning_processes starts it again once it is back on a window
+            self._s.set_cleaner_battery(self._i, self._s.cleaner_battery_level(self._i))
+            self._s.write(self._s.cleaner_suction_on, self._i, False)
+        self._set(self._s.cleaner_on_window, NO_INDEX if window is None else window._i)
+
+    @property
+    def last_update_time(self):
+        if self._s.cleaner_suction_on[self._i]:
+            return float(self._s.battery_time[0])
+        return float(self._s.cleaner_last_update[self._i])
+
+    @last_update_time.setter
+    def last_update_time(self, value):
+        self._set(self._s.cleaner_last_update, value)
+
+    @property
+    def states(self):
+        return [self.pos3d, self.battery_level, self.is_cleaning, self.is_charging, self.on_window]
+
     def update_states(self):
-        self.states = [self.pos3d, self.battery_level, self.is_cleaning, self.is_charging, self.on_window]
+        # states is read straight from the arrays, nothing to refresh
+        pass
@@ -29,18 +29,14 @@ class CleanWindowAction(MapAction):
         #print(f"Cleaner {self.cleaner_index} finished cleaning.")
         update_Map.cleaners[self.cleaner_index].is_cleaning = False
         update_Map.cleaners[self.cleaner_index].on_window.state = 'clean'
-        self.when_runed_time(update_Map , self.end_time)
         self.is_cleaning = False
 
-    def when_runed_time(self , update_Map : Map , time):
-        run_time = time - self.larsted_update_time
-        self.larsted_update_time = time
-        if self.cleaner_index >= len(update_Map.cleaners):   
-            return False
+    def battery_rate(self, update_Map : Map):
+        # % of the battery used per time unit, Map.update_cleaning_processes integrates it
+        if self.cleaner_index >= len(update_Map.cleaners):
+            return 0.0
         cleaner = update_Map.cleaners[self.cleaner_index]
-        energy_used = self.power_consumption * run_time  
-        battery_drain_pct = (energy_used / cleaner.battery_capacity) * 100.0
-        cleaner.battery_level = max(0.0, cleaner.battery_level - battery_drain_pct)
+        return self.power_consumption / cleaner.battery_capacity * 100.0
 
 
     def is_allowed(self, map_state: Map) -> bool:
@@ -98,18 +94,13 @@ class ChargeCleanerAction(MapAction):
             return False
         update_Map.cleaners[self.cleaner_index].is_charging = False
         update_Map.cleaners[self.cleaner_index].battery_level = 100.0
-        self.when_runed_time(update_Map, self.end_time)
 
-    def when_runed_time(self, update_Map: Map, time):
-        run_time = time - self.larsted_update_time
-        self.larsted_update_time = time
+    def battery_rate(self, update_Map: Map):
+        # Charging adds energy (negative consumption)
         if self.cleaner_index >= len(update_Map.cleaners):
-            return False
+            return 0.0
         cleaner = update_Map.cleaners[self.cleaner_index]
-        # Charging adds energy (negative consumption)
-        energy_added = self.charge_rate * run_time
-        battery_gain_pct = (energy_added / cleaner.battery_capacity) * 100.0
-        cleaner.battery_level = min(100.0, cleaner.battery_level + battery_gain_pct)
+        return -self.charge_rate / cleaner.battery_capacity * 100.0
 
     def is_allowed(self, map_state: Map) -> bool:
         if self.cleaner_index >= len(map_state.cleaners):
@@ -150,6 +141,5 @@ class CleanerNullAction(NullAction):
     def when_done(self, update_Map: Map):
         return True
     
-    def when_runed_time(self, update_Map: Map, time):
-        self.larsted_update_time = time
-        return True
+    def battery_rate(self, update_Map: Map):
+        return 0.0
@@ -1,17 +1,90 @@
 import numpy as np
 from cleaner import Robot_cleaner
+from map_state import MapState, NO_INDEX
+
 
 class Transport_drone:
+    """View of one drone row in a MapState (see map_state.py)."""
+
     def __init__(self, init_state):
+        # A drone made on its own gets a one-row state, Map rebinds it to the shared one
+        self._s = MapState(num_drones=1, num_cleaners=0, num_windows=0)
+        self._i = 0
+        self._map = None
         self.pos3d = np.array(init_state[0:3], dtype=np.float64)  # (x, y, z) position
         self.orentation = np.array(init_state[3:6], dtype=np.float64)  # [vx, vy, vz]
-        self.load = None  #| Robot_cleaner  # current load being carried by the drone (None if no load)
         self.battery_capacity = 100.0  # maximum battery capacity
         self.battery_level = 100.0  # current battery level
         self.ucupied = False  # whether the drone is currently occupied with an action
         self.is_moving = False  # whether the drone is currently moving
-        
-        self.states = [self.pos3d, self.load, self.battery_level]
+
+    def _bind(self, state: MapState, index: int, owner_map):
+        self._s = state
+        self._i = index
+        self._map = owner_map
+
+    def _set(self, array, value):
+        # Write this drone's row and flag it as changed (simulation.py re-checks its actions)
+        self._s.write(array, self._i, value)
+        self._s.drone_dirty[self._i] = True
+
+    @property
+    def pos3d(self):
+        # A copy, writing into the row directly would bypass write() and the journal
+        return self._s.drone_pos[self._i].copy()
+
+    @pos3d.setter
+    def pos3d(self, value):
+        self._set(self._s.drone_pos, value)
+
+    @property
+    def battery_capacity(self):
+        return float(self._s.drone_capacity[self._i])
+
+    @battery_capacity.setter
+    def battery_capacity(self, value):
+        self._set(self._s.drone_capacity, value)
+
+    @property
+    def battery_level(self):
+        return float(self._s.drone_battery[self._i])
+
+    @battery_level.setter
+    def battery_level(self, value):
+        self._set(self._s.drone_battery, value)
+
+    @property
+    def ucupied(self):
+        return bool(self._s.drone_ucupied[self._i])
+
+    @ucupied.setter
+    def ucupied(self, value):
+        self._set(self._s.drone_ucupied, value)
+
+    @property
+    def is_moving(self):
+        return bool(self._s.drone_is_moving[self._i])
+
+    @is_moving.setter
+    def is_moving(self, value):
+        self._set(self._s.drone_is_moving, value)
+
+    @property
+    def load(self) -> Robot_cleaner | None:
+        """Current load being carried by the drone (None if no load)."""
+        cleaner_index = self._s.drone_load[self._i]
+        if cleaner_index == NO_INDEX:
+            return None
+        return self._map.cleaners[cleaner_index]
+
+    @load.setter
+    def load(self, cleaner):
+        self._set(self._s.drone_load, NO_INDEX if cleaner is None else cleaner._i)
+
+    @property
+    def states(self):
+        return [self.pos3d, self.load, self.battery_level]
 
     def update_states(self):
-        self.states = [self.pos3d, self.load, self.battery_level]
\ No newline at end of file
+        # states is read straight from the arrays, nothing to refresh
+        pass
@@ -0,0 +1,142 @@
+import collections
+import json
+
+# Event kinds
+ACTION_STARTED = 'action_started'
+ACTION_DONE = 'action_done'
+WINDOW_CLEANED = 'window_cleaned'
+BATTERY_LOW = 'battery_low'
+RUN_ENDED = 'run_ended'
+STATE_ERROR = 'state_error'
+ALLOWED_ACTIONS = 'allowed_actions'
+BATTERY_LEVELS = 'battery_levels'
+
+# Verbosity, an event is emitted when the stream's verbosity is at least its level
+QUIET = 0
+EVENTS = 1  # action_started, action_done, window_cleaned, battery_low, run_ended, state_error
+DEBUG = 2  # also the allowed actions and battery levels of every step
+
+BATTERY_LOW_LEVEL = 40.0  # percent, below this a cleaner can not start cleaning
+
+
+class Event:
+    __slots__ = ('kind', 'time', 'source', 'data')
+
+    def __init__(self, kind: str, time: float, source: str, data: dict):
+        self.kind = kind
+        self.time = time  # simulation time
+        self.source = source  # 'drone', 'cleaner <name>', 'window <name>' or 'simulation'
+        self.data = data
+
+    def to_dict(self) -> dict:
+        return {'kind': self.kind, 'time': self.time, 'source': self.source, **self.data}
+
+    def __str__(self):
+        data = ' '.join(f'{key}={value}' for key, value in self.data.items())
+        return f'[{self.time:.2f}] {self.kind} {self.source} {data}'.rstrip()
+
+
+# ---- Sinks ----
+class NullSink:
+    """Drops every event."""
+
+    def write(self, event: Event):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class RingBufferSink(NullSink):
+    """Keeps the last capacity events in memory."""
+
+    def __init__(self, capacity: int = 10_000):
+        self.buffer = collections.deque(maxlen=capacity)
+
+    def write(self, event: Event):
+        self.buffer.append(event)
+
+    def events(self, kind: str = None) -> list:
+        if kind is None:
+            return list(self.buffer)
+        return [event for event in self.buffer if event.kind == kind]
+
+    def clear(self):
+        self.buffer.clear()
+
+
+class FileSink(NullSink):
+    """
+    Writes events as JSON lines, buffered in memory and written in bulk
+    every buffer_size events and on flush() / close().
+    """
+
+    def __init__(self, path: str, buffer_size: int = 4096):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._file = open(path, 'w')
+
+    def write(self, event: Event):
+        self._buffer.append(event)
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._file.write(''.join(json.dumps(event.to_dict(), default=str) + '\n' for event in self._buffer))
+            self._buffer = []
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PrintSink(NullSink):
+    """Prints every event, for interactive runs."""
+
+    def write(self, event: Event):
+        print(event)
+
+
+class EventStream:
+    """
+    Typed simulation events sent to a sink, filtered by verbosity.
+
+    Producers check wants(level) before building an event, so a QUIET stream
+    (the default of the simulations) costs one comparison per call site.
+    """
+
+    def __init__(self, sink=None, verbosity: int = EVENTS, battery_low: float = BATTERY_LOW_LEVEL):
+        self.sink = sink if sink is not None else NullSink()
+        self.verbosity = verbosity
+        self.battery_low = battery_low
+
+    def wants(self, level: int) -> bool:
+        return self.verbosity >= level
+
+    def emit(self, kind: str, time: float, source: str, level: int = EVENTS, **data):
+        if self.verbosity >= level:
+            self.sink.write(Event(kind, float(time), source, data))
+
+    def battery(self, time: float, source: str, before: float, after: float):
+        """battery_low when a battery drops below battery_low percent."""
+        if after < self.battery_low <= before:
+            self.emit(BATTERY_LOW, time, source, battery=float(after))
+
+    def flush(self):
+        self.sink.flush()
+
+    def close(self):
+        self.sink.close()
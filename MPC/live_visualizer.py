@@ -3,37 +3,53 @@ import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 from matplotlib.animation import FuncAnimation
 from map import Map
+from map_state import WINDOW_CLEAN
 
 
 class LiveVisualizer:
-    """Live visualization that updates as the map object changes."""
+    """
+    Live visualization that updates as the map object changes.
+
+    The artists are made once, one collection per entity type plus the
+    labels, and every frame only moves, recolors and relabels the ones
+    whose entity changed. The animation blits: the axes, the base station
+    and the window names stay in the cached background and only the drone,
+    the cleaners, the window markers and their labels are redrawn.
+    """
+
+    WINDOW_LABEL_LIMIT = 50  # more windows than this are not named, see window_labels
     
-    def __init__(self, map_obj: Map, update_interval_ms=100):
+    def __init__(self, map_obj: Map, update_interval_ms=100, window_labels=None):
         """
         Initialize the live visualizer.
         
         Args:
             map_obj: The Map object to visualize
             update_interval_ms: Update interval in milliseconds
+            window_labels: Name every window, by default only up to WINDOW_LABEL_LIMIT windows
         """
         self.map = map_obj
         self.update_interval = update_interval_ms
+        self.window_labels = window_labels
         
         # Create figure and 3D axis
         self.fig = plt.figure(figsize=(12, 8))
         self.ax = self.fig.add_subplot(111, projection='3d')
         
-        # Store scatter plot references for updating
+        # Artists, made by _create_artists() and updated in place by _update_plot()
         self.base_station_scatter = None
         self.drone_scatter = None
         self.cleaners_scatter = None
         self.windows_scatter = None
-        
-        # Store text annotations
-        self.texts = []
+        self.drone_text = None
+        self.cleaner_texts = []
+        self.window_texts = []
+        self.time_text = None
+        self._shown = {}  # what the artists show now, to skip updates that change nothing
         
         # Set up the plot
         self._setup_plot()
+        self._create_artists()
         
     def _setup_plot(self):
         """Initialize plot with labels and settings."""
@@ -47,157 +63,114 @@ class LiveVisualizer:
         self.ax.set_xlim(-60, 60)
         self.ax.set_ylim(-60, 60)
         self.ax.set_zlim(0, 120)
-        
-    def _clear_texts(self):
-        """Remove all text annotations from plot."""
-        for text in self.texts:
-            text.remove()
-        self.texts = []
+
+    def _remove_artists(self):
+        for artist in [self.base_station_scatter, self.drone_scatter, self.cleaners_scatter, self.windows_scatter,
+                       self.drone_text, self.time_text] + self.cleaner_texts + self.window_texts:
+            if artist is not None:
+                artist.remove()
+        self.cleaner_texts = []
+        self.window_texts = []
+        self._shown = {}
+
+    def _create_artists(self):
+        """One scatter per entity type and the labels, at the current map state."""
+        self._remove_artists()
+        ax = self.ax
+        arrays = self.map.arrays
+        self._num_cleaners = arrays.num_cleaners
+        self._num_windows = arrays.num_windows
+
+        # Static: base station and window names
+        bx, by, bz = tuple(arrays.base_pos)
+        self.base_station_scatter = ax.scatter([bx], [by], [bz], c='black', marker='s', s=100, label='Base Station', depthshade=False)
+        self.window_texts = [ax.text(bx, by, bz + 2, 'Base', color='black', fontsize=9)]
+        window_labels = self.window_labels
+        if window_labels is None:
+            window_labels = self._num_windows <= self.WINDOW_LABEL_LIMIT
+        if window_labels:
+            for (x, y, z), name in zip(arrays.window_pos, arrays.window_names):
+                self.window_texts.append(ax.text(x, y, z + 2, f'{name}', color='gray', fontsize=8))
+
+        # Animated: drone, cleaners, window markers and their labels
+        self.drone_scatter = ax.scatter([0.0], [0.0], [0.0], c='red', marker='^', s=80, label='Drone', depthshade=False)
+        self.drone_text = ax.text(0.0, 0.0, 0.0, '', fontsize=9)
+        cleaner_pos = arrays.cleaner_pos
+        self.cleaners_scatter = ax.scatter(cleaner_pos[:, 0], cleaner_pos[:, 1], cleaner_pos[:, 2], c='blue', marker='o', s=60, depthshade=False)
+        self.cleaner_texts = [ax.text(0.0, 0.0, 0.0, '', fontsize=8) for _ in range(self._num_cleaners)]
+        window_pos = arrays.window_pos
+        self.windows_scatter = ax.scatter(window_pos[:, 0], window_pos[:, 1], window_pos[:, 2], c='red', marker='x', s=80, depthshade=False)
+        # The title is outside the blitted axes area, the time goes inside it
+        self.time_text = ax.text2D(0.02, 0.95, '', transform=ax.transAxes)
+        self._update_plot(None)
+
+    def _animated_artists(self) -> list:
+        return [self.drone_scatter, self.drone_text, self.cleaners_scatter, self.windows_scatter, self.time_text] + self.cleaner_texts
+
+    def _changed(self, key, value) -> bool:
+        # Remember value under key, True if it differs from the last one
+        last = self._shown.get(key)
+        if last is not None and np.array_equal(last, value):
+            return False
+        self._shown[key] = value
+        return True
+
+    @staticmethod
+    def _move(text, x, y, z, label, color):
+        text.set_position_3d((x, y, z + 2))
+        text.set_text(label)
+        text.set_color(color)
     
     def _update_plot(self, frame):
-        """Update plot with current map state. Called by FuncAnimation."""
-        # Clear previous scatter plots and texts
-        if self.base_station_scatter:
-            self.base_station_scatter.remove()
-            self.base_station_scatter = None
-
-        if self.drone_scatter:
-            self.drone_scatter.remove()
-            self.drone_scatter = None
-
-        # Remove cleaner/window artists from previous frame
-        if isinstance(self.cleaners_scatter, list):
-            for sc in self.cleaners_scatter:
-                try:
-                    sc.remove()
-                except Exception:
-                    pass
-            self.cleaners_scatter = []
-        else:
-            # Initialize for first use if it was None in __init__
-            self.cleaners_scatter = []
-
-        if isinstance(self.windows_scatter, list):
-            for sc in self.windows_scatter:
-                try:
-                    sc.remove()
-                except Exception:
-                    pass
-            self.windows_scatter = []
-        else:
-            # Initialize for first use if it was None in __init__
-            self.windows_scatter = []
-
-        self._clear_texts()
-        
-        # Base station
-        try:
-            bx, by, bz = tuple(self.map.base_station.pos3d)
-            self.base_station_scatter = self.ax.scatter(bx, by, bz, c='black', marker='s', s=100, label='Base Station', depthshade=False)
-            text = self.ax.text(bx, by, bz + 2, 'Base', color='black', fontsize=9)
-            self.texts.append(text)
-        except Exception as e:
-            print(f"Error plotting base station: {e}")
-        
+        """Update the artists to the current map state. Called by FuncAnimation."""
+        arrays = self.map.arrays
+        if arrays.num_cleaners != self._num_cleaners or arrays.num_windows != self._num_windows:
+            self._create_artists()  # another map layout, calls back here
+            return self._animated_artists()
+
         # Drone
-        try:
-            dx, dy, dz = tuple(self.map.drone.pos3d)
-            drone_color = 'red' if not self.map.drone.ucupied else 'orange'
-            self.drone_scatter = self.ax.scatter(dx, dy, dz, c=drone_color, marker='^', s=80, label='Drone', depthshade=False)
-            status = "Idle" if not self.map.drone.ucupied else "Occupied"
-            text = self.ax.text(dx, dy, dz + 2, f'Drone ({status})', color=drone_color, fontsize=9)
-            self.texts.append(text)
-            
-            
-        except Exception as e:
-            print(f"Error plotting drone: {e}")
-        
-        # Cleaners
+        dx, dy, dz = tuple(arrays.drone_pos[0])
+        ucupied = bool(arrays.drone_ucupied[0])
+        if self._changed('drone', (dx, dy, dz, ucupied)):
+            drone_color = 'red' if not ucupied else 'orange'
+            status = "Idle" if not ucupied else "Occupied"
+            self.drone_scatter._offsets3d = ([dx], [dy], [dz])
+            self.drone_scatter.set_color(drone_color)
+            self._move(self.drone_text, dx, dy, dz, f'Drone ({status})', drone_color)
 
-        cx_list = []
-        cy_list = []
-        cz_list = []
-        cleaner_names = []
-        cleaner_colors = []
-        
-        for cleaner in self.map.cleaners:
-            pos = cleaner.pos3d
-            if pos is None:
-                continue
-            
-            x, y, z = tuple(pos)
-            cx_list.append(x)
-            cy_list.append(y)
-            cz_list.append(z)
-            
-            # Color based on state
-            if getattr(cleaner, 'is_charging', False):
-                color = 'purple'
-            elif getattr(cleaner, 'is_cleaning', False):
-                color = 'cyan'
-            else:
-                color = 'blue'
-            cleaner_colors.append(color)
-            
-            name = getattr(cleaner, 'name', 'C')
-            cleaner_names.append(name)
-            battery = getattr(cleaner, 'battery_level', 100)
-            text = self.ax.text(x, y, z + 2, f'{name}({battery:.0f}%)', color=color, fontsize=8)
-            self.texts.append(text)
-        
-        if cx_list:
-            # Plot each cleaner with its color and store handles for removal
-            for cx, cy, cz, color in zip(cx_list, cy_list, cz_list, cleaner_colors):
-                sc = self.ax.scatter(cx, cy, cz, c=color, marker='o', s=60, depthshade=False)
-                self.cleaners_scatter.append(sc)
+        # Cleaners, colored by state
+        cleaner_pos = arrays.cleaner_pos.copy()
+        if self._changed('cleaner_pos', cleaner_pos):
+            self.cleaners_scatter._offsets3d = (cleaner_pos[:, 0], cleaner_pos[:, 1], cleaner_pos[:, 2])
+        state = np.where(arrays.cleaner_is_charging, 2, np.where(arrays.cleaner_is_cleaning, 1, 0))
+        colors = np.array(['blue', 'cyan', 'purple'])[state]
+        if self._changed('cleaner_state', state):
+            self.cleaners_scatter.set_color(colors)
+        battery = np.round(arrays.battery_levels())
+        for i, text in enumerate(self.cleaner_texts):
+            # A flat tuple of plain numbers, np.array_equal is always False for a ragged one
+            x, y, z = (float(v) for v in cleaner_pos[i])
+            if self._changed(('cleaner', i), (x, y, z, float(battery[i]), int(state[i]))):
+                self._move(text, x, y, z, f'{arrays.cleaner_names[i]}({battery[i]:.0f}%)', colors[i])
 
+        # Windows, colored by state
+        clean = arrays.window_state == WINDOW_CLEAN
+        if self._changed('windows', clean):
+            self.windows_scatter.set_color(np.where(clean, 'green', 'red'))
         
-        # Windows
-        try:
-            wx_list = []
-            wy_list = []
-            wz_list = []
-            window_colors = []
-            
-            for window in self.map.windows:
-                pos = getattr(window, 'pos3d', None)
-                if pos is None:
-                    continue
-                
-                x, y, z = tuple(pos)
-                wx_list.append(x)
-                wy_list.append(y)
-                wz_list.append(z)
-                
-                # Color by state
-                state = getattr(window, 'state', 'dirty')
-                color = 'green' if state == 'clean' else 'red'
-                window_colors.append(color)
-                
-                name = getattr(window, 'name', 'W')
-                text = self.ax.text(x, y, z + 2, f'{name}({state[0].upper()})', color=color, fontsize=8)
-                self.texts.append(text)
-            
-            if wx_list:
-                # Plot each window with its color and store handles for removal
-                for wx, wy, wz, color in zip(wx_list, wy_list, wz_list, window_colors):
-                    sc = self.ax.scatter(wx, wy, wz, c=color, marker='x', s=80, depthshade=False)
-                    self.windows_scatter.append(sc)
-        except Exception as e:
-            print(f"Error plotting windows: {e}")
-        
-        # Update title with current simulation time
+        # Current simulation time
         time_str = f"Time: {self.map.time:.1f}s" if hasattr(self.map, 'time') else "Time: N/A"
-        self.ax.set_title(f'Live Map Visualization - {time_str}')
+        self.time_text.set_text(f'{time_str}  clean {int(np.count_nonzero(clean))}/{len(clean)}')
         
-        return [self.base_station_scatter, self.drone_scatter] + self.texts if self.base_station_scatter else self.texts
+        return self._animated_artists()
     
     def show(self):
         """Display the live visualization."""
-        anim = FuncAnimation(self.fig, self._update_plot, interval=self.update_interval, blit=False, cache_frame_data=False)
+        self.anim = FuncAnimation(self.fig, self._update_plot, init_func=self._animated_artists,
+                                  interval=self.update_interval, blit=True, cache_frame_data=False)
         plt.tight_layout()
         plt.show()
-        return anim
+        return self.anim
 
 
 def create_live_visualization(map_obj: Map, update_interval_ms=100):
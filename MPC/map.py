@@ -1,3 +1,5 @@
+import copy
+import heapq
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
@@ -5,17 +7,146 @@ from drone import Transport_drone
 from cleaner import Robot_cleaner
 from basestation import Base_station
 from window import Window
+from map_state import MapState, EntityViews, UndoJournal, NO_INDEX, WINDOW_DIRTY
 from matplotlib.animation import FuncAnimation
 class Map:
+    # Lists restored by rollback(), see UndoJournal
+    PROCESS_LISTS = ('cleaning_processes', 'process_heap', 'started_processes')
+
     def __init__(self, base_station: Base_station, drone: Transport_drone, cleaners: list[Robot_cleaner], windows: list[Window]):
         self.base_station = base_station
+        # All drone/cleaner/window values live in these arrays, the objects are views over them
+        self.arrays = MapState.from_entities(base_station, [drone], cleaners, windows)
+        base_station._bind(self.arrays)
+        drone._bind(self.arrays, 0, self)
+        for i, cleaner in enumerate(cleaners):
+            cleaner._bind(self.arrays, i, self)
+        for i, window in enumerate(windows):
+            window._bind(self.arrays, i, self)
         self.drone = drone
-        self.cleaners = cleaners
-        self.windows = windows
+        self.cleaners = EntityViews(self._cleaner_view, len(cleaners), cleaners)
+        self.windows = EntityViews(self._window_view, len(windows), windows)
         self.time = 0.0  # simulation time
         self.cleaning_processes : list = [None for _ in self.cleaners]  # track cleaning processes
+        self.process_heap = []  # (end_time, cleaner index, id(process)) of the running processes
+        self.started_processes = []  # cleaner indices started since the last update_cleaning_processes()
         self.cleaner_suction_consumption=0.2 # battery consumption rate when cleaner is cleaning (units per time)
-        self.states = (
+
+    @classmethod
+    def from_window_arrays(cls, base_station: Base_station, drone: Transport_drone, cleaners: list[Robot_cleaner],
+                           window_pos, window_width, window_height, window_cleaning_time, window_names=None) -> 'Map':
+        """
+        Map with its windows given as arrays instead of Window objects, see
+        MapState.load_windows(). The Window views are only created when
+        map.windows is indexed.
+        """
+        new_map = cls(base_station, drone, cleaners, [])
+        new_map.arrays.load_windows(window_pos, window_width, window_height, window_cleaning_time, names=window_names)
+        new_map.windows = EntityViews(new_map._window_view, len(window_pos))
+        return new_map
+
+    @property
+    def topology(self):
+        """Cached flight distances between the base station and the windows (topology.py)."""
+        return self.arrays.topology
+
+    def nearest_dirty_windows(self, point, k: int = 1, mask=None):
+        """(window indices, distances) of the k dirty windows closest to point, see WindowGrid.nearest()."""
+        grid = self.topology.window_grid
+        grid.sync(self.arrays.window_state == WINDOW_DIRTY)
+        return grid.nearest(point, k, mask)
+
+    def dirty_windows_within(self, point, radius: float, mask=None):
+        """(window indices, distances) of the dirty windows within radius of point, see WindowGrid.within()."""
+        grid = self.topology.window_grid
+        grid.sync(self.arrays.window_state == WINDOW_DIRTY)
+        return grid.within(point, radius, mask)
+
+    @property
+    def cleaner_suction_consumption(self):
+        return float(self.arrays.cleaner_suction[0])
+
+    @cleaner_suction_consumption.setter
+    def cleaner_suction_consumption(self, value):
+        self.arrays.write(self.arrays.cleaner_suction, 0, value)
+
+    def _cleaner_view(self, index):
+        return Robot_cleaner.view(self.arrays, index, self)
+
+    def _window_view(self, index):
+        return Window.view(self.arrays, index, self)
+
+    def copy(self) -> 'Map':
+        """
+        Copy of the map that can be changed without touching this one.
+
+        Only the mutable arrays and the running cleaning processes are copied,
+        the entity views of the copy are created when they are first used.
+        """
+        new_map = Map.__new__(Map)
+        new_map.__dict__.update(self.__dict__)
+        new_map.arrays = self.arrays.copy()
+        new_map.drone = copy.copy(self.drone)
+        new_map.drone._bind(new_map.arrays, 0, new_map)
+        new_map.cleaners = EntityViews(new_map._cleaner_view, len(self.cleaners))
+        new_map.windows = EntityViews(new_map._window_view, len(self.windows))
+        new_map.cleaning_processes = [copy.copy(process) if process is not None else None for process in self.cleaning_processes]
+        new_map.process_heap = []
+        new_map._rebuild_process_heap()
+        new_map.started_processes = list(self.started_processes)
+        return new_map
+
+    def assign(self, other: 'Map', fields=MapState.MUTABLE_FIELDS):
+        """
+        Overwrite the state of this map with the state of other (same
+        layout). Goes through the journal, so it can be rolled back, and
+        other is left untouched. Only the given MapState fields are written,
+        the others must already be equal.
+        """
+        self.arrays.assign(other.arrays, fields)
+        self.time = other.time
+        self.cleaning_processes[:] = [copy.copy(process) if process is not None else None for process in other.cleaning_processes]
+        self._rebuild_process_heap()
+        self.started_processes[:] = other.started_processes
+
+    def _rebuild_process_heap(self):
+        self.process_heap[:] = [
+            (process.end_time, i, id(process)) for i, process in enumerate(self.cleaning_processes) if process is not None
+        ]
+        heapq.heapify(self.process_heap)
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def begin_transaction(self):
+        """
+        Start recording changes made to this map in place.
+
+        Used by lookahead to try an action with run(..., in_place=True) and
+        then undo it with rollback(), instead of copying the map. Transactions
+        can be nested.
+        """
+        if self.arrays.journal is None:
+            self.arrays.journal = UndoJournal()
+        self.arrays.journal.savepoint(self)
+
+    def rollback(self):
+        """Undo every change made since the matching begin_transaction()."""
+        journal = self.arrays.journal
+        journal.rollback(self)
+        if not journal.savepoints:
+            self.arrays.journal = None
+
+    def commit(self):
+        """Keep the changes made since the matching begin_transaction()."""
+        journal = self.arrays.journal
+        journal.commit()
+        if not journal.savepoints:
+            self.arrays.journal = None
+
+    @property
+    def states(self):
+        return (
             [self.time] +
             self.drone.states + 
             self.base_station.states + 
@@ -24,36 +155,52 @@ class Map:
         )
 
     def update_states(self):
-        # Update individual cleaner states first
-        for cleaner in self.cleaners:
-            if hasattr(cleaner, 'update_states'):
-                cleaner.update_states()
-        self.drone.update_states()
+        # states is read straight from the arrays, nothing to refresh
+        pass
 
-        self.states = (
-            [self.time] +
-            self.drone.states + 
-            self.base_station.states + 
-            [state for cleaner in self.cleaners for state in cleaner.states] +
-            [state for window in self.windows for state in window.states]
-        )
+    def start_process(self, cleaner_index: int, process):
+        """Start a cleaner action as the running process of a cleaner."""
+        self.cleaning_processes[cleaner_index] = process
+        process.when_started(self)
+        heapq.heappush(self.process_heap, (process.end_time, cleaner_index, id(process)))
+        self.started_processes.append(cleaner_index)
 
     def update_cleaning_processes(self):
-        for i, process in enumerate(self.cleaning_processes):
-            if process is not None:
-                if process.end_time <= self.time:
-                    process.when_done(self)
-                    self.cleaning_processes[i] = None
-                else:
-                    process.when_runed_time(self, self.time)
-        for i, cleaner in enumerate(self.cleaners):
-            if cleaner.on_window is not None:
-                cleaner.battery_level -= self.cleaner_suction_consumption * (self.time - cleaner.last_update_time)
-                if cleaner.battery_level < 0.0:
-                    cleaner.battery_level = 0.0
-                cleaner.last_update_time = self.time    
-
-    
+        """
+        Bring the cleaners up to self.time.
+
+        The batteries are only evaluated when read (see MapState), so this
+        only touches the processes that started since the last update, the
+        ones that finish, taken from process_heap, and cleaners that were put
+        on a window.
+        """
+        arrays = self.arrays
+        for i in self.started_processes:
+            process = self.cleaning_processes[i]
+            if process is None:
+                continue
+            # The first update of a process counts from its larsted_update_time
+            arrays.set_cleaner_battery(i, arrays.cleaner_battery_level(i), process.larsted_update_time, process.battery_rate(self))
+            process.larsted_update_time = self.time
+        self.started_processes = []
+        heap = self.process_heap
+        while heap and heap[0][0] <= self.time:
+            end_time, i, process_id = heapq.heappop(heap)
+            process = self.cleaning_processes[i]
+            if process is None or id(process) != process_id:
+                continue
+            level = arrays.process_level(i, end_time)
+            arrays.write(arrays.cleaner_battery, i, level)
+            arrays.write(arrays.cleaner_battery_t0, i, end_time)
+            arrays.write(arrays.cleaner_battery_rate, i, 0.0)
+            process.larsted_update_time = end_time
+            process.when_done(self)
+            self.cleaning_processes[i] = None
+        # Cleaners put on a window start draining from their last_update_time
+        for i in np.flatnonzero((arrays.cleaner_on_window != NO_INDEX) & ~arrays.cleaner_suction_on):
+            arrays.write(arrays.cleaner_suction_on, i, True)
+        arrays.write(arrays.battery_time, 0, self.time)
+
     def visualize(self):
         # 3D scatter of all map objects: base station, drone, cleaners, windows
         fig = plt.figure(figsize=(8, 6))
@@ -149,5 +296,56 @@ def random_map_generater(num_cleaners, num_windows):
     return Map(base_station=base_station, drone=drone, cleaners=cleaners, windows=windows)
 
 
+def building_map_generater(num_cleaners, num_windows, faces=4, floors=None, floor_height=3.5, ground_floor_height=4.5,
+                           window_spacing=2.5, window_size=(1.5, 1.8), cleaning_time_per_m2=2.5, base_distance=20.0, rng=None):
+    """
+    Map of a rectangular building with num_windows grid-aligned windows on
+    `faces` of its four faces, filled floor by floor from the ground up.
+
+    Windows sit window_spacing apart along a face and floor_height apart
+    from ground_floor_height up. Without floors the faces are made roughly
+    square. Sizes vary by 10% around window_size and the cleaning time is
+    cleaning_time_per_m2 per square metre of glass with 20% spread. The
+    base station is at the origin, base_distance in front of face 0.
+
+    Everything is drawn as arrays (from np.random unless rng is given, so
+    np.random.seed() applies as for random_map_generater) and the windows
+    go straight into the MapState, see Map.from_window_arrays().
+    """
+    if not 1 <= faces <= 4:
+        raise ValueError(f"faces must be between 1 and 4, got {faces}")
+    if num_windows < 0:
+        raise ValueError(f"num_windows must not be negative, got {num_windows}")
+    if rng is None:
+        rng = np.random
+    per_face = -(-num_windows // faces)
+    if floors is None:
+        floors = max(1, int(round(np.sqrt(per_face * window_spacing / floor_height))))
+    columns = max(1, -(-per_face // floors))
+    half_width = columns * window_spacing / 2.0
+    center = np.array([0.0, half_width + base_distance])
+
+    # Slot k of the building is floor k // (faces * columns), then face, then column
+    slots = np.arange(num_windows)
+    floor = slots // (faces * columns)
+    face = (slots // columns) % faces
+    along = (slots % columns + 0.5) * window_spacing - half_width
+    # Faces go round the building: front (-y), right (+x), back (+y), left (-x)
+    directions = np.array([[1.0, 0.0], [0.0, 1.0], [-1.0, 0.0], [0.0, -1.0]])
+    normals = np.array([[0.0, -1.0], [1.0, 0.0], [0.0, 1.0], [-1.0, 0.0]])
+    xy = center + normals[face] * half_width + directions[face] * along[:, None]
+    z = ground_floor_height + floor * floor_height
+    window_pos = np.column_stack([xy, z])
+
+    width = window_size[0] * rng.uniform(0.9, 1.1, num_windows)
+    height = window_size[1] * rng.uniform(0.9, 1.1, num_windows)
+    cleaning_time = cleaning_time_per_m2 * width * height * rng.uniform(0.8, 1.2, num_windows)
+
+    base_station = Base_station(pos3d=(0, 0, 0))
+    drone = Transport_drone(init_state=[0, 0, 0, 0, 0, 0])
+    cleaners = [Robot_cleaner(name=f"{i+1}", battery_capacity=200, pos3d=(0, 0, 0)) for i in range(num_cleaners)]
+    return Map.from_window_arrays(base_station, drone, cleaners, window_pos, width, height, cleaning_time)
+
+
 if __name__ == "__main__":
     test_map = random_map_generater(num_cleaners=5, num_windows=10)
@@ -2,7 +2,6 @@
 
 
 import numpy as np
-import copy
 from map import Map
 from window import Window
 from basestation import Base_station
@@ -20,16 +19,18 @@ class MapAction:
         """Check if this action is allowed given the current map state."""
         raise NotImplementedError("Subclasses must implement is_allowed()")
     
-    def run(self, map_state: Map) -> Map:
+    def run(self, map_state: Map, in_place: bool = False) -> Map:
         """
         Execute the action to completion and return a copy of the map with updated state.
         
         Args:
             map_state: Current map state
+            in_place: Change map_state itself instead of a copy, used together
+                with Map.begin_transaction()/rollback() for lookahead
             
         Returns:
-            A deep copy of the map with updated drone states, cleaner states, 
-            window states, and time
+            A copy of the map (Map.copy) with updated drone states, cleaner states, 
+            window states, and time, or map_state itself when in_place is set
         """
         raise NotImplementedError("Subclasses must implement run()")
     
@@ -60,18 +61,16 @@ class FlyToWindow(MapAction):
         
         return True
     
-    def run(self, map_state: Map) -> Map:
+    def run(self, map_state: Map, in_place: bool = False) -> Map:
         """Execute full flight to window."""
-        # Create deep copy of the map
-        new_map = copy.deepcopy(map_state)
+        # Create a copy of the map
+        new_map = map_state if in_place else map_state.copy()
         
         window = new_map.windows[self.window_index]
         drone = new_map.drone
         
         # Calculate duration and energy cost
-        distance = np.linalg.norm(drone.pos3d - window.pos3d)
-        duration = distance / self.speed
-        energy_cost = duration * self.power_consumption
+        distance, duration, energy_cost = new_map.topology.flight(drone.pos3d, window.pos3d, self.speed, self.power_consumption)
         
         # Update drone position
         drone.pos3d = window.pos3d.copy()
@@ -131,9 +130,9 @@ class PickupCleaner(MapAction):
         
         return True
     
-    def run(self, map_state: Map) -> Map:
+    def run(self, map_state: Map, in_place: bool = False) -> Map:
         """Execute pickup action."""
-        new_map = copy.deepcopy(map_state)
+        new_map = map_state if in_place else map_state.copy()
         
         cleaner = new_map.cleaners[self.cleaner_index]
         drone = new_map.drone
@@ -193,9 +192,9 @@ class DropoffCleaner(MapAction):
         
         return True
     
-    def run(self, map_state: Map) -> Map:
+    def run(self, map_state: Map, in_place: bool = False) -> Map:
         """Execute dropoff action."""
-        new_map = copy.deepcopy(map_state)
+        new_map = map_state if in_place else map_state.copy()
         window = new_map.windows[self.window_index]
         #print("window pos:", window.pos3d)
         drone = new_map.drone
@@ -259,9 +258,9 @@ class PickupCleanerAtBase(MapAction):
 
         return True
     
-    def run(self, map_state: Map) -> Map:
+    def run(self, map_state: Map, in_place: bool = False) -> Map:
         """Execute pickup at base action."""
-        new_map = copy.deepcopy(map_state)
+        new_map = map_state if in_place else map_state.copy()
         
         cleaner = new_map.cleaners[self.cleaner_index]
         drone = new_map.drone
@@ -313,9 +312,9 @@ class DropoffCleanerAtBase(MapAction):
         
         return True
     
-    def run(self, map_state: Map) -> Map:
+    def run(self, map_state: Map, in_place: bool = False) -> Map:
         """Execute dropoff at base action."""
-        new_map = copy.deepcopy(map_state)
+        new_map = map_state if in_place else map_state.copy()
         
         drone = new_map.drone
         base = new_map.base_station
@@ -364,17 +363,15 @@ class ReturnToBase(MapAction):
         
         return True
     
-    def run(self, map_state: Map) -> Map:
+    def run(self, map_state: Map, in_place: bool = False) -> Map:
         """Execute return to base action."""
-        new_map = copy.deepcopy(map_state)
+        new_map = map_state if in_place else map_state.copy()
         
         drone = new_map.drone
         base = new_map.base_station
         
         # Calculate duration and energy cost
-        distance = np.linalg.norm(drone.pos3d - base.pos3d)
-        duration = distance / self.speed
-        energy_cost = duration * self.power_consumption
+        distance, duration, energy_cost = new_map.topology.flight(drone.pos3d, base.pos3d, self.speed, self.power_consumption)
         
         # Update drone position
         drone.pos3d = base.pos3d.copy()
@@ -426,9 +423,9 @@ class ChargeDrone(MapAction):
         
         return True
     
-    def run(self, map_state: Map) -> Map:
+    def run(self, map_state: Map, in_place: bool = False) -> Map:
         """Execute charging action."""
-        new_map = copy.deepcopy(map_state)
+        new_map = map_state if in_place else map_state.copy()
         
         drone = new_map.drone
         
@@ -460,9 +457,9 @@ class NullAction(MapAction):
         """Always allowed."""
         return True
     
-    def run(self, map_state: Map) -> Map:
+    def run(self, map_state: Map, in_place: bool = False) -> Map:
         """Return map unchanged."""
-        return copy.deepcopy(map_state)
+        return map_state if in_place else map_state.copy()
 
 
 
@@ -495,17 +492,15 @@ class DropCleanerOffAtWindow(MapAction):
             return False
         return True
 
-    def run(self, map_state: Map) -> Map:
-        # Deep copy map
-        new_map = copy.deepcopy(map_state)
+    def run(self, map_state: Map, in_place: bool = False) -> Map:
+        # Copy map
+        new_map = map_state if in_place else map_state.copy()
         window = new_map.windows[self.window_index]
         drone = new_map.drone
 
         # 1. Fly to window if not already there
         if not np.array_equal(drone.pos3d, window.pos3d):
-            distance = np.linalg.norm(drone.pos3d - window.pos3d)
-            duration = distance / self.speed
-            energy_cost = duration * self.fly_power
+            distance, duration, energy_cost = new_map.topology.flight(drone.pos3d, window.pos3d, self.speed, self.fly_power)
             drone.pos3d = window.pos3d.copy()
             drone.is_moving = False
             # Move load with drone
@@ -566,16 +561,14 @@ class PickupCleanerByFlying(MapAction):
                 
         return True
 
-    def run(self, map_state: Map) -> Map:
-        new_map = copy.deepcopy(map_state)
+    def run(self, map_state: Map, in_place: bool = False) -> Map:
+        new_map = map_state if in_place else map_state.copy()
         cleaner = new_map.cleaners[self.cleaner_index]
         drone = new_map.drone
 
         # 1. Fly to cleaner if not already there
         if not np.array_equal(drone.pos3d, cleaner.pos3d):
-            distance = np.linalg.norm(drone.pos3d - cleaner.pos3d)
-            duration = distance / self.speed
-            energy_cost = duration * self.fly_power
+            distance, duration, energy_cost = new_map.topology.flight(drone.pos3d, cleaner.pos3d, self.speed, self.fly_power)
             drone.pos3d = cleaner.pos3d.copy()
             drone.is_moving = False
             # Battery
@@ -622,16 +615,14 @@ class FlyToBaseAndCharge(MapAction):
             return False
         return True
 
-    def run(self, map_state: Map) -> Map:
-        new_map = copy.deepcopy(map_state)
+    def run(self, map_state: Map, in_place: bool = False) -> Map:
+        new_map = map_state if in_place else map_state.copy()
         drone = new_map.drone
         base = new_map.base_station
 
         # 1. Fly to base if not already there
         if not np.array_equal(drone.pos3d, base.pos3d):
-            distance = np.linalg.norm(drone.pos3d - base.pos3d)
-            duration = distance / self.speed
-            energy_cost = duration * self.fly_power
+            distance, duration, energy_cost = new_map.topology.flight(drone.pos3d, base.pos3d, self.speed, self.fly_power)
             drone.pos3d = base.pos3d.copy()
             drone.is_moving = False
             # Move load with drone if carrying
@@ -688,16 +679,14 @@ class DropOffCleanerAtBaseByFlying(MapAction):
             return False
         return True
 
-    def run(self, map_state: Map) -> Map:
-        new_map = copy.deepcopy(map_state)
+    def run(self, map_state: Map, in_place: bool = False) -> Map:
+        new_map = map_state if in_place else map_state.copy()
         drone = new_map.drone
         base = new_map.base_station
 
         # 1. Fly to base if not already there
         if not np.array_equal(drone.pos3d, base.pos3d):
-            distance = np.linalg.norm(drone.pos3d - base.pos3d)
-            duration = distance / self.speed
-            energy_cost = duration * self.fly_power
+            distance, duration, energy_cost = new_map.topology.flight(drone.pos3d, base.pos3d, self.speed, self.fly_power)
             drone.pos3d = base.pos3d.copy()
             drone.is_moving = False
             # Move load with drone
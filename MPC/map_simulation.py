@@ -1,3 +1,5 @@
+import contextlib
+import copy
 import time
 import random
 import numpy as np
@@ -17,48 +19,81 @@ from map_actions import (
     PickupCleanerByFlying,
     FlyToBaseAndCharge,
 )
+from action_table import ActionTable
+from state_encoder import StateEncoder, DQNLayout
+from map_state import NO_INDEX, WINDOW_CLEAN, WINDOW_DIRTY
 from clener_actioons import (
     CleanWindowAction,
     ChargeCleanerAction,
     CleanerNullAction,
 )
+from events import (
+    EventStream,
+    PrintSink,
+    QUIET,
+    EVENTS,
+    DEBUG,
+    ACTION_STARTED,
+    ACTION_DONE,
+    WINDOW_CLEANED,
+    ALLOWED_ACTIONS,
+    BATTERY_LEVELS,
+    RUN_ENDED,
+)
 
 
 class MapSimulation:
-    def get_dqn_state(self, map_state: Map = None):
+    def get_dqn_state(self, map_state: Map = None, out: np.ndarray = None):
         """
         Returns a flat numpy array state for DQN:
         [drone_x, drone_y, drone_z, drone_battery, drone_has_load (1/0),
          cleaner1_x, cleaner1_y, cleaner1_z, cleaner1_battery, cleaner1_is_cleaning (1/0), ...
          window1_x, window1_y, window1_z, window1_is_clean (1/0), ...]
+        written into out if given (a float32 array or a row of a batch), see DQNLayout.
         """
         if map_state is None:
             map_state = self.map
-        drone = map_state.drone
-        drone_pos = drone.pos3d.tolist() if hasattr(drone, 'pos3d') else [0,0,0]
-        drone_battery = getattr(drone, 'battery_level', 0.0)
-        drone_has_load = 1 if getattr(drone, 'load', None) is not None else 0
-
-        state = []
-        state.extend(drone_pos)
-        state.append(drone_battery)
-        state.append(drone_has_load)
-
-        for cleaner in map_state.cleaners:
-            cpos = cleaner.pos3d.tolist() if hasattr(cleaner, 'pos3d') else [0,0,0]
-            cbatt = getattr(cleaner, 'battery_level', 0.0)
-            cclean = 1 if getattr(cleaner, 'is_cleaning', False) else 0
-            state.extend(cpos)
-            state.append(cbatt)
-            state.append(cclean)
-
-        for window in map_state.windows:
-            wpos = window.pos3d.tolist() if hasattr(window, 'pos3d') else [0,0,0]
-            wclean = 1 if getattr(window, 'state', None) == 'clean' else 0
-            state.extend(wpos)
-            state.append(wclean)
-
-        return np.array(state, dtype=np.float32)
+        layout = self.dqn_layout(map_state)
+        if out is None:
+            out = np.empty(layout.size, dtype=np.float32)
+        return layout.write(map_state, out)
+
+    def get_dqn_states(self, maps: list[Map], out: np.ndarray = None) -> np.ndarray:
+        """get_dqn_state of maps with the same layout as the rows of a (B, D) float32 array."""
+        layout = self.dqn_layout(maps[0])
+        if out is None:
+            out = np.empty((len(maps), layout.size), dtype=np.float32)
+        for row, map_state in zip(out, maps):
+            layout.write(map_state, row)
+        return out
+
+    def dqn_layout(self, map_state: Map = None) -> DQNLayout:
+        """The DQNLayout for this map layout, built once per number of cleaners and windows."""
+        if map_state is None:
+            map_state = self.map
+        key = (len(map_state.cleaners), len(map_state.windows))
+        layout = self._dqn_layouts.get(key)
+        if layout is None:
+            layout = DQNLayout(*key)
+            self._dqn_layouts[key] = layout
+        return layout
+
+    def state_encoder(self, map_state: Map = None) -> StateEncoder:
+        """The StateEncoder for this map layout, built once per number of cleaners and windows."""
+        if map_state is None:
+            map_state = self.map
+        key = (len(map_state.cleaners), len(map_state.windows))
+        encoder = self._state_encoders.get(key)
+        if encoder is None:
+            encoder = StateEncoder(*key)
+            self._state_encoders[key] = encoder
+        return encoder
+
+    def get_state(self, map_state: Map = None) -> int:
+        """Compact integer state for the tabular agent, see StateEncoder."""
+        if map_state is None:
+            map_state = self.map
+        return self.state_encoder(map_state).encode(map_state)
 
     def compute_reward(self, prev_state, new_state):
         """Reward: +1000 for each new window cleaned, -1000 if any cleaner battery is 0, -1 per step."""
@@ -77,22 +112,21 @@ class MapSimulation:
         """Take an action by index, return new state, reward, done."""
         if map_state is None:
             map_state = self.map
-        # Build and filter allowed actions
-        drone_candidates = self._build_drone_actions(map_state)
-        allowed_drone = self._allowed(drone_candidates, map_state)
-        allowed_drone = self.advance_allowed(allowed_drone, map_state)
-        # Clamp action_idx
-        if not allowed_drone:
-            chosen_action = NullAction()
-        else:
-            action_idx = max(0, min(action_idx, len(allowed_drone) - 1))
-            chosen_action = allowed_drone[action_idx]
-        prev_state = self.get_state(map_state)
+        # action_idx is an id in the action table, actions that are not allowed
+        # (or fail the battery lookahead) become the NullAction at id 0
+        table = self.action_table(map_state)
+        action_idx = max(0, min(action_idx, len(table) - 1))
+        chosen_action = table[action_idx]
+        if not self.allowed_mask(map_state)[action_idx] or not self.advance_allowedv2([chosen_action], map_state):
+            chosen_action = table[0]
+        encoder = self.state_encoder(map_state)
+        prev_state = encoder.encode(map_state)
         new_map = self.apply_action(chosen_action, map_state)
-        new_state = self.get_state(new_map)
-        reward = self.compute_reward(prev_state, new_state)
+        new_state = encoder.encode(new_map)
+        new_fields = encoder.fields(new_state)
+        reward = self.compute_reward(encoder.fields(prev_state), new_fields)
         # Done if all windows clean or any cleaner battery is 0
-        done = all(w == 1 for w in new_state[2]) or any(b == 0.0 for b in new_state[1])
+        done = all(w == 1 for w in new_fields[2]) or any(b == 0.0 for b in new_fields[1])
         return new_state, reward, done, new_map
     """Simulation that applies full-length map actions to completion."""
 
@@ -100,6 +134,11 @@ class MapSimulation:
         self.map = map_state
         self.real_time = real_time
         self.sleep_time = sleep_time
+        self.transition_cache = None  # optional TransitionCache (transition_cache.py) for apply_action
+        self.controller = None  # optional planner with plan(map) -> drone action, e.g. MPCController, used by step()
+        self.profiler = None  # optional ActionProfiler (profiler.py) timing apply_action
+        self.events = EventStream(verbosity=QUIET)  # see events.py, step() and run() report through it
+        self.recorder = None  # optional TrajectoryRecorder (trajectory.py), step() records every map it reaches
 
         # Tunable parameters
         self.drone_speed = 5.0
@@ -111,6 +150,10 @@ class MapSimulation:
 
         self.cleaning_power_consumption = 0.2  # joules per second #when its cleaning
 
+        self._action_tables = {}  # layout -> ActionTable, see action_table()
+        self._state_encoders = {}  # (cleaners, windows) -> StateEncoder, see state_encoder()
+        self._dqn_layouts = {}  # (cleaners, windows) -> DQNLayout, see dqn_layout()
+
             #paremeteres for simulation<
         """
         self.pickup_dropoff_duration = 2.0  # seconds
@@ -178,11 +221,87 @@ class MapSimulation:
             ])
         return cleaner_actions
 
+    def action_table(self, map_state: Map = None) -> ActionTable:
+        """
+        The drone and cleaner actions for this map layout, built once and
+        reused for the whole run. The table only depends on the number of
+        windows and cleaners and on the simulation parameters.
+        """
+        if map_state is None:
+            map_state = self.map
+        key = (
+            len(map_state.windows), len(map_state.cleaners),
+            self.drone_speed, self.flying_power_consumption, self.pickup_drop_power, self.pickup_drop_duration,
+            self.charging_rate_drone, self.charging_rate_cleaner, self.cleaning_power_consumption,
+        )
+        table = self._action_tables.get(key)
+        if table is None:
+            table = ActionTable(self.new_build_drone_actions(map_state), self._build_cleaner_actions(map_state))
+            self._action_tables[key] = table
+        return table
+
+    # ---- Allowed-action masks ----
+    def allowed_mask(self, map_state: Map = None) -> np.ndarray:
+        """
+        Bool mask over new_build_drone_actions(map_state), True where the
+        action's is_allowed() holds. Computed from the map arrays in a few
+        array operations instead of one is_allowed() call per action.
+        """
+        if map_state is None:
+            map_state = self.map
+        arrays = map_state.arrays
+        num_windows = arrays.num_windows
+        carrying = arrays.drone_load[0] != NO_INDEX
+        mask = np.empty(3 + num_windows + arrays.num_cleaners, dtype=bool)
+        mask[0] = True  # NullAction
+        mask[1] = arrays.drone_battery[0] < 99.9  # FlyToBaseAndCharge
+        mask[2] = carrying  # DropOffCleanerAtBaseByFlying
+        # DropCleanerOffAtWindow
+        mask[3:3 + num_windows] = carrying and not arrays.drone_ucupied[0]
+        mask[3:3 + num_windows] &= arrays.window_state != WINDOW_CLEAN
+        # PickupCleanerByFlying
+        mask[3 + num_windows:] = ~arrays.cleaner_is_cleaning & (not carrying)
+        return mask
+
+    def cleaner_allowed_mask(self, map_state: Map = None) -> np.ndarray:
+        """
+        (num_cleaners, 2) bool mask over _build_cleaner_actions(map_state),
+        column 0 is CleanWindowAction and column 1 is ChargeCleanerAction.
+        """
+        if map_state is None:
+            map_state = self.map
+        arrays = map_state.arrays
+        on_window = arrays.cleaner_on_window
+        has_window = on_window != NO_INDEX
+        window_index = np.where(has_window, on_window, 0)
+        idle = ~arrays.cleaner_is_charging & ~arrays.cleaner_is_cleaning
+        battery = arrays.battery_levels()
+        mask = np.empty((arrays.num_cleaners, 2), dtype=bool)
+        if arrays.num_windows > 0:
+            mask[:, 0] = (
+                has_window
+                & np.all(arrays.cleaner_pos == arrays.window_pos[window_index], axis=1)
+                & (battery > 40.0)
+                & idle
+                & (arrays.window_state[window_index] == WINDOW_DIRTY)
+            )
+        else:
+            mask[:, 0] = False
+        mask[:, 1] = (
+            np.all(arrays.cleaner_pos == arrays.base_pos, axis=1)
+            & idle
+            & (battery < 99.9)
+        )
+        return mask
+
     # ---- Selection helpers ----
     def _allowed(self, actions, map_state: Map = None):
         if map_state is None:
             map_state = self.map
         return [a for a in actions if a.is_allowed(map_state)]
+
+    def _masked(self, actions, mask):
+        return [a for a, allowed in zip(actions, mask) if allowed]
     
     def advance_allowed(self,  actions, map_state: Map = None):
         alowed_actions = []
@@ -190,44 +309,64 @@ class MapSimulation:
             if isinstance(alowed_action, ChargeDrone) or isinstance(alowed_action,DropoffCleanerAtBase) or isinstance(alowed_action,ReturnToBase):
                 alowed_actions.append(alowed_action)
             elif not isinstance(alowed_action, ReturnToBase):
-                new_state = self.apply_action(alowed_action, map_state, drone_only=True)
-                drone_candidates = self._build_drone_actions(new_state)
-                #drone_candidates=self._allowed(drone_candidates , new_state)
-                for action in drone_candidates:
-                    if isinstance(action, ReturnToBase):
-                        new_state = self.apply_action(action, new_state, drone_only=True)
-                        if new_state.drone.battery_level > 10.0:
-                            alowed_actions.append(alowed_action)
+                # Try the action on map_state itself and undo it afterwards
+                map_state.begin_transaction()
+                try:
+                    new_state = self.apply_action(alowed_action, map_state, drone_only=True, in_place=True)
+                    drone_candidates = self._build_drone_actions(new_state)
+                    #drone_candidates=self._allowed(drone_candidates , new_state)
+                    for action in drone_candidates:
+                        if isinstance(action, ReturnToBase):
+                            new_state = self.apply_action(action, new_state, drone_only=True, in_place=True)
+                            if new_state.drone.battery_level > 10.0:
+                                alowed_actions.append(alowed_action)
+                finally:
+                    map_state.rollback()
         return alowed_actions
 
 
     def advance_allowedv2(self,  actions, map_state: Map = None):
+        # Lookahead runs on map_state itself inside transactions and is rolled
+        # back afterwards, so no map is copied for the feasibility check
         alowed_actions = []
         for alowed_action in actions:
             #if isinstance(alowed_action, FlyToBaseAndCharge):
              #   alowed_actions.append(alowed_action)
             #else:
-            new_state = self.apply_action(alowed_action, map_state, drone_only=False)
-            #print(f"New state drone battery level: {new_state.drone.battery_level}")
-            drone_candidates = self.new_build_drone_actions(new_state)
-            #drone_candidates=self._allowed(drone_candidates , new_state)
-            allow_action=True
-
-            for action in drone_candidates:
-                if isinstance(action, FlyToBaseAndCharge):
-                    new_state2 = self.apply_action(action, new_state, drone_only=True)
-                    if new_state2.drone.battery_level < 10.0:
-                        allow_action=False
-
-                if isinstance(action, PickupCleanerByFlying):
-                    if action.is_allowed(new_state):
-                        new_state2 = self.apply_action(action, new_state, drone_only=False)
-                        dont=False
-                        for cleaner in new_state2.cleaners:
-                            if cleaner.battery_level < 10.0:
-                                dont=True         
-                        if dont:   
-                            allow_action=False
+            map_state.begin_transaction()
+            try:
+                new_state = self.apply_action(alowed_action, map_state, drone_only=False, in_place=True)
+                #print(f"New state drone battery level: {new_state.drone.battery_level}")
+                drone_candidates = self.action_table(new_state).drone_actions
+                #drone_candidates=self._allowed(drone_candidates , new_state)
+                pickup_allowed = self.allowed_mask(new_state)[3 + len(new_state.windows):]
+                allow_action=True
+
+                for action in drone_candidates:
+                    if isinstance(action, FlyToBaseAndCharge):
+                        new_state.begin_transaction()
+                        try:
+                            new_state2 = self.apply_action(action, new_state, drone_only=True, in_place=True)
+                            if new_state2.drone.battery_level < 10.0:
+                                allow_action=False
+                        finally:
+                            new_state.rollback()
+
+                    if isinstance(action, PickupCleanerByFlying):
+                        if pickup_allowed[action.cleaner_index]:
+                            new_state.begin_transaction()
+                            try:
+                                new_state2 = self.apply_action(action, new_state, drone_only=False, in_place=True)
+                                dont=False
+                                for cleaner in new_state2.cleaners:
+                                    if cleaner.battery_level < 10.0:
+                                        dont=True         
+                            finally:
+                                new_state.rollback()
+                            if dont:   
+                                allow_action=False
+            finally:
+                map_state.rollback()
             if allow_action:
                 alowed_actions.append(alowed_action)
                     
@@ -269,24 +408,40 @@ class MapSimulation:
     def step(self, map_state: Map = None) -> Map:
         if map_state is None:
             map_state = self.map
+        events = self.events
         
-        # Build action candidates fresh based on current map
-        #drone_candidates = self._build_drone_actions(map_state)
-        drone_candidates=self.new_build_drone_actions(map_state)
-        allowed_drone = self._allowed(drone_candidates, map_state)
-        print(f"Allowed drone actions: {[str(a) for a in allowed_drone]}")
-
-        #allowed_drone=self.advance_allowed(allowed_drone , map_state)
-        allowed_drone=self.advance_allowedv2(allowed_drone , map_state)
-        print(f"Allowed drone actions: {[str(a) for a in allowed_drone]}")
-
-        
-        #chosen_drone = self._choose_drone_action(allowed_drone)
-        chosen_drone = self.advance_choose_drone_action(allowed_drone)
-        for cleaner in map_state.cleaners:
-            print(f"Cleaner battery level: {cleaner.battery_level}")
-        print(f"Drone action: {chosen_drone}")
-        map_state = self.apply_action(chosen_drone, map_state)
+        if self.controller is not None:
+            chosen_drone = self.controller.plan(map_state)
+        else:
+            # Build action candidates fresh based on current map
+            #drone_candidates = self._build_drone_actions(map_state)
+            drone_candidates = self.action_table(map_state).drone_actions
+            allowed_drone = self._masked(drone_candidates, self.allowed_mask(map_state))
+            if events.wants(DEBUG):
+                events.emit(ALLOWED_ACTIONS, map_state.time, 'drone', DEBUG, stage='allowed', actions=[str(a) for a in allowed_drone])
+
+            #allowed_drone=self.advance_allowed(allowed_drone , map_state)
+            allowed_drone=self.advance_allowedv2(allowed_drone , map_state)
+            if events.wants(DEBUG):
+                events.emit(ALLOWED_ACTIONS, map_state.time, 'drone', DEBUG, stage='lookahead', actions=[str(a) for a in allowed_drone])
+
+            #chosen_drone = self._choose_drone_action(allowed_drone)
+            chosen_drone = self.advance_choose_drone_action(allowed_drone)
+        if events.wants(DEBUG):
+            events.emit(BATTERY_LEVELS, map_state.time, 'simulation', DEBUG, drone=float(map_state.arrays.drone_battery[0]),
+                        cleaners=[float(level) for level in map_state.arrays.battery_levels()])
+        recorder = self.recorder
+        if recorder is not None and recorder.rows == 0:
+            recorder.record(map_state)
+        if events.wants(EVENTS):
+            events.emit(ACTION_STARTED, map_state.time, 'drone', action=str(chosen_drone))
+            next_map = self.apply_action(chosen_drone, map_state)
+            self._emit_step_events(chosen_drone, map_state, next_map)
+            map_state = next_map
+        else:
+            map_state = self.apply_action(chosen_drone, map_state)
+        if recorder is not None:
+            recorder.record(map_state, self.action_table(map_state).id_of(chosen_drone))
         
         #print(f"drone states: {map_state.drone.pos3d}, battery: {map_state.drone.battery_level}")
         if self.real_time:
@@ -294,7 +449,45 @@ class MapSimulation:
 
         return map_state
 
-    def run(self, steps: int = 20):
+    def _emit_step_events(self, drone_action: MapAction, map_state: Map, next_map: Map):
+        """action_done, cleaner process, window_cleaned and battery_low events of one step."""
+        events = self.events
+        prev, arrays = map_state.arrays, next_map.arrays
+        events.emit(ACTION_DONE, next_map.time, 'drone', action=str(drone_action), duration=next_map.time - map_state.time)
+        # Map.copy() copies the processes, so a process is the same one if its kind and end time are
+        cleaned_at = {}  # window index -> end time of the process that cleaned it
+        for c_idx, (old, new) in enumerate(zip(map_state.cleaning_processes, next_map.cleaning_processes)):
+            same = old is not None and new is not None and type(old) is type(new) and old.end_time == new.end_time
+            source = f'cleaner {arrays.cleaner_names[c_idx]}'
+            if old is not None and not same:
+                events.emit(ACTION_DONE, min(old.end_time, next_map.time), source, action=str(old))
+                if isinstance(old, CleanWindowAction) and prev.cleaner_on_window[c_idx] != NO_INDEX:
+                    cleaned_at[int(prev.cleaner_on_window[c_idx])] = min(old.end_time, next_map.time)
+            if new is not None and not same:
+                # Processes are started once the drone action is done
+                events.emit(ACTION_STARTED, next_map.time, source, action=str(new))
+        cleaned = np.flatnonzero((prev.window_state == WINDOW_DIRTY) & (arrays.window_state == WINDOW_CLEAN))
+        for w_idx in cleaned:
+            events.emit(WINDOW_CLEANED, cleaned_at.get(int(w_idx), next_map.time), f'window {arrays.window_names[w_idx]}')
+        events.battery(next_map.time, 'drone', prev.drone_battery[0], arrays.drone_battery[0])
+        for c_idx, (before, after) in enumerate(zip(prev.battery_levels(), arrays.battery_levels())):
+            events.battery(next_map.time, f'cleaner {arrays.cleaner_names[c_idx]}', before, after)
+
+    def run(self, steps: int = 20, verbosity: int = None):
+        """Step the map until every window is clean or a cleaner is empty, verbosity overrides self.events for this run."""
+        events = self.events
+        previous = events.verbosity
+        if verbosity is not None:
+            events.verbosity = verbosity
+        try:
+            self._run(steps)
+        finally:
+            events.verbosity = previous
+            events.flush()
+            if self.recorder is not None:
+                self.recorder.flush()
+
+    def _run(self, steps: int):
         done=False
         map_state = self.map
         for step in range(steps):
@@ -305,7 +498,7 @@ class MapSimulation:
                 if not window.state == 'clean':
                     break
             else:
-                print(f"All windows are clean. Ending simulation after {step} steps and {self.map.time}.")
+                self.events.emit(RUN_ENDED, self.map.time, 'simulation', reason='all windows clean', steps=step)
                 break
                 
             for cleaner in map_state.cleaners:
@@ -313,15 +506,41 @@ class MapSimulation:
                     done=True
                     break
             if done:
-                print(f"A cleaner has run out of battery. Ending simulation after {step} steps and {self.map.time}.")
+                self.events.emit(RUN_ENDED, self.map.time, 'simulation', reason='cleaner out of battery', steps=step)
                 break
 
             
     def visualize(self):
         self.map.visualize()
 
-    def apply_action(self, action :MapAction, map_state: Map , drone_only=False) -> Map  :
-        next_map = action.run(map_state)
+    def speculation(self):
+        """Context for planner lookahead, counted as speculative by the profiler."""
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.speculation()
+
+    def apply_action(self, action :MapAction, map_state: Map , drone_only=False, in_place=False) -> Map  :
+        if self.profiler is not None:
+            return self.profiler.profile_apply(self, action, map_state, drone_only, in_place)
+        return self._apply_action(action, map_state, drone_only, in_place)
+
+    def _apply_action(self, action :MapAction, map_state: Map , drone_only=False, in_place=False, phase=None) -> Map  :
+        # phase(name) is called after each step when profiling, see ActionProfiler
+        cache = self.transition_cache
+        if cache is not None:
+            hit, ticket = cache.lookup(action, map_state, drone_only)
+            if phase is not None:
+                phase('cache')
+            if hit is not None:
+                cached, fields = hit
+                if in_place:
+                    map_state.assign(cached, fields)
+                    return map_state
+                return cached.copy()
+
+        next_map = action.run(map_state, in_place=in_place)
+        if phase is not None:
+            phase('run')
 
         #print(f"drone states: {self.map.drone.pos3d}, battery: {self.map.drone.battery_level}")
         #print(self.map.cleaning_processes)
@@ -329,19 +548,31 @@ class MapSimulation:
         #print(f"cleaners on window: {[cleaner.on_window for cleaner in self.map.cleaners]}")
         #print(f"cleaner states: {[cleaner.states for cleaner in self.map.cleaners]}")
         if not(drone_only):
-            cleaner_candidates = self._build_cleaner_actions(next_map)
+            cleaner_candidates = self.action_table(next_map).cleaner_actions
+            if phase is not None:
+                phase('cleaner_actions')
+            cleaner_mask = self.cleaner_allowed_mask(next_map)
             for c_idx, cleaner_actions in enumerate(cleaner_candidates):
-                allowed_cleaner = self._allowed(cleaner_actions, next_map)
+                allowed_cleaner = self._masked(cleaner_actions, cleaner_mask[c_idx])
                 #print(f"Allowed cleaner {c_idx} actions: {[str(a) for a in allowed_cleaner]}")
                 chosen_cleaner = self._choose_cleaner_action(allowed_cleaner)
                 if chosen_cleaner is not None:
-                    next_map.cleaning_processes[c_idx] = chosen_cleaner
-                    chosen_cleaner.when_started(next_map)
+                    # The table holds prototypes, the running process keeps its own progress
+                    chosen_cleaner = copy.copy(chosen_cleaner)
+                    next_map.start_process(c_idx, chosen_cleaner)
                     #print(f"Cleaner {c_idx} action: {chosen_cleaner}")
+            if phase is not None:
+                phase('cleaner_allowed')
             next_map.update_cleaning_processes()
+            if phase is not None:
+                phase('cleaning_processes')
 
         next_map.update_states()
+        if phase is not None:
+            phase('update_states')
 
+        if cache is not None and ticket is not None:
+            cache.put(ticket, next_map)
         return next_map
 
     def apply_list_of_actions(self, actions :list[MapAction], map_state: Map) -> Map  :
@@ -356,5 +587,6 @@ if __name__ == "__main__":
     np.random.seed(42) # map generater seed
     test_map = random_map_generater(num_cleaners=2, num_windows=5)
     sim = MapSimulation(test_map, real_time=False, sleep_time=0.0)
+    sim.events = EventStream(PrintSink(), verbosity=DEBUG)
     sim.run(steps=300)
     sim.visualize()
@@ -0,0 +1,349 @@
+import numpy as np
+from topology import MapTopology
+
+# Window state is stored as int8, these are the names the rest of the code uses
+WINDOW_DIRTY = 0
+WINDOW_CLEAN = 1
+WINDOW_STATE_NAMES = ('dirty', 'clean')
+WINDOW_STATE_CODES = {name: code for code, name in enumerate(WINDOW_STATE_NAMES)}
+
+NO_INDEX = -1  # used for drone.load / cleaner.on_window when they are None
+
+
+class MapState:
+    """
+    Struct-of-arrays storage for everything on a map.
+
+    Drones, cleaners and windows are rows in these arrays, the objects in
+    drone.py, cleaner.py and window.py are thin views that read and write
+    their row. Copying a map is then a handful of ndarray.copy() calls
+    instead of a deepcopy of the whole object graph.
+
+    Window geometry, cleaning times and names never change during a run and
+    are shared between copies together with the flight distance cache built
+    from them, see STATIC_FIELDS.
+
+    Cleaner batteries are stored lazily: cleaner_battery is the level at
+    cleaner_battery_t0 and drops by cleaner_battery_rate per time unit
+    (negative while charging), plus the suction drain since
+    cleaner_last_update while cleaner_suction_on. They are evaluated at
+    battery_time, the time of the last Map.update_cleaning_processes(), by
+    cleaner_battery_level() / battery_levels().
+
+    digest() is a hash of the DIGEST_FIELDS that write() keeps up to date
+    row by row, so it costs O(1) per write instead of a pass over the map.
+    """
+
+    # Fields that change while the simulation runs, copied by copy()
+    MUTABLE_FIELDS = (
+        'drone_pos', 'drone_battery', 'drone_capacity', 'drone_ucupied', 'drone_is_moving', 'drone_load',
+        'cleaner_pos', 'cleaner_battery', 'cleaner_capacity', 'cleaner_is_cleaning', 'cleaner_is_charging',
+        'cleaner_on_window', 'cleaner_last_update',
+        'cleaner_battery_t0', 'cleaner_battery_rate', 'cleaner_suction_on', 'cleaner_suction', 'battery_time',
+        'window_state',
+        'drone_dirty', 'cleaner_dirty', 'window_dirty',
+    )
+    # The mutable fields besides the dirty flags, which only simulation.py reads
+    DIGEST_FIELDS = tuple(field for field in MUTABLE_FIELDS if not field.endswith('_dirty'))
+    # Fields that are fixed once the map is generated, shared by copy()
+    STATIC_FIELDS = (
+        'base_pos',
+        'window_pos', 'window_width', 'window_height', 'window_cleaning_time',
+        'cleaner_names', 'window_names', 'topology',
+    )
+
+    def __init__(self, num_drones: int, num_cleaners: int, num_windows: int):
+        self.base_pos = np.zeros(3, dtype=np.float64)
+
+        self.drone_pos = np.zeros((num_drones, 3), dtype=np.float64)
+        self.drone_battery = np.zeros(num_drones, dtype=np.float64)
+        self.drone_capacity = np.zeros(num_drones, dtype=np.float64)
+        self.drone_ucupied = np.zeros(num_drones, dtype=bool)
+        self.drone_is_moving = np.zeros(num_drones, dtype=bool)
+        self.drone_load = np.full(num_drones, NO_INDEX, dtype=np.int32)  # index into the cleaners
+
+        self.cleaner_pos = np.zeros((num_cleaners, 3), dtype=np.float64)
+        self.cleaner_battery = np.zeros(num_cleaners, dtype=np.float64)
+        self.cleaner_capacity = np.zeros(num_cleaners, dtype=np.float64)
+        self.cleaner_is_cleaning = np.zeros(num_cleaners, dtype=bool)
+        self.cleaner_is_charging = np.zeros(num_cleaners, dtype=bool)
+        self.cleaner_on_window = np.full(num_cleaners, NO_INDEX, dtype=np.int32)  # index into the windows
+        self.cleaner_last_update = np.zeros(num_cleaners, dtype=np.float64)  # start of the suction drain
+        self.cleaner_battery_t0 = np.zeros(num_cleaners, dtype=np.float64)
+        self.cleaner_battery_rate = np.zeros(num_cleaners, dtype=np.float64)  # % per time unit of the running process
+        self.cleaner_suction_on = np.zeros(num_cleaners, dtype=bool)
+        self.cleaner_suction = np.zeros(1, dtype=np.float64)  # Map.cleaner_suction_consumption
+        self.battery_time = np.zeros(1, dtype=np.float64)
+        self.cleaner_names = [None] * num_cleaners
+
+        self.window_pos = np.zeros((num_windows, 3), dtype=np.float64)
+        self.window_width = np.zeros(num_windows, dtype=np.float64)
+        self.window_height = np.zeros(num_windows, dtype=np.float64)
+        self.window_cleaning_time = np.zeros(num_windows, dtype=np.float64)
+        self.window_state = np.zeros(num_windows, dtype=np.int8)
+        self.window_names = [None] * num_windows
+        self.topology = MapTopology(self.base_pos, self.window_pos)
+
+        # Set by the entity setters whenever a row changes, cleared by whoever consumes them
+        self.drone_dirty = np.zeros(num_drones, dtype=bool)
+        self.cleaner_dirty = np.zeros(num_cleaners, dtype=bool)
+        self.window_dirty = np.zeros(num_windows, dtype=bool)
+
+        self.journal = None  # UndoJournal while a transaction is open, see Map.begin_transaction
+        self._digest = None  # None until digest() is first called or after a write it can not follow
+        self._digest_index = None  # id(array) -> position in DIGEST_FIELDS
+
+    @property
+    def num_cleaners(self):
+        return len(self.cleaner_battery)
+
+    @property
+    def num_windows(self):
+        return len(self.window_state)
+
+    def copy(self) -> 'MapState':
+        """Copy the mutable arrays, share the static ones."""
+        new_state = MapState.__new__(MapState)
+        for field in self.STATIC_FIELDS:
+            setattr(new_state, field, getattr(self, field))
+        for field in self.MUTABLE_FIELDS:
+            setattr(new_state, field, getattr(self, field).copy())
+        new_state.journal = None
+        new_state._digest = self._digest
+        new_state._digest_index = None
+        return new_state
+
+    def write(self, array, index, value):
+        """Set array[index], recording the old value first if a transaction is open."""
+        if self.journal is not None:
+            self.journal.record(array, index)
+        if self._digest is None:
+            array[index] = value
+            return
+        fields = self._digest_index
+        if fields is None:
+            fields = self._digest_fields()
+        field = fields.get(id(array))
+        if field is None:
+            array[index] = value
+        elif type(index) is int or isinstance(index, np.integer):
+            f, flat = field
+            old = hash((f, index, array.item(index) if flat else array[index].tobytes()))
+            array[index] = value
+            self._digest += hash((f, index, array.item(index) if flat else array[index].tobytes())) - old
+        else:
+            array[index] = value
+            self._digest = None
+
+    def _digest_fields(self) -> dict:
+        # id(array) -> (position in DIGEST_FIELDS, one value per row), rebuilt by every copy
+        self._digest_index = {
+            id(getattr(self, field)): (f, getattr(self, field).ndim == 1) for f, field in enumerate(self.DIGEST_FIELDS)
+        }
+        return self._digest_index
+
+    def digest(self) -> int:
+        """
+        Sum of the hashes of every row of the DIGEST_FIELDS. Equal states
+        have equal digests, equal digests are only likely equal states.
+        """
+        if self._digest is None:
+            total = 0
+            for f, field in enumerate(self.DIGEST_FIELDS):
+                array = getattr(self, field)
+                flat = array.ndim == 1
+                for i in range(len(array)):
+                    total += hash((f, i, array.item(i) if flat else array[i].tobytes()))
+            self._digest = total
+        return self._digest
+
+    def forget_digest(self):
+        """Call after writing the arrays without write()."""
+        self._digest = None
+
+    def assign(self, other: 'MapState', fields=MUTABLE_FIELDS):
+        """
+        Write fields of other (same layout) into this state through write().
+        The digest is taken from other, so the fields left out must already
+        be equal.
+        """
+        for field in fields:
+            self.write(getattr(self, field), slice(None), getattr(other, field))
+        self._digest = other._digest
+
+    def process_level(self, index: int, time: float = None) -> float:
+        """Battery of one cleaner at time (default battery_time) counting only its running process."""
+        if time is None:
+            time = self.battery_time[0]
+        level = self.cleaner_battery[index]
+        rate = self.cleaner_battery_rate[index]
+        if rate > 0.0:
+            level = max(0.0, level - rate * (time - self.cleaner_battery_t0[index]))
+        elif rate < 0.0:
+            level = min(100.0, level - rate * (time - self.cleaner_battery_t0[index]))
+        return level
+
+    def cleaner_battery_level(self, index: int) -> float:
+        """Battery of one cleaner at battery_time."""
+        level = self.process_level(index)
+        if self.cleaner_suction_on[index]:
+            suction = self.cleaner_suction[0] * (self.battery_time[0] - self.cleaner_last_update[index])
+            level = max(0.0, level - suction)
+        return float(level)
+
+    def battery_levels(self) -> np.ndarray:
+        """Battery of every cleaner at battery_time."""
+        if self.num_cleaners <= 16:
+            # Per-call numpy overhead dominates for a handful of cleaners
+            return np.array([self.cleaner_battery_level(i) for i in range(self.num_cleaners)], dtype=np.float64)
+        now = self.battery_time[0]
+        rate = self.cleaner_battery_rate
+        level = self.cleaner_battery - rate * (now - self.cleaner_battery_t0)
+        level = np.where(rate > 0.0, np.maximum(level, 0.0), np.where(rate < 0.0, np.minimum(level, 100.0), level))
+        suction = level - self.cleaner_suction[0] * (now - self.cleaner_last_update)
+        return np.where(self.cleaner_suction_on, np.maximum(suction, 0.0), level)
+
+    def set_cleaner_battery(self, index: int, level: float, t0: float = None, rate: float = None):
+        """
+        Restart the battery model of one cleaner from level at t0 (default
+        battery_time), optionally with a new process rate. The suction drain
+        already counted in level restarts from battery_time.
+        """
+        now = self.battery_time[0]
+        self.write(self.cleaner_battery, index, level)
+        self.write(self.cleaner_battery_t0, index, now if t0 is None else t0)
+        if rate is not None:
+            self.write(self.cleaner_battery_rate, index, rate)
+        if self.cleaner_suction_on[index]:
+            self.write(self.cleaner_last_update, index, now)
+
+    @classmethod
+    def from_entities(cls, base_station, drones, cleaners, windows) -> 'MapState':
+        """Gather the current values of standalone entity objects into one state."""
+        state = cls(len(drones), len(cleaners), len(windows))
+        state.base_pos[:] = base_station.pos3d
+        state.topology.invalidate()
+        for i, drone in enumerate(drones):
+            state.drone_pos[i] = drone.pos3d
+            state.drone_battery[i] = drone.battery_level
+            state.drone_capacity[i] = drone.battery_capacity
+            state.drone_ucupied[i] = drone.ucupied
+            state.drone_is_moving[i] = drone.is_moving
+            state.drone_load[i] = drone._s.drone_load[drone._i]
+        for i, cleaner in enumerate(cleaners):
+            state.cleaner_pos[i] = cleaner.pos3d
+            state.cleaner_battery[i] = cleaner.battery_level
+            state.cleaner_capacity[i] = cleaner.battery_capacity
+            state.cleaner_is_cleaning[i] = cleaner.is_cleaning
+            state.cleaner_is_charging[i] = cleaner.is_charging
+            state.cleaner_on_window[i] = cleaner._s.cleaner_on_window[cleaner._i]
+            state.cleaner_last_update[i] = cleaner.last_update_time
+            state.cleaner_names[i] = cleaner.name
+        for i, window in enumerate(windows):
+            state.window_pos[i] = window.pos3d
+            state.window_width[i] = window.width
+            state.window_height[i] = window.height
+            state.window_cleaning_time[i] = window.cleaning_time
+            state.window_state[i] = WINDOW_STATE_CODES[window.state]
+            state.window_names[i] = window.name
+        state.topology.invalidate()
+        return state
+
+    def load_windows(self, pos, width, height, cleaning_time, state=None, names=None):
+        """
+        Replace all windows with (num_windows, 3) positions and (num_windows,)
+        sizes and cleaning times, all dirty unless state is given. Only for a
+        state that has not been copied yet.
+        """
+        num_windows = len(pos)
+        self.window_pos = np.ascontiguousarray(pos, dtype=np.float64)
+        self.window_width = np.asarray(width, dtype=np.float64)
+        self.window_height = np.asarray(height, dtype=np.float64)
+        self.window_cleaning_time = np.asarray(cleaning_time, dtype=np.float64)
+        if state is None:
+            self.window_state = np.full(num_windows, WINDOW_STATE_CODES['dirty'], dtype=np.int8)
+        else:
+            self.window_state = np.asarray(state, dtype=np.int8)
+        self.window_names = list(names) if names is not None else [str(i + 1) for i in range(num_windows)]
+        self.window_dirty = np.zeros(num_windows, dtype=bool)
+        self.topology = MapTopology(self.base_pos, self.window_pos)
+        self._digest = None
+        self._digest_index = None
+
+
+class UndoJournal:
+    """
+    Log of array writes made while a transaction is open on a Map.
+
+    Savepoints can be nested, rollback() undoes everything written since the
+    newest savepoint and restores the map time, the cleaning processes and
+    the process lists in Map.PROCESS_LISTS.
+    """
+
+    def __init__(self):
+        self.entries = []  # (array, index, old value)
+        self.savepoints = []  # (len(entries), time, process lists, process attributes, digest)
+
+    def record(self, array, index):
+        old_value = array[index]
+        if isinstance(old_value, np.ndarray):
+            old_value = old_value.copy()
+        self.entries.append((array, index, old_value))
+
+    def savepoint(self, map_obj):
+        lists = [list(getattr(map_obj, name)) for name in map_obj.PROCESS_LISTS]
+        process_attrs = [process.__dict__.copy() if process is not None else None for process in map_obj.cleaning_processes]
+        self.savepoints.append((len(self.entries), map_obj.time, lists, process_attrs, map_obj.arrays._digest))
+
+    def rollback(self, map_obj):
+        n_entries, time, lists, process_attrs, digest = self.savepoints.pop()
+        entries = self.entries
+        while len(entries) > n_entries:
+            array, index, old_value = entries.pop()
+            array[index] = old_value
+        map_obj.arrays._digest = digest
+        map_obj.time = time
+        for name, saved in zip(map_obj.PROCESS_LISTS, lists):
+            getattr(map_obj, name)[:] = saved
+        for process, attrs in zip(map_obj.cleaning_processes, process_attrs):
+            if process is not None:
+                process.__dict__.clear()
+                process.__dict__.update(attrs)
+
+    def commit(self):
+        self.savepoints.pop()
+        if not self.savepoints:
+            self.entries.clear()
+
+
+class EntityViews:
+    """
+    Read-only list of entity views that are created the first time they are
+    accessed, so copying a map with many windows does not build a Python
+    object per window.
+    """
+
+    def __init__(self, factory, length, items=None):
+        self._factory = factory
+        self._items = list(items) if items is not None else [None] * length
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._items)))]
+        item = self._items[index]
+        if item is None:
+            if index < 0:
+                index += len(self._items)
+            item = self._factory(index)
+            self._items[index] = item
+        return item
+
+    def __iter__(self):
+        for i in range(len(self._items)):
+            yield self[i]
+
+    def __repr__(self):
+        return f'EntityViews({list(self)!r})'
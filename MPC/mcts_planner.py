@@ -0,0 +1,302 @@
+import math
+import random
+import time
+import numpy as np
+from map import Map
+from map_simulation import MapSimulation
+from map_actions import MapAction
+from map_state import MapState, NO_INDEX, WINDOW_CLEAN
+
+
+class PlannerObjective:
+    """
+    Reward of one macro action for the planners: window_reward per window
+    cleaned, minus time_cost per time unit it took, minus depletion_penalty
+    when a cleaner battery runs empty.
+    """
+
+    def __init__(self, window_reward: float = 100.0, time_cost: float = 1.0, depletion_penalty: float = 1000.0):
+        self.window_reward = window_reward
+        self.time_cost = time_cost
+        self.depletion_penalty = depletion_penalty
+
+    def summary(self, map_state: Map):
+        """(time, windows clean, any cleaner empty) of a map, reward() takes two of these."""
+        arrays = map_state.arrays
+        clean = int(np.count_nonzero(arrays.window_state == WINDOW_CLEAN))
+        empty = bool(np.any(arrays.battery_levels() == 0.0))
+        return map_state.time, clean, empty
+
+    def reward(self, before, after) -> float:
+        reward = self.window_reward * (after[1] - before[1]) - self.time_cost * (after[0] - before[0])
+        if after[2] and not before[2]:
+            reward -= self.depletion_penalty
+        return reward
+
+    def is_terminal(self, map_state: Map, summary=None) -> bool:
+        """All windows clean or a cleaner battery empty."""
+        if summary is None:
+            summary = self.summary(map_state)
+        return summary[1] == map_state.arrays.num_windows or summary[2]
+
+
+def same_state(a: Map, b: Map) -> bool:
+    """True if two maps are in the same simulation state (the change flags are ignored)."""
+    if a.time != b.time:
+        return False
+    for field in MapState.MUTABLE_FIELDS:
+        if field.endswith('_dirty'):
+            continue
+        if not np.array_equal(getattr(a.arrays, field), getattr(b.arrays, field)):
+            return False
+    return True
+
+
+def heuristic_action(map_state: Map, table, mask):
+    """
+    Charge when the drone battery is low, drop a carried cleaner at the
+    nearest dirty window nobody is on, otherwise pick up the nearest
+    cleaner that has finished its window or is charged at the base.
+    """
+    arrays = map_state.arrays
+    W = arrays.num_windows
+    drone_location = map_state.topology.location_of(arrays.drone_pos[0])
+    if drone_location is None:
+        return None
+    if arrays.drone_battery[0] < 30.0 and mask[1]:
+        return table[1]
+    # Large maps look windows up in the spatial index instead of a full distance row
+    use_grid = map_state.topology.uses_grid
+    distances = None if use_grid else map_state.topology.distances(drone_location)
+    if arrays.drone_load[0] != NO_INDEX:
+        free = mask[3:3 + W].copy()
+        occupied = arrays.cleaner_on_window[arrays.cleaner_on_window != NO_INDEX]
+        free[occupied] = False
+        if not free.any():
+            return None
+        if use_grid:
+            nearest, _ = map_state.nearest_dirty_windows(arrays.drone_pos[0], 1, free)
+            return table[3 + int(nearest[0])]
+        window_distances = np.where(free, distances[1:], np.inf)
+        return table[3 + int(np.argmin(window_distances))]
+    batteries = arrays.battery_levels()
+    on_window = arrays.cleaner_on_window
+    window_clean = arrays.window_state[np.where(on_window != NO_INDEX, on_window, 0)] == WINDOW_CLEAN
+    done = np.where(on_window != NO_INDEX, window_clean | (batteries <= 40.0),
+                    ~arrays.cleaner_is_charging & (batteries > 40.0))
+    candidates = mask[3 + W:] & done & ~arrays.cleaner_is_cleaning
+    if not candidates.any():
+        return None
+    if use_grid:
+        cleaner_distances = np.linalg.norm(arrays.cleaner_pos - arrays.drone_pos[0], axis=1)
+    else:
+        cleaner_locations = np.array([map_state.topology.location_of(pos) or 0 for pos in arrays.cleaner_pos])
+        cleaner_distances = distances[cleaner_locations]
+    cleaner_distances = np.where(candidates, cleaner_distances, np.inf)
+    return table[3 + W + int(np.argmin(cleaner_distances))]
+
+
+class HeuristicController:
+    """
+    MapSimulation.controller that follows heuristic_action, charging (or
+    doing nothing) when it has nothing to suggest. A cheap baseline for the
+    planners and the policy of the scaling benchmark.
+    """
+
+    def __init__(self, sim: MapSimulation):
+        self.sim = sim
+
+    def plan(self, map_state: Map) -> MapAction:
+        table = self.sim.action_table(map_state)
+        mask = self.sim.allowed_mask(map_state)
+        action = heuristic_action(map_state, table, mask)
+        if action is None:
+            action = table[1] if mask[1] else table[0]
+        return action
+
+
+class _Node:
+    __slots__ = ('map', 'summary', 'parent', 'action_id', 'reward', 'children', 'untried', 'visits', 'value_sum')
+
+    def __init__(self, map_state: Map, summary, parent=None, action_id=None, reward=0.0):
+        self.map = map_state
+        self.summary = summary
+        self.parent = parent
+        self.action_id = action_id
+        self.reward = reward  # reward of the action that led here
+        self.children = {}  # action id -> _Node
+        self.untried = None  # action ids not expanded yet, filled on the first visit
+        self.visits = 0
+        self.value_sum = 0.0  # sum of the returns after this node
+
+    def q(self, gamma):
+        return self.reward + (gamma * self.value_sum / self.visits if self.visits else 0.0)
+
+
+class MCTSPlanner:
+    """
+    Monte Carlo tree search over the drone macro actions of
+    MapSimulation.new_build_drone_actions (by action id, see ActionTable).
+
+    Each tree node keeps its own Map copy. Selection uses UCT with returns
+    normalised to the range seen so far, new nodes are expanded one action
+    at a time, and the rollouts from a leaf run on the leaf map in place
+    inside a transaction that is rolled back afterwards. The rollout policy
+    is 'random' or 'heuristic' (see heuristic_action).
+
+    plan() stops after `simulations` rollouts or `time_budget` seconds,
+    whichever comes first. The subtree of the chosen action is kept, and
+    reused by the next plan() if it is called with the map that action led
+    to.
+    """
+
+    def __init__(self, sim: MapSimulation, simulations: int = 200, time_budget: float = None,
+                 rollout_depth: int = 15, exploration: float = 1.4, rollout_policy: str = 'heuristic',
+                 gamma: float = 0.95, safe_actions: bool = True, objective: PlannerObjective = None, seed=None):
+        self.sim = sim
+        self.simulations = simulations
+        self.time_budget = time_budget
+        self.rollout_depth = rollout_depth
+        self.exploration = exploration
+        self.rollout_policy = rollout_policy
+        self.gamma = gamma  # discount per macro action, without it putting work off costs almost nothing
+        self.safe_actions = safe_actions  # filter expansions with MapSimulation.advance_allowedv2
+        self.objective = objective if objective is not None else PlannerObjective()
+        self.rng = random.Random(seed)
+        self.root = None
+        self._min_q = math.inf
+        self._max_q = -math.inf
+        self.last_simulations = 0  # rollouts done by the last plan()
+        self.reused_visits = 0  # visits of the reused subtree at the start of the last plan()
+
+    # ---- Public API ----
+    def plan(self, map_state: Map) -> MapAction:
+        """Best next drone action for map_state."""
+        return self.sim.action_table(map_state)[self.plan_id(map_state)]
+
+    def plan_id(self, map_state: Map) -> int:
+        """Action id of the best next drone action for map_state."""
+        root = self._reuse_root(map_state)
+        self.reused_visits = root.visits
+        deadline = None if self.time_budget is None else time.perf_counter() + self.time_budget
+        n = 0
+        with self.sim.speculation():
+            while n < self.simulations and (deadline is None or n == 0 or time.perf_counter() < deadline):
+                self._simulate(root)
+                n += 1
+        self.last_simulations = n
+        self.root = root
+        if not root.children:
+            return 0
+        best = max(root.children.values(), key=lambda child: (child.visits, child.q(self.gamma)))
+        return best.action_id
+
+    def reset(self):
+        """Forget the search tree."""
+        self.root = None
+        self._min_q = math.inf
+        self._max_q = -math.inf
+
+    # ---- Tree ----
+    def _reuse_root(self, map_state: Map) -> _Node:
+        if self.root is not None:
+            if same_state(self.root.map, map_state):
+                return self.root
+            for child in self.root.children.values():
+                if same_state(child.map, map_state):
+                    child.parent = None
+                    return child
+        self.reset()
+        return _Node(map_state.copy(), self.objective.summary(map_state))
+
+    def _actions(self, node: _Node) -> list:
+        sim = self.sim
+        table = sim.action_table(node.map)
+        ids = np.flatnonzero(sim.allowed_mask(node.map)[1:]) + 1  # the NullAction never moves time
+        actions = [table[i] for i in ids]
+        if self.safe_actions:
+            actions = sim.advance_allowedv2(actions, node.map)
+        return [table.id_of(action) for action in actions]
+
+    def _simulate(self, root: _Node):
+        node = root
+        # Selection
+        while True:
+            if node.untried is None:
+                node.untried = [] if self.objective.is_terminal(node.map, node.summary) else self._actions(node)
+                self.rng.shuffle(node.untried)
+            if node.untried or not node.children:
+                break
+            node = self._select(node)
+        # Expansion
+        if node.untried:
+            action_id = node.untried.pop()
+            action = self.sim.action_table(node.map)[action_id]
+            child_map = self.sim.apply_action(action, node.map)
+            summary = self.objective.summary(child_map)
+            child = _Node(child_map, summary, node, action_id, self.objective.reward(node.summary, summary))
+            node.children[action_id] = child
+            node = child
+        # Rollout and backup
+        value = self._rollout(node)
+        while node is not None:
+            node.visits += 1
+            node.value_sum += value
+            if node.visits > 1 or node.parent is not None:
+                q = node.q(self.gamma)
+                self._min_q = min(self._min_q, q)
+                self._max_q = max(self._max_q, q)
+            value = node.reward + self.gamma * value
+            node = node.parent
+
+    def _select(self, node: _Node) -> _Node:
+        log_visits = math.log(node.visits)
+        spread = self._max_q - self._min_q
+        best = None
+        best_score = -math.inf
+        for child in node.children.values():
+            q = child.q(self.gamma)
+            if spread > 0:
+                q = (q - self._min_q) / spread
+            score = q + self.exploration * math.sqrt(log_visits / child.visits)
+            if score > best_score:
+                best, best_score = child, score
+        return best
+
+    # ---- Rollouts ----
+    def _rollout(self, node: _Node) -> float:
+        if self.objective.is_terminal(node.map, node.summary):
+            return 0.0
+        sim = self.sim
+        map_state = node.map
+        summary = node.summary
+        total = 0.0
+        discount = 1.0
+        map_state.begin_transaction()
+        try:
+            for _ in range(self.rollout_depth):
+                action = self._rollout_action(map_state)
+                if action is None:
+                    break
+                sim.apply_action(action, map_state, in_place=True)
+                new_summary = self.objective.summary(map_state)
+                total += discount * self.objective.reward(summary, new_summary)
+                discount *= self.gamma
+                summary = new_summary
+                if self.objective.is_terminal(map_state, summary):
+                    break
+        finally:
+            map_state.rollback()
+        return total
+
+    def _rollout_action(self, map_state: Map):
+        table = self.sim.action_table(map_state)
+        mask = self.sim.allowed_mask(map_state)
+        if self.rollout_policy == 'heuristic':
+            action = heuristic_action(map_state, table, mask)
+            if action is not None:
+                return action
+        ids = np.flatnonzero(mask[1:]) + 1
+        if len(ids) == 0:
+            return None
+        return table[int(ids[self.rng.randrange(len(ids))])]
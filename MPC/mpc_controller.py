@@ -0,0 +1,246 @@
+import time
+import numpy as np
+from map import Map
+from map_simulation import MapSimulation
+from map_actions import MapAction
+from map_state import NO_INDEX, WINDOW_DIRTY
+from mcts_planner import PlannerObjective, heuristic_action
+
+CLEAN_MIN_BATTERY = 40.0  # a cleaner needs more than this to start cleaning, see MapSimulation.cleaner_allowed_mask
+
+
+class _Plan:
+    __slots__ = ('map', 'summary', 'action_ids', 'score', 'discount', 'shortfall')
+
+    def __init__(self, map_state: Map, summary, action_ids=(), score=0.0, discount=1.0, shortfall=0.0):
+        self.map = map_state
+        self.summary = summary
+        self.action_ids = action_ids
+        self.score = score  # discounted objective reward of action_ids
+        self.discount = discount  # gamma ** len(action_ids)
+        self.shortfall = shortfall  # cleaner battery missing to reserve, see MPCController._shortfall
+
+
+class MPCController:
+    """
+    Receding-horizon controller over the drone macro actions (by action id,
+    see ActionTable).
+
+    Every plan() runs a beam search over sequences of `horizon` actions,
+    keeping the beam_width best sequences after each depth, returns the
+    first action of the best one and keeps the rest. The next plan() replays
+    that shifted remainder as a warm start: it is always in the beam, so the
+    controller only changes its mind for a better sequence.
+
+    To stay cheap on large maps a sequence is only extended with a handful of
+    candidates: the heuristic_action (mcts_planner.py), charging, and the
+    `branching` nearest free dirty windows (from the spatial index on maps
+    over MapTopology.GRID_LIMIT windows) or pickable cleaners. Sequences
+    that leave the drone without reserve percent of battery after flying
+    back to base are dropped. Together with the cleaner reserve below this
+    replaces the advance_allowedv2 lookahead.
+    A carried cleaner with too little battery to clean only goes back to the
+    base.
+
+    Sequences are ranked first by how far the cleaners left on windows
+    would drop below reserve percent by the time the drone could pick
+    them up, so one that keeps every cleaner above it always wins and
+    otherwise the least short one does. Then by the PlannerObjective
+    reward discounted by gamma, plus a value of the map they end in: progress_weight of a window reward
+    for every window a cleaner is still cleaning, and battery_weight per
+    percent of cleaner battery, so the horizon does not run the cleaners down.
+
+    With time_budget set the search stops after the depth that ran out of
+    time and plans with the sequences it has.
+    """
+
+    def __init__(self, sim: MapSimulation, horizon: int = 4, beam_width: int = 4, branching: int = 3,
+                 time_budget: float = None, gamma: float = 0.95, progress_weight: float = 0.5,
+                 battery_weight: float = 0.5, reserve: float = 10.0, objective: PlannerObjective = None):
+        self.sim = sim
+        self.horizon = horizon
+        self.beam_width = beam_width
+        self.branching = branching
+        self.time_budget = time_budget
+        self.gamma = gamma
+        self.progress_weight = progress_weight
+        self.battery_weight = battery_weight
+        self.reserve = reserve
+        self.objective = objective if objective is not None else PlannerObjective()
+        self.plan_ids = []  # best sequence of the last plan(), the executed first action included
+        self.last_expanded = 0  # sequences extended by the last plan()
+
+    # ---- Public API ----
+    def plan(self, map_state: Map) -> MapAction:
+        """Next drone action for map_state."""
+        return self.sim.action_table(map_state)[self.plan_id(map_state)]
+
+    def plan_id(self, map_state: Map) -> int:
+        """Action id of the next drone action, 0 (NullAction) if there is nothing to do."""
+        with self.sim.speculation():
+            return self._plan_id(map_state)
+
+    def _plan_id(self, map_state: Map) -> int:
+        deadline = None if self.time_budget is None else time.perf_counter() + self.time_budget
+        table = self.sim.action_table(map_state)
+        warm = self._replay(map_state, table, self.plan_ids[1:])
+        beam = [_Plan(map_state, self.objective.summary(map_state))]
+        self.last_expanded = 0
+        for depth in range(self.horizon):
+            children = {}
+            for plan in beam:
+                if self.objective.is_terminal(plan.map, plan.summary):
+                    children[plan.action_ids] = plan
+                    continue
+                self.last_expanded += 1
+                for action_id in self._candidates(plan.map, table):
+                    child = self._extend(plan, action_id, table)
+                    if child is not None:
+                        children[child.action_ids] = child
+            if depth < len(warm):
+                children.setdefault(warm[depth].action_ids, warm[depth])
+            if not children:
+                break
+            beam = sorted(children.values(), key=self._rank, reverse=True)[:self.beam_width]
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+        best = max(beam, key=self._rank)
+        self.plan_ids = list(best.action_ids)
+        return self.plan_ids[0] if self.plan_ids else 0
+
+    def reset(self):
+        """Forget the warm start."""
+        self.plan_ids = []
+
+    # ---- Search ----
+    def _rank(self, plan: _Plan) -> tuple:
+        arrays = plan.map.arrays
+        on_window = arrays.cleaner_on_window
+        cleaning = arrays.cleaner_is_cleaning & (on_window != NO_INDEX)
+        progress = np.count_nonzero(arrays.window_state[on_window[cleaning]] == WINDOW_DIRTY)
+        value = self.progress_weight * self.objective.window_reward * progress
+        value += self.battery_weight * float(arrays.battery_levels().sum())
+        return -plan.shortfall, plan.score + plan.discount * value
+
+    def _extend(self, plan: _Plan, action_id: int, table):
+        child_map = self.sim.apply_action(table[action_id], plan.map)
+        if not self._safe(child_map):
+            return None
+        summary = self.objective.summary(child_map)
+        score = plan.score + plan.discount * self.objective.reward(plan.summary, summary)
+        shortfall = max(plan.shortfall, self._shortfall(child_map))
+        return _Plan(child_map, summary, plan.action_ids + (action_id,), score, plan.discount * self.gamma, shortfall)
+
+    def _replay(self, map_state: Map, table, action_ids) -> list:
+        """Plans along the warm start, cut at the first action that is no longer allowed or safe."""
+        plans = []
+        plan = _Plan(map_state, self.objective.summary(map_state))
+        for action_id in action_ids[:self.horizon]:
+            if self.objective.is_terminal(plan.map, plan.summary) or not self.sim.allowed_mask(plan.map)[action_id]:
+                break
+            plan = self._extend(plan, action_id, table)
+            if plan is None:
+                break
+            plans.append(plan)
+        return plans
+
+    def _safe(self, map_state: Map) -> bool:
+        """The drone can still fly back to the base and drop its load with reserve percent left."""
+        arrays = map_state.arrays
+        battery = arrays.drone_battery[0]
+        if battery <= 0.0:
+            return False
+        sim = self.sim
+        location = map_state.topology.location_of(arrays.drone_pos[0])
+        if location is None:
+            return battery >= self.reserve
+        energy = map_state.topology.costs(location, sim.drone_speed, sim.flying_power_consumption)[1][0]
+        if arrays.drone_load[0] != NO_INDEX:
+            energy += sim.pickup_drop_duration * sim.pickup_drop_power
+        return battery - energy / arrays.drone_capacity[0] * 100.0 >= self.reserve
+
+    def _shortfall(self, map_state: Map) -> float:
+        """
+        Percent the cleaners on windows fall below reserve by the time the
+        drone could fly over and pick them up, each counted on its own.
+        """
+        arrays = map_state.arrays
+        on_window = arrays.cleaner_on_window
+        waiting = np.flatnonzero(on_window != NO_INDEX)
+        if len(waiting) == 0:
+            return 0.0
+        sim = self.sim
+        location = map_state.topology.location_of(arrays.drone_pos[0])
+        if location is None:
+            distances = np.linalg.norm(arrays.cleaner_pos[waiting] - arrays.drone_pos[0], axis=1)
+        else:
+            distances = map_state.topology.distances(location)[1 + on_window[waiting]]
+        # A carried cleaner has to be dropped first
+        handling = sim.pickup_drop_duration * (2 if arrays.drone_load[0] != NO_INDEX else 1)
+        suction = arrays.cleaner_suction[0]
+        shortfall = 0.0
+        for i, distance in zip(waiting, distances):
+            reach = map_state.time + distance / sim.drone_speed + handling
+            process = map_state.cleaning_processes[i]
+            if process is not None:
+                # A cleaner can not be picked up while cleaning, its process drain stops at end_time
+                reach = max(reach, process.end_time)
+                level = arrays.process_level(i, process.end_time)
+            else:
+                level = arrays.process_level(i, reach)
+            if arrays.cleaner_suction_on[i]:
+                level -= suction * (reach - arrays.cleaner_last_update[i])
+            shortfall += max(0.0, self.reserve - level)
+        return shortfall
+
+    @staticmethod
+    def _distances(map_state: Map) -> np.ndarray:
+        location = map_state.topology.location_of(map_state.arrays.drone_pos[0])
+        return map_state.topology.distances(location if location is not None else 0)
+
+    def _candidates(self, map_state: Map, table) -> list:
+        """Action ids worth trying from map_state, at most branching + 3 of them."""
+        mask = self.sim.allowed_mask(map_state)
+        arrays = map_state.arrays
+        W = arrays.num_windows
+        ids = []
+        load = arrays.drone_load[0]
+        if load != NO_INDEX and arrays.cleaner_battery_level(load) <= CLEAN_MIN_BATTERY:
+            # The cleaner could not clean a window, it can only go back to the base
+            return [action_id for action_id in (1, 2) if mask[action_id]]
+        action = heuristic_action(map_state, table, mask)
+        if action is not None:
+            ids.append(table.id_of(action))
+        if mask[1]:
+            ids.append(1)
+        if load != NO_INDEX:
+            free = mask[3:3 + W].copy()
+            free[arrays.cleaner_on_window[arrays.cleaner_on_window != NO_INDEX]] = False
+            if map_state.topology.uses_grid:
+                targets, target_distances = map_state.nearest_dirty_windows(arrays.drone_pos[0], self.branching, free)
+            else:
+                targets = np.flatnonzero(free)
+                target_distances = self._distances(map_state)[1 + targets]
+            offset = 3
+        else:
+            targets = np.flatnonzero(mask[3 + W:])
+            target_distances = np.linalg.norm(arrays.cleaner_pos[targets] - arrays.drone_pos[0], axis=1)
+            offset = 3 + W
+        if len(targets) > self.branching:
+            nearest = np.argpartition(target_distances, self.branching - 1)[:self.branching]
+            targets = targets[nearest[np.argsort(target_distances[nearest])]]
+        else:
+            targets = targets[np.argsort(target_distances)]
+        if load == NO_INDEX:
+            # The emptiest cleaner left on a window can be far away, it is always worth fetching
+            on_window = arrays.cleaner_on_window
+            stranded = np.flatnonzero(mask[3 + W:] & (on_window != NO_INDEX))
+            if len(stranded):
+                targets = np.append(targets, stranded[np.argmin(arrays.battery_levels()[stranded])])
+        for target in targets:
+            action_id = offset + int(target)
+            if action_id not in ids:
+                ids.append(action_id)
+        if not ids and mask[2]:
+            ids.append(2)  # nowhere to drop the cleaner but the base
+        return ids
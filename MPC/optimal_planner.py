@@ -0,0 +1,256 @@
+import heapq
+import itertools
+import time
+import tracemalloc
+import numpy as np
+from map import Map
+from map_simulation import MapSimulation
+from map_state import NO_INDEX, WINDOW_DIRTY
+from clener_actioons import CleanWindowAction
+from mcts_planner import heuristic_action
+
+
+class PlanResult:
+    """Outcome of OptimalPlanner.search()."""
+
+    def __init__(self, action_ids, actions, completion_time, lower_bound, optimal, stats):
+        self.action_ids = action_ids
+        self.actions = actions
+        self.completion_time = completion_time  # None if no plan was found
+        self.lower_bound = lower_bound  # no plan finishes earlier than this
+        self.optimal = optimal
+        self.stats = stats
+
+    def __repr__(self):
+        return f'PlanResult(completion_time={self.completion_time}, optimal={self.optimal}, actions={[str(a) for a in self.actions]})'
+
+
+class _SearchNode:
+    __slots__ = ('map', 'parent', 'action_id', 'depth')
+
+    def __init__(self, map_state, parent=None, action_id=None):
+        self.map = map_state
+        self.parent = parent
+        self.action_id = action_id
+        self.depth = 0 if parent is None else parent.depth + 1
+
+
+class OptimalPlanner:
+    """
+    Best-first (A*) search for the drone schedule that gets every window
+    clean soonest, for small and medium maps.
+
+    The cost of a node is its map time, and a map counts as finished once
+    every dirty window has a cleaner cleaning it, at the end time of the
+    last of those processes. lower_bound() is admissible: it takes the
+    largest of
+      - the end of every running cleaning process,
+      - for every dirty window nobody is on, the direct flight from the
+        drone to it plus the drop and its cleaning time,
+      - now plus the remaining cleaning work spread evenly over the cleaners.
+
+    States are looked up in a transposition table by state_key(), which
+    leaves out the absolute time, so a state reached again no sooner is
+    never expanded twice. Moves that empty a cleaner or drone battery are
+    dropped.
+
+    Without limits the search is exact. With time_limit or max_nodes it
+    becomes anytime: a heuristic dive gives a first plan, the best-first
+    search prunes against it, and the best plan found so far comes back
+    with optimal=False and the proven lower bound.
+    """
+
+    def __init__(self, sim: MapSimulation, time_limit: float = None, max_nodes: int = None, track_memory: bool = False):
+        self.sim = sim
+        self.time_limit = time_limit
+        self.max_nodes = max_nodes
+        self.track_memory = track_memory  # peak memory through tracemalloc, slows the search down
+
+    # ---- Bounds ----
+    def _running_ends(self, map_state: Map):
+        ends = {}
+        for c_idx, process in enumerate(map_state.cleaning_processes):
+            if isinstance(process, CleanWindowAction):
+                window_index = map_state.arrays.cleaner_on_window[c_idx]
+                if window_index != NO_INDEX:
+                    ends[int(window_index)] = process.end_time
+        return ends
+
+    def completion_time(self, map_state: Map):
+        """Time the map is finished without further drone actions, None if a dirty window has no process."""
+        arrays = map_state.arrays
+        ends = self._running_ends(map_state)
+        finish = map_state.time
+        for w in np.flatnonzero(arrays.window_state == WINDOW_DIRTY):
+            end = ends.get(int(w))
+            if end is None:
+                return None
+            finish = max(finish, end)
+        return finish
+
+    def lower_bound(self, map_state: Map) -> float:
+        arrays = map_state.arrays
+        now = map_state.time
+        ends = self._running_ends(map_state)
+        bound = max([now] + list(ends.values()))
+        dirty = np.flatnonzero(arrays.window_state == WINDOW_DIRTY)
+        waiting = np.array([w for w in dirty if int(w) not in ends], dtype=np.int64)
+        if len(waiting) == 0:
+            return bound
+        cleaning_time = arrays.window_cleaning_time[waiting]
+        # Windows that already have a cleaner on them only need the cleaning
+        occupied = np.isin(waiting, arrays.cleaner_on_window)
+        drone_location = map_state.topology.location_of(arrays.drone_pos[0])
+        if drone_location is not None:
+            flight = map_state.topology.distances(drone_location)[1 + waiting] / self.sim.drone_speed
+        else:
+            flight = np.linalg.norm(arrays.window_pos[waiting] - arrays.drone_pos[0], axis=1) / self.sim.drone_speed
+        reach = np.where(occupied, 0.0, flight + self.sim.pickup_drop_duration)
+        bound = max(bound, now + float(np.max(reach + cleaning_time)))
+        busy = sum(end - now for end in ends.values())
+        bound = max(bound, now + (busy + float(cleaning_time.sum())) / max(1, arrays.num_cleaners))
+        return bound
+
+    # ---- Transposition table ----
+    def state_key(self, map_state: Map) -> bytes:
+        """Everything that decides the future of a map, with times relative to map_state.time."""
+        arrays = map_state.arrays
+        now = map_state.time
+        topology = map_state.topology
+        drone_location = topology.location_of(arrays.drone_pos[0])
+        cleaner_locations = [topology.location_of(pos) for pos in arrays.cleaner_pos]
+        process = np.zeros((arrays.num_cleaners, 2), dtype=np.float64)
+        for c_idx, p in enumerate(map_state.cleaning_processes):
+            if p is not None:
+                process[c_idx] = (1.0 if isinstance(p, CleanWindowAction) else 2.0, round(p.end_time - now, 6))
+        suction = np.where(arrays.cleaner_suction_on | (arrays.cleaner_on_window != NO_INDEX),
+                           now - arrays.cleaner_last_update, 0.0)
+        parts = (
+            np.array([-1 if drone_location is None else drone_location, arrays.drone_load[0]], dtype=np.int64),
+            np.array([-1 if loc is None else loc for loc in cleaner_locations], dtype=np.int64),
+            arrays.cleaner_on_window.astype(np.int64),
+            arrays.window_state,
+            np.round(np.array([arrays.drone_battery[0]]), 6),
+            np.round(arrays.battery_levels(), 6),
+            np.round(suction, 6),
+            process,
+            arrays.cleaner_is_charging,
+        )
+        return b''.join(part.tobytes() for part in parts)
+
+    # ---- Search ----
+    def _children(self, node: _SearchNode):
+        sim = self.sim
+        table = sim.action_table(node.map)
+        for action_id in np.flatnonzero(sim.allowed_mask(node.map)[1:]) + 1:
+            child_map = sim.apply_action(table[int(action_id)], node.map)
+            arrays = child_map.arrays
+            if arrays.drone_battery[0] <= 0.0 or np.any(arrays.battery_levels() <= 0.0):
+                continue
+            yield _SearchNode(child_map, node, int(action_id))
+
+    def _greedy(self, root: _SearchNode, max_depth: int = 200):
+        """
+        First plan for anytime search: follow heuristic_action (mcts_planner.py),
+        or the child with the smallest bound where it has nothing to suggest.
+        """
+        sim = self.sim
+        node = root
+        for _ in range(max_depth):
+            finish = self.completion_time(node.map)
+            if finish is not None:
+                return node, finish
+            table = sim.action_table(node.map)
+            action = heuristic_action(node.map, table, sim.allowed_mask(node.map))
+            if action is not None:
+                child = _SearchNode(sim.apply_action(action, node.map), node, table.id_of(action))
+                arrays = child.map.arrays
+                if arrays.drone_battery[0] <= 0.0 or np.any(arrays.battery_levels() <= 0.0):
+                    return None, None
+            else:
+                child = min(self._children(node), key=lambda c: self.lower_bound(c.map), default=None)
+                if child is None:
+                    return None, None
+            node = child
+        return None, None
+
+    def search(self, map_state: Map) -> PlanResult:
+        with self.sim.speculation():
+            return self._search(map_state)
+
+    def _search(self, map_state: Map) -> PlanResult:
+        started = time.perf_counter()
+        deadline = None if self.time_limit is None else started + self.time_limit
+        if self.track_memory:
+            tracemalloc.start()
+        root = _SearchNode(map_state.copy())
+        incumbent, incumbent_time = None, np.inf
+        if deadline is not None or self.max_nodes is not None:
+            incumbent, incumbent_time = self._greedy(root)
+            if incumbent is None:
+                incumbent_time = np.inf
+
+        counter = itertools.count()
+        open_heap = [(self.lower_bound(root.map), -0.0, next(counter), root)]
+        best_time = {self.state_key(root.map): root.map.time}
+        expanded = 0
+        generated = 1
+        lower = open_heap[0][0]
+        optimal = False
+        while open_heap:
+            f, _, _, node = heapq.heappop(open_heap)
+            lower = f
+            if f >= incumbent_time:
+                optimal = True  # nothing left can beat the incumbent
+                break
+            finish = self.completion_time(node.map)
+            if finish is not None:
+                incumbent, incumbent_time = node, finish
+                optimal = True
+                break
+            key = self.state_key(node.map)
+            if best_time.get(key, np.inf) < node.map.time:
+                continue  # reached again sooner since it was queued
+            if (deadline is not None and time.perf_counter() > deadline) or (self.max_nodes is not None and expanded >= self.max_nodes):
+                break
+            expanded += 1
+            for child in self._children(node):
+                generated += 1
+                child_key = self.state_key(child.map)
+                if best_time.get(child_key, np.inf) <= child.map.time:
+                    continue
+                best_time[child_key] = child.map.time
+                finish = self.completion_time(child.map)
+                child_f = finish if finish is not None else self.lower_bound(child.map)
+                if child_f < incumbent_time:
+                    heapq.heappush(open_heap, (child_f, -child.map.time, next(counter), child))
+        else:
+            optimal = True  # searched everything, the incumbent (if any) is optimal
+            lower = incumbent_time
+
+        elapsed = time.perf_counter() - started
+        peak_memory = None
+        if self.track_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        stats = {
+            'expanded': expanded,
+            'generated': generated,
+            'table_size': len(best_time),
+            'open_size': len(open_heap),
+            'elapsed': elapsed,
+            'nodes_per_second': expanded / elapsed if elapsed > 0 else 0.0,
+            'peak_memory': peak_memory,
+        }
+        action_ids = []
+        node = incumbent
+        while node is not None and node.parent is not None:
+            action_ids.append(node.action_id)
+            node = node.parent
+        action_ids.reverse()
+        table = self.sim.action_table(map_state)
+        return PlanResult(
+            action_ids, [table[i] for i in action_ids],
+            None if incumbent is None else float(incumbent_time),
+            float(min(lower, incumbent_time)), optimal and incumbent is not None, stats,
+        )
@@ -0,0 +1,132 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from map import random_map_generater
+from map_simulation import MapSimulation
+from rl_agent import QLearningAgent
+
+
+class TransitionBatch:
+    """Transitions of one or more episodes as flat arrays, in the order they happened."""
+
+    def __init__(self, states, actions, rewards, next_states, dones, episode_rewards):
+        self.states = states
+        self.actions = actions
+        self.rewards = rewards
+        self.next_states = next_states
+        self.dones = dones
+        self.episode_rewards = episode_rewards  # total reward of each episode
+
+    def __len__(self):
+        return len(self.actions)
+
+    @classmethod
+    def from_lists(cls, states, actions, rewards, next_states, dones, episode_rewards):
+        return cls(
+            _key_array(states), np.array(actions, dtype=np.int32), np.array(rewards, dtype=np.float32),
+            _key_array(next_states), np.array(dones, dtype=bool), list(episode_rewards),
+        )
+
+    def apply(self, agent: QLearningAgent):
+        """Replay the transitions into agent with Q-learning updates."""
+        for state, action, reward, next_state, done in zip(
+                self.states.tolist(), self.actions.tolist(), self.rewards.tolist(),
+                self.next_states.tolist(), self.dones.tolist()):
+            agent.update(state, action, reward, next_state, done)
+
+
+def _key_array(keys):
+    # Integer state keys as int64 when they fit, Python ints otherwise
+    try:
+        return np.array(keys, dtype=np.int64)
+    except OverflowError:
+        array = np.empty(len(keys), dtype=object)
+        array[:] = keys
+        return array
+
+
+def run_episode(sim: MapSimulation, agent: QLearningAgent, max_steps: int, log: list):
+    """Play one episode on sim.map, appending (state, action, reward, next_state, done) to log."""
+    state = sim.get_state()
+    total_reward = 0
+    for _ in range(max_steps):
+        action = agent.select_action(state, sim.allowed_mask(sim.map))
+        next_state, reward, done, new_map = sim.rl_step(action, sim.map)
+        log.append((state, action, reward, next_state, done))
+        state = next_state
+        sim.map = new_map
+        total_reward += reward
+        if done:
+            break
+    return total_reward
+
+
+def rollout_worker(agent: QLearningAgent, seeds, num_cleaners: int, num_windows: int, max_steps: int) -> TransitionBatch:
+    """
+    Play one episode per seed with a read-only copy of the agent. Each
+    episode seeds random and np.random, which random_map_generater and
+    the simulation draw from, so the result only depends on the seed.
+    """
+    log = []
+    episode_rewards = []
+    for seed in seeds:
+        random.seed(seed)
+        np.random.seed(seed)
+        sim = MapSimulation(random_map_generater(num_cleaners, num_windows))
+        episode_rewards.append(run_episode(sim, agent, max_steps, log))
+    return TransitionBatch.from_lists(*(zip(*log) if log else ([], [], [], [], [])), episode_rewards)
+
+
+class ParallelRollouts:
+    """
+    Plays training episodes in worker processes.
+
+    Every collect() sends each worker a snapshot of the agent (its Q-table
+    is a few numpy arrays, so this is one pickle per worker) and a slice of
+    the episode seeds, drawn from one SeedSequence so runs are
+    reproducible. The workers send back TransitionBatches, which train()
+    replays into the agent in the main process.
+    """
+
+    def __init__(self, num_cleaners: int, num_windows: int, workers: int = None, max_steps: int = 100, seed: int = 0):
+        self.num_cleaners = num_cleaners
+        self.num_windows = num_windows
+        self.max_steps = max_steps
+        self.seeds = np.random.SeedSequence(seed)
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.pool.shutdown()
+
+    def collect(self, agent: QLearningAgent, episodes: int) -> list[TransitionBatch]:
+        """Play episodes with the current agent, split over the workers."""
+        seeds = [int(child.generate_state(1)[0]) for child in self.seeds.spawn(episodes)]
+        chunks = [seeds[i::self.workers] for i in range(self.workers) if seeds[i::self.workers]]
+        futures = [
+            self.pool.submit(rollout_worker, agent, chunk, self.num_cleaners, self.num_windows, self.max_steps)
+            for chunk in chunks
+        ]
+        return [future.result() for future in futures]
+
+    def train(self, agent: QLearningAgent, episodes: int, episodes_per_round: int = None) -> list:
+        """
+        Train agent for a number of episodes, episodes_per_round (default
+        one per worker) at a time. Returns the total reward of every episode.
+        """
+        if episodes_per_round is None:
+            episodes_per_round = self.workers
+        episode_rewards = []
+        while len(episode_rewards) < episodes:
+            n = min(episodes_per_round, episodes - len(episode_rewards))
+            for batch in self.collect(agent, n):
+                batch.apply(agent)
+                episode_rewards.extend(batch.episode_rewards)
+        return episode_rewards
@@ -0,0 +1,96 @@
+import contextlib
+import json
+import time
+
+
+class ActionProfiler:
+    """
+    Call counts and wall time of MapSimulation.apply_action, per drone
+    action class and per phase, enabled by setting sim.profiler to one
+    (and disabled again with sim.profiler = None).
+
+    The phases of one application are, in order:
+
+        cache               transition cache lookup (only with a TransitionCache)
+        run                 MapAction.run
+        cleaner_actions     looking up the cleaner actions in the ActionTable
+        cleaner_allowed     cleaner_allowed_mask, choosing and starting processes
+        cleaning_processes  Map.update_cleaning_processes
+        update_states       Map.update_states
+        total               the whole apply_action
+
+    An application is speculative when it runs inside a transaction (the
+    advance_allowedv2 lookahead, planner rollouts) or inside speculation(),
+    which the planners use for their search, otherwise committed.
+    """
+
+    PHASES = ('cache', 'run', 'cleaner_actions', 'cleaner_allowed', 'cleaning_processes', 'update_states', 'total')
+
+    def __init__(self):
+        self.stats = {}  # (action class, phase, speculative) -> [count, total seconds, max seconds]
+        self._speculating = 0
+
+    def reset(self):
+        self.stats.clear()
+
+    @contextlib.contextmanager
+    def speculation(self):
+        """Count the applications inside the block as speculative."""
+        self._speculating += 1
+        try:
+            yield self
+        finally:
+            self._speculating -= 1
+
+    def add(self, action_name: str, phase: str, speculative: bool, seconds: float):
+        stat = self.stats.get((action_name, phase, speculative))
+        if stat is None:
+            self.stats[(action_name, phase, speculative)] = [1, seconds, seconds]
+        else:
+            stat[0] += 1
+            stat[1] += seconds
+            if seconds > stat[2]:
+                stat[2] = seconds
+
+    def profile_apply(self, sim, action, map_state, drone_only: bool, in_place: bool):
+        """Run sim._apply_action with a clock between the phases."""
+        speculative = self._speculating > 0 or map_state.arrays.journal is not None
+        name = type(action).__name__
+        clock = time.perf_counter
+        started = clock()
+        last = started
+
+        def phase(phase_name):
+            nonlocal last
+            now = clock()
+            self.add(name, phase_name, speculative, now - last)
+            last = now
+
+        result = sim._apply_action(action, map_state, drone_only, in_place, phase)
+        self.add(name, 'total', speculative, clock() - started)
+        return result
+
+    # ---- Reports ----
+    def rows(self) -> list:
+        """One dict per (action class, phase, mode), slowest total first."""
+        rows = [
+            {
+                'action': action_name, 'phase': phase, 'mode': 'speculative' if speculative else 'committed',
+                'count': count, 'total_ms': total * 1e3, 'mean_us': total / count * 1e6, 'max_us': longest * 1e6,
+            }
+            for (action_name, phase, speculative), (count, total, longest) in self.stats.items()
+        ]
+        rows.sort(key=lambda row: (row['phase'] != 'total', -row['total_ms']))
+        return rows
+
+    def table(self) -> str:
+        lines = [f"{'action':<30} {'phase':<19} {'mode':<12} {'count':>8} {'total ms':>10} {'mean us':>10} {'max us':>10}"]
+        for row in self.rows():
+            lines.append(f"{row['action']:<30} {row['phase']:<19} {row['mode']:<12} {row['count']:>8} "
+                         f"{row['total_ms']:>10.2f} {row['mean_us']:>10.1f} {row['max_us']:>10.1f}")
+        return '\n'.join(lines)
+
+    def dump(self, path: str):
+        """Write rows() as JSON."""
+        with open(path, 'w') as f:
+            json.dump(self.rows(), f, indent=2)
@@ -0,0 +1,146 @@
+import numpy as np
+
+_EMPTY = -1
+_FIB = 0x9E3779B97F4A7C15  # Fibonacci hashing multiplier
+_MASK64 = (1 << 64) - 1
+_INT64_MAX = (1 << 63) - 1
+
+
+class QTable:
+    """
+    Q-values of integer states (see StateEncoder) in one (capacity, n_actions)
+    float32 matrix.
+
+    States are found through an open addressing index: slots holds the row
+    of each state (linear probing, at most half full) and keys / visits the
+    state and visit count of each row. The matrix doubles when it is full.
+    With max_states set it never grows past that, instead the
+    evict_fraction least visited states are dropped to make room.
+
+    Looking a state up never allocates, a state that was never updated reads
+    as the shared all-zero row.
+    """
+
+    def __init__(self, n_actions: int, capacity: int = 1024, max_states: int = None, evict_fraction: float = 0.125):
+        self.n_actions = n_actions
+        self.max_states = max_states
+        self.evict_fraction = evict_fraction
+        if max_states is not None:
+            capacity = min(capacity, max_states)
+        self.values = np.zeros((capacity, n_actions), dtype=np.float32)
+        self.keys = np.zeros(capacity, dtype=np.int64)
+        self.visits = np.zeros(capacity, dtype=np.int64)
+        self.zeros = np.zeros(n_actions, dtype=np.float32)  # read by states that are not in the table
+        self.size = 0
+        self._free = []  # rows freed by eviction
+        self._make_slots(capacity)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, state):
+        return self.find(state) != _EMPTY
+
+    @property
+    def capacity(self):
+        return len(self.values)
+
+    # ---- Index ----
+    def _make_slots(self, capacity: int):
+        self._slot_bits = max(1, int(2 * capacity - 1).bit_length())
+        self._slot_mask = (1 << self._slot_bits) - 1
+        self.slots = np.full(1 << self._slot_bits, _EMPTY, dtype=np.int64)
+
+    def _slot(self, state) -> int:
+        return ((hash(state) * _FIB) & _MASK64) >> (64 - self._slot_bits)
+
+    def find(self, state) -> int:
+        """Row of state, -1 if it is not in the table."""
+        slots = self.slots
+        keys = self.keys
+        mask = self._slot_mask
+        i = self._slot(state)
+        while True:
+            row = slots[i]
+            if row == _EMPTY or keys[row] == state:
+                return int(row)
+            i = (i + 1) & mask
+
+    def row(self, state) -> int:
+        """Row of state, inserting a zero row for a new state."""
+        slots = self.slots
+        keys = self.keys
+        mask = self._slot_mask
+        i = self._slot(state)
+        while True:
+            row = slots[i]
+            if row == _EMPTY:
+                return self._insert(state, i)
+            if keys[row] == state:
+                return int(row)
+            i = (i + 1) & mask
+
+    def _insert(self, state, slot: int) -> int:
+        if not self._free and self.size == self.capacity:
+            if self.max_states is not None and self.capacity >= self.max_states:
+                self._evict()
+            else:
+                self._grow()
+            return self.row(state)
+        if (state > _INT64_MAX or state < -_INT64_MAX) and self.keys.dtype != object:
+            # Wider than 64 bits, keep the keys as Python ints from now on
+            self.keys = self.keys.astype(object)
+        row = self._free.pop() if self._free else self.size
+        self.keys[row] = state
+        self.visits[row] = 0
+        self.values[row] = 0.0
+        self.slots[slot] = row
+        self.size += 1
+        return row
+
+    def _rebuild_slots(self, rows):
+        self._make_slots(self.capacity)
+        slots = self.slots
+        keys = self.keys
+        mask = self._slot_mask
+        for row in rows:
+            i = self._slot(keys[row])
+            while slots[i] != _EMPTY:
+                i = (i + 1) & mask
+            slots[i] = row
+
+    def _grow(self):
+        capacity = self.capacity * 2
+        if self.max_states is not None:
+            capacity = min(capacity, self.max_states)
+        values = np.zeros((capacity, self.n_actions), dtype=np.float32)
+        values[:self.size] = self.values
+        keys = np.zeros(capacity, dtype=self.keys.dtype)
+        keys[:self.size] = self.keys
+        visits = np.zeros(capacity, dtype=np.int64)
+        visits[:self.size] = self.visits
+        self.values, self.keys, self.visits = values, keys, visits
+        self._rebuild_slots(range(self.size))
+
+    def _evict(self):
+        n_evict = max(1, int(self.capacity * self.evict_fraction))
+        evicted = np.argpartition(self.visits, n_evict - 1)[:n_evict]
+        keep = np.ones(self.capacity, dtype=bool)
+        keep[evicted] = False
+        self._free = evicted.tolist()
+        self.size -= n_evict
+        self._rebuild_slots(np.flatnonzero(keep).tolist())
+
+    # ---- Values ----
+    def get(self, state) -> np.ndarray:
+        """Q-values of state, the shared zero row if it is not in the table (do not write to it)."""
+        row = self.find(state)
+        if row == _EMPTY:
+            return self.zeros
+        return self.values[row]
+
+    def max_value(self, state) -> float:
+        row = self.find(state)
+        if row == _EMPTY:
+            return 0.0
+        return float(self.values[row].max())
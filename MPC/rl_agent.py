@@ -1,36 +1,54 @@
 import numpy as np
 import random
 from map_simulation import MapSimulation
+from q_table import QTable
 
 class QLearningAgent:
-    def __init__(self, n_actions, alpha=0.1, gamma=0.99, epsilon=0.1):
-        self.q_table = {}
+    def __init__(self, n_actions, alpha=0.1, gamma=0.99, epsilon=0.1, capacity=1024, max_states=None):
+        # States are integer keys (MapSimulation.get_state), max_states bounds the table, see QTable
+        self.q_table = QTable(n_actions, capacity=capacity, max_states=max_states)
         self.n_actions = n_actions
         self.alpha = alpha
         self.gamma = gamma
         self.epsilon = epsilon
+        self._masked_qs = np.empty(n_actions, dtype=np.float32)
 
     def get_qs(self, state):
-        if state not in self.q_table:
-            self.q_table[state] = np.zeros(self.n_actions)
-        return self.q_table[state]
+        # row() may grow the table and replace the matrix, look it up first
+        row = self.q_table.row(state)
+        return self.q_table.values[row]
 
-    def select_action(self, state):
+    def select_action(self, state, mask=None):
+        # mask: optional bool array from MapSimulation.allowed_mask, only those actions are chosen
+        if mask is None:
+            if random.random() < self.epsilon:
+                return random.randint(0, self.n_actions - 1)
+            return int(np.argmax(self.q_table.get(state)))
+        if not mask.any():
+            return 0
         if random.random() < self.epsilon:
-            return random.randint(0, self.n_actions - 1)
-        qs = self.get_qs(state)
-        return int(np.argmax(qs))
+            # Uniform over the allowed actions without building the list of them
+            while True:
+                action = random.randrange(self.n_actions)
+                if mask[action]:
+                    return action
+        masked_qs = self._masked_qs
+        masked_qs.fill(-np.inf)
+        np.copyto(masked_qs, self.q_table.get(state), where=mask)
+        return int(np.argmax(masked_qs))
 
     def update(self, state, action, reward, next_state, done):
-        qs = self.get_qs(state)
-        next_qs = self.get_qs(next_state)
-        target = reward + (0 if done else self.gamma * np.max(next_qs))
+        target = reward + (0 if done else self.gamma * self.q_table.max_value(next_state))
+        table = self.q_table
+        row = table.row(state)
+        table.visits[row] += 1
+        qs = table.values[row]
         qs[action] += self.alpha * (target - qs[action])
 
 # Example usage (to be integrated with MapSimulation):
 # sim = MapSimulation(...)
 # agent = QLearningAgent(n_actions=10)
 # state = sim.get_state()
-# action = agent.select_action(state)
+# action = agent.select_action(state, sim.allowed_mask(sim.map))
 # next_state, reward, done, _ = sim.rl_step(action)
 # agent.update(state, action, reward, next_state, done)
@@ -1,14 +1,19 @@
 from map import Map,random_map_generater
 import matplotlib.pyplot as plt
 from actions import *
+import heapq
+import itertools
 import random
 import time
+from events import EventStream, QUIET, EVENTS, ACTION_STARTED, ACTION_DONE, WINDOW_CLEANED
 class simulation:
     def __init__(self, map: Map , sleep_time=0.1 , real_time = False):
 
         self.real_time = real_time
         self.sleep_time = sleep_time
         self.map = map
+        self.events = EventStream(verbosity=QUIET)  # see events.py
+        self.recorder = None  # optional TrajectoryRecorder (trajectory.py), run_in_time() records every tick
         self.time = 0.0  # simulation time
         self.curent_actions_drone_action = null_action(self.map.drone)  # list of ongoing actions
         self.clener_actions = [null_action(cleaner) for cleaner in self.map.cleaners]
@@ -33,24 +38,103 @@ class simulation:
         self.creat_all_actions()
         self.update_alowed_actions()
     
-    def update_alowed_actions(self):
-        self.alowed_drone_actions = []
-        self.alowed_clener_actions = []
-        for action_list in self.all_clener_actions:
-            allowed_actions_for_cleaner = []
+    @property
+    def events(self):
+        return self._events
 
+    @events.setter
+    def events(self, stream: EventStream):
+        # The clean_window actions report to the stream too, hand them the new one
+        self._events = stream
+        for action_list in getattr(self, 'all_clener_actions', []):
             for action in action_list:
-                if action.is_alowed():
-                    allowed_actions_for_cleaner.append(action)
-            self.alowed_clener_actions.append(allowed_actions_for_cleaner)
+                if isinstance(action, clean_window):
+                    action.events = stream
 
-        for action in self.all_drone_actions:
-            if action.is_alowed() == True:
-                self.alowed_drone_actions.append(action)
+    def update_alowed_actions(self):
+        # Full re-check of every action, update_dirty_actions() only re-checks what changed
+        self._drone_alowed = [action.is_alowed() == True for action in self.all_drone_actions]
+        self._clener_alowed = [[bool(action.is_alowed()) for action in action_list] for action_list in self.all_clener_actions]
+        self._collect_alowed_actions()
+        drone = self.map.drone
+        self._drone_key = (drone.ucupied, int(self.map.arrays.drone_load[0]))
+        self._drone_location = drone.pos3d.tobytes()
+        self._clear_dirty()
+
+    def _collect_alowed_actions(self):
+        self.alowed_drone_actions = [action for action, alowed in zip(self.all_drone_actions, self._drone_alowed) if alowed]
+        self.alowed_clener_actions = [
+            [action for action, alowed in zip(action_list, alowed_list) if alowed]
+            for action_list, alowed_list in zip(self.all_clener_actions, self._clener_alowed)
+        ]
+
+    def _clear_dirty(self):
+        arrays = self.map.arrays
+        arrays.drone_dirty[:] = False
+        arrays.cleaner_dirty[:] = False
+        arrays.window_dirty[:] = False
+
+    def update_dirty_actions(self):
+        """
+        Keep the allowed actions up to date without rebuilding them every tick.
+
+        The drone, cleaners and windows flag themselves dirty in the map
+        arrays when they change. Only the actions that depend on a dirty
+        entity are checked again, and the drone's per-window actions only when
+        it starts or stops being occupied, picks up or drops a load, or
+        arrives at / leaves a window.
+        """
+        arrays = self.map.arrays
+        drone_checks = set()
+        dirty_cleaners = set(np.flatnonzero(arrays.cleaner_dirty).tolist())
+
+        if arrays.drone_dirty[0]:
+            drone = self.map.drone
+            drone_checks.update(self._drone_only_action_ids)
+            key = (drone.ucupied, int(arrays.drone_load[0]))
+            location = drone.pos3d.tobytes()
+            if key != self._drone_key:
+                drone_checks.update(range(len(self.all_drone_actions)))
+            elif location != self._drone_location:
+                for w_idx in self._windows_at.get(self._drone_location, []) + self._windows_at.get(location, []):
+                    drone_checks.update(self._window_action_ids[w_idx])
+                for action_ids in self._cleaner_action_ids:
+                    drone_checks.update(action_ids)
+            self._drone_key = key
+            self._drone_location = location
+
+        dirty_windows = np.flatnonzero(arrays.window_dirty)
+        if len(dirty_windows):
+            for w_idx in dirty_windows.tolist():
+                drone_checks.update(self._window_action_ids[w_idx])
+            # Cleaning depends on the state of the window the cleaner is on
+            on_dirty_window = np.isin(arrays.cleaner_on_window, dirty_windows)
+            dirty_cleaners.update(np.flatnonzero(on_dirty_window).tolist())
+
+        for c_idx in dirty_cleaners:
+            drone_checks.update(self._cleaner_action_ids[c_idx])
+            self.all_clener_actions[c_idx] = self._creat_clener_actions(self.map.cleaners[c_idx])
+            self._clener_alowed[c_idx] = [bool(action.is_alowed()) for action in self.all_clener_actions[c_idx]]
+
+        changed = bool(dirty_cleaners)
+        for action_id in drone_checks:
+            alowed = self.all_drone_actions[action_id].is_alowed() == True
+            if alowed != self._drone_alowed[action_id]:
+                self._drone_alowed[action_id] = alowed
+                changed = True
+        if changed:
+            self._collect_alowed_actions()
+        self._clear_dirty()
+
+    def _creat_clener_actions(self, cleaner):
+        return [
+            null_action(cleaner),
+            charge_cleaner(cleaner=cleaner, base_station=self.map.base_station, charge_rate=self.charging_rate_cleaner),
+            clean_window(cleaner=cleaner, power_consumption=self.cleaning_power_consumption, events=self.events),
+        ]
 
     def creat_all_actions(self):
         self.all_drone_actions = [null_action(self.map.drone)]
-        self.all_clener_actions = [[null_action(cleaner)] for cleaner in self.map.cleaners]
         # Create charge_drone action
         charge_drone_action = charge_drone(drone=self.map.drone, base_station=self.map.base_station, charge_rate=self.charging_rate_drone)
         self.all_drone_actions.append(charge_drone_action)
@@ -62,46 +146,77 @@ class simulation:
 
         dropoff_clean_at_base_action = dropoff_clean_at_base(drone=self.map.drone, base_station=self.map.base_station, power_consumption=self.dropof_pickup_comsumption, drop_duration=self.pickup_dropoff_duration)
         self.all_drone_actions.append(dropoff_clean_at_base_action)     
+        self._drone_only_action_ids = range(len(self.all_drone_actions))
 
-        # Create charge_cleaner actions for each cleaner
-        for i, cleaner in enumerate(self.map.cleaners):
-            charge_cleaner_action = charge_cleaner(cleaner=cleaner, base_station=self.map.base_station, charge_rate=self.charging_rate_cleaner)
-            self.all_clener_actions[i].append(charge_cleaner_action)
-
-        # Create clean_window actions for each cleaner
-        for i, cleaner in enumerate(self.map.cleaners):
-            clean_window_action = clean_window(cleaner=cleaner, power_consumption=self.cleaning_power_consumption)
-            self.all_clener_actions[i].append(clean_window_action)
+        # Create null, charge_cleaner and clean_window actions for each cleaner
+        self.all_clener_actions = [self._creat_clener_actions(cleaner) for cleaner in self.map.cleaners]
 
         #creat fly_to_window actions for each window
-        for window in self.map.windows:
+        self._window_action_ids = []
+        self._windows_at = {}  # position bytes -> indices of the windows there
+        for w_idx, window in enumerate(self.map.windows):
             fly_to_window_action = fly_to_window(drone=self.map.drone, window=window, speed=self.drone_speed, power_consumption=self.flying_power_consumption)
             self.all_drone_actions.append(fly_to_window_action)
            
             dropoff_cleaner_action = dropoff_cleaner(drone=self.map.drone, window=window, power_consumption=self.dropof_pickup_comsumption, drop_duration=self.pickup_dropoff_duration)
             self.all_drone_actions.append(dropoff_cleaner_action)
+            self._window_action_ids.append((len(self.all_drone_actions) - 2, len(self.all_drone_actions) - 1))
+            self._windows_at.setdefault(window.pos3d.tobytes(), []).append(w_idx)
 
         
         #creat pickup_cleaner and dropoff_cleaner actions for each cleaner
+        self._cleaner_action_ids = []
         for cleaner in self.map.cleaners:
             pickup_cleaner_action = pickup_cleaner(drone=self.map.drone, cleaner=cleaner ,power_consumption=self.dropof_pickup_comsumption , pickup_duration=self.pickup_dropoff_duration)
             self.all_drone_actions.append(pickup_cleaner_action)
 
             pickup_clean_at_base_action = pickup_clean_at_base(cleaner=cleaner, drone=self.map.drone, base_station=self.map.base_station, power_consumption=self.dropof_pickup_comsumption, pickup_duration=self.pickup_dropoff_duration)
             self.all_drone_actions.append(pickup_clean_at_base_action)
+            self._cleaner_action_ids.append((len(self.all_drone_actions) - 2, len(self.all_drone_actions) - 1))
+        self._drone_action_index = {id(action): i for i, action in enumerate(self.all_drone_actions)}  # id() -> recorded action id
 
 
 
     def step(self, dt: float):
         self.time += dt
         self.map.time = self.time
+        events = self.events.wants(EVENTS)
+        if events:
+            batteries = [self.map.drone.battery_level] + [cleaner.battery_level for cleaner in self.map.cleaners]
+            # The drop off actions forget their cleaner when done, name the action before
+            label = str(self.curent_actions_drone_action)
         
         if self.curent_actions_drone_action.step_action(self.time, dt):
+            if events:
+                self._emit_done(self.curent_actions_drone_action, label)
             self.curent_actions_drone_action = null_action(self.map.drone)
 
         for action in self.clener_actions:
             if action.step_action(self.time, dt):
+                # A finished cleaner action stays in clener_actions, report only the tick it finished in
+                if events and self.time - dt < action.end_time:
+                    self._emit_done(action)
                 action = null_action(action.target)
+
+        if events:
+            self.events.battery(self.time, 'drone', batteries[0], self.map.drone.battery_level)
+            for cleaner, before in zip(self.map.cleaners, batteries[1:]):
+                self.events.battery(self.time, f'cleaner {cleaner.name}', before, cleaner.battery_level)
+
+    @staticmethod
+    def _source(action: actions) -> str:
+        return f'cleaner {action.target.name}' if isinstance(action.target, Robot_cleaner) else 'drone'
+
+    def _emit_started(self, action: actions):
+        if not isinstance(action, null_action):
+            self.events.emit(ACTION_STARTED, self.time, self._source(action), action=str(action))
+
+    def _emit_done(self, action: actions, label: str = None):
+        if isinstance(action, null_action):
+            return
+        self.events.emit(ACTION_DONE, self.time, self._source(action), action=label if label is not None else str(action))
+        if isinstance(action, clean_window) and action.window is not None:
+            self.events.emit(WINDOW_CLEANED, self.time, f'window {action.window.name}')
             
 
 
@@ -110,8 +225,11 @@ class simulation:
         if isinstance(action, null_action):
             return True
         elif action in self.alowed_drone_actions:
+            action.refresh()
             self.curent_actions_drone_action = action
             action.set_start_time(self.time)
+            if self.events.wants(EVENTS):
+                self._emit_started(action)
             return True
     
     def update_clener_action(self,  actions: list[actions]):
@@ -120,25 +238,47 @@ class simulation:
             if isinstance(action, null_action):
                 continue
             if action in self.alowed_clener_actions[i]:
+                action.refresh()
                 self.clener_actions[i] = action
                 action.set_start_time(self.time)
+                if self.events.wants(EVENTS):
+                    self._emit_started(action)
                 return True
     
-    def run_in_time(self, run_time: float):
+    def run_in_time(self, run_time: float, verbosity: int = None):
+        """Tick by dt until run_time, verbosity overrides self.events for this run."""
+        previous = self.events.verbosity
+        if verbosity is not None:
+            self.events.verbosity = verbosity
+        try:
+            self._run_in_time(run_time)
+        finally:
+            self.events.verbosity = previous
+            self.events.flush()
+            if self.recorder is not None:
+                self.recorder.flush()
+
+    def _record(self):
+        # Null actions are made fresh, they and anything else unknown record as 0
+        self.recorder.record(self.map, self._drone_action_index.get(id(self.curent_actions_drone_action), 0))
+
+    def _run_in_time(self, run_time: float):
+        if self.recorder is not None and self.recorder.rows == 0:
+            self._record()
         while self.time < run_time:
             #self.visualize()
             #print(f"Simulation time: {self.time:.2f} seconds")
-            print(f"active drone action: {self.curent_actions_drone_action}")
             #print("alowed drone actions: ", ", ".join([cls.__str__() for cls in self.alowed_drone_actions]))
             #print("-----------------------------")
             self.step(self.dt)
-            self.creat_all_actions()
-            self.update_alowed_actions()
+            self.update_dirty_actions()
         
             drone_action=self.chose_drone_action()
             cleaner_actions=self.chose_clener_action()
             self.update_drone_action(drone_action)
             self.update_clener_action(cleaner_actions)
+            if self.recorder is not None:
+                self._record()
             if self.real_time:
                 time.sleep(self.dt)
             else:
@@ -147,6 +287,84 @@ class simulation:
             #input("Press Enter to continue to next step...")
             #print(len(self.map.cleaners))
 
+    def run_events(self, run_time: float):
+        """
+        Event-driven alternative to run_in_time.
+
+        Instead of stepping every dt, time jumps straight to the next end_time
+        of a running action (kept in a heap). Battery use and movement are
+        linear in time, so they are applied over the whole skipped interval at
+        once. New actions are chosen only when the drone or a cleaner becomes
+        idle: a random non-null action for the drone (like chose_drone_action)
+        and clean > charge for the cleaners. Actions that would take no time,
+        like return_to_base while at the base, do nothing and are skipped. The
+        run stops early if nothing is running and nothing can be started.
+        """
+        events = []  # (end_time, seq, who), who is -1 for the drone or the cleaner index
+        order = itertools.count()
+        running = {}  # who -> running action
+        self.update_alowed_actions()
+        while self.time < run_time:
+            self._start_idle_actions(running, events, order)
+            if not events:
+                break
+            next_time = min(events[0][0], float(run_time))
+            for action in running.values():
+                action.aplay_action_power_in_deltat(next_time - self.time)
+                action.aplay_action_movment(next_time - self.time)
+            if self.real_time:
+                time.sleep(next_time - self.time)
+            else:
+                time.sleep(self.sleep_time)
+            self.time = next_time
+            self.map.time = self.time
+            while events and events[0][0] <= self.time:
+                _, _, who = heapq.heappop(events)
+                self._finish_action(running, who)
+
+    def _finish_action(self, running, who):
+        action = running.pop(who)
+        label = str(action) if self.events.wants(EVENTS) else None
+        action.when_done()
+        if label is not None:
+            self._emit_done(action, label)
+        if who == -1:
+            self.curent_actions_drone_action = null_action(self.map.drone)
+        else:
+            self.clener_actions[who] = null_action(self.map.cleaners[who])
+
+    def _start_idle_actions(self, running, events, order):
+        self.update_dirty_actions()
+        started = []
+        if -1 not in running:
+            candidates = self.alowed_drone_actions[1:]
+            while candidates:
+                action = random.choice(candidates)
+                action.refresh()
+                if action.duration > 0:
+                    self.curent_actions_drone_action = action
+                    started.append((-1, action))
+                    break
+                candidates = [a for a in candidates if a is not action]
+        for i, allowed_actions in enumerate(self.alowed_clener_actions):
+            if i in running:
+                continue
+            for action_type in (clean_window, charge_cleaner):
+                action = next((a for a in allowed_actions if isinstance(a, action_type)), None)
+                if action is not None:
+                    action.refresh()
+                    if action.duration > 0:
+                        self.clener_actions[i] = action
+                        started.append((i, action))
+                        break
+        for who, action in started:
+            action.set_start_time(self.time)
+            action.when_start()
+            if self.events.wants(EVENTS):
+                self._emit_started(action)
+            running[who] = action
+            heapq.heappush(events, (action.end_time, next(order), who))
+
     def chose_drone_action(self) -> actions:
         # 90% chance to choose the first allowed action, else random
         if isinstance(self.curent_actions_drone_action, null_action):
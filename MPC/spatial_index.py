@@ -0,0 +1,163 @@
+import numpy as np
+
+
+class WindowGrid:
+    """
+    Uniform grid over the window positions for nearest and radius queries
+    restricted to dirty windows.
+
+    Windows are bucketed by cell and stored cell by cell (order, starts),
+    next to a count of dirty windows per cell. A query walks the cells in
+    rings around the query point, skips cells without dirty windows and
+    stops once no unvisited cell can hold anything closer, so on a large
+    facade it only looks at the windows around the point.
+
+    The dirty flags are kept incrementally: set_dirty() flips one window and
+    sync() brings the grid to the dirty windows of a map, touching only the
+    windows that changed. The grid is shared by all copies of a map through
+    MapTopology.window_grid, so Map.nearest_dirty_windows() and
+    Map.dirty_windows_within() sync to their map before every query.
+    """
+
+    def __init__(self, window_pos: np.ndarray, per_cell: float = 8.0):
+        self.window_pos = window_pos
+        num_windows = len(window_pos)
+        if num_windows == 0:
+            self.origin = np.zeros(3)
+            extent = np.zeros(3)
+        else:
+            self.origin = window_pos.min(axis=0)
+            extent = window_pos.max(axis=0) - self.origin
+        # Cells of per_cell windows on average over the axes the windows spread along,
+        # axes thinner than a cell (a flat facade) do not count
+        self.cell_size = 1.0
+        spread = extent[extent > 0.0]
+        for _ in range(3):
+            if len(spread) == 0:
+                break
+            self.cell_size = float((np.prod(spread) * per_cell / max(1, num_windows)) ** (1.0 / len(spread)))
+            spread = extent[extent >= self.cell_size]
+        self.shape = (extent // self.cell_size).astype(np.int64) + 1
+        cells = self._cells_of(window_pos)
+        self.window_cell = np.ravel_multi_index(cells.T, self.shape) if num_windows else np.zeros(0, dtype=np.int64)
+        self.order = np.argsort(self.window_cell, kind='stable')
+        num_cells = int(np.prod(self.shape))
+        self.starts = np.searchsorted(self.window_cell[self.order], np.arange(num_cells + 1))
+        self.strides = np.array([self.shape[1] * self.shape[2], self.shape[2], 1], dtype=np.int64)
+        self._shells = {}  # radius -> cell offsets, see _shell()
+        self.dirty = np.ones(num_windows, dtype=bool)
+        self.cell_dirty = np.bincount(self.window_cell, minlength=num_cells)
+        self.num_dirty = num_windows
+        # Cells a nearest() query walks before it falls back to checking every dirty window
+        self.max_cells = max(27, num_cells // 64)
+
+    def _cells_of(self, pos) -> np.ndarray:
+        cells = np.floor((np.asarray(pos) - self.origin) / self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, self.shape - 1)
+
+    # ---- Dirty flags ----
+    def set_dirty(self, window_index: int, dirty: bool):
+        if self.dirty[window_index] != dirty:
+            self.dirty[window_index] = dirty
+            self.cell_dirty[self.window_cell[window_index]] += 1 if dirty else -1
+            self.num_dirty += 1 if dirty else -1
+
+    def sync(self, dirty: np.ndarray):
+        """Take over a (num_windows,) bool array of dirty windows, e.g. window_state == WINDOW_DIRTY."""
+        changed = np.flatnonzero(dirty != self.dirty)
+        if len(changed):
+            self.dirty[changed] = dirty[changed]
+            delta = np.where(dirty[changed], 1, -1)
+            np.add.at(self.cell_dirty, self.window_cell[changed], delta)
+            self.num_dirty += int(delta.sum())
+
+    # ---- Queries ----
+    def _shell(self, radius: int) -> np.ndarray:
+        # Cell offsets at Chebyshev distance radius, only along the axes the grid has more than one cell on
+        shell = self._shells.get(radius)
+        if shell is None:
+            axes = [np.arange(-radius, radius + 1) if n > 1 else np.zeros(1, dtype=np.int64) for n in self.shape]
+            offsets = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+            shell = offsets[np.abs(offsets).max(axis=1) == radius]
+            self._shells[radius] = shell
+        return shell
+
+    def _ring(self, center, radius: int) -> np.ndarray:
+        # Flat indices of the cells at Chebyshev distance radius from center that are in the grid
+        cells = center + self._shell(radius)
+        inside = np.all((cells >= 0) & (cells < self.shape), axis=1)
+        return cells[inside] @ self.strides
+
+    def _windows_in(self, cells, mask) -> np.ndarray:
+        cells = cells[self.cell_dirty[cells] > 0]
+        if len(cells) == 0:
+            return np.zeros(0, dtype=np.int64)
+        windows = np.concatenate([self.order[self.starts[c]:self.starts[c + 1]] for c in cells])
+        keep = self.dirty[windows]
+        if mask is not None:
+            keep &= mask[windows]
+        return windows[keep]
+
+    def _sorted(self, point, windows, k=None):
+        # The k closest of windows (all if k is None), closest first and ties by index
+        distances = np.linalg.norm(self.window_pos[windows] - point, axis=1)
+        if k is not None and k < len(windows):
+            kth = np.partition(distances, k - 1)[k - 1]
+            close = distances <= kth
+            windows, distances = windows[close], distances[close]
+        order = np.lexsort((windows, distances))[:k]
+        return windows[order], distances[order]
+
+    def nearest(self, point, k: int = 1, mask: np.ndarray = None):
+        """
+        (window indices, distances) of the k dirty windows closest to point,
+        closest first. mask is an optional (num_windows,) bool array the
+        windows must also be True in.
+        """
+        point = np.asarray(point, dtype=np.float64)
+        if self.num_dirty <= self.max_cells:
+            return self._brute_force(point, k, mask)
+        center = self._cells_of(point)
+        max_radius = int(np.max(np.maximum(center, self.shape - 1 - center)))
+        # Distance from point to the box around the windows, per axis
+        gap = np.maximum(self.origin - point, 0.0) + np.maximum(point - self.origin - self.shape * self.cell_size, 0.0)
+        found = []
+        count = 0
+        visited = 0
+        for radius in range(max_radius + 1):
+            if visited > self.max_cells:
+                # Few dirty windows left nearby, one pass over all of them is cheaper than more rings
+                return self._brute_force(point, k, mask)
+            cells = self._ring(center, radius)
+            visited += len(cells)
+            windows = self._windows_in(cells, mask)
+            if len(windows):
+                found.append(windows)
+                count += len(windows)
+            if count >= k:
+                windows = np.concatenate(found)
+                found = [windows]
+                distances = np.linalg.norm(self.window_pos[windows] - point, axis=1)
+                # Windows in cells further out are at least radius cells away along some axis
+                along = np.maximum(gap, radius * self.cell_size)
+                bound = np.sqrt(np.min(along ** 2 + np.sum(gap ** 2) - gap ** 2))
+                if np.partition(distances, k - 1)[k - 1] <= bound:
+                    return self._sorted(point, windows, k)
+        if not found:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        return self._sorted(point, np.concatenate(found), k)
+
+    def _brute_force(self, point, k, mask):
+        keep = self.dirty if mask is None else self.dirty & mask
+        return self._sorted(point, np.flatnonzero(keep), k)
+
+    def within(self, point, radius: float, mask: np.ndarray = None):
+        """(window indices, distances) of the dirty windows within radius of point, closest first."""
+        point = np.asarray(point, dtype=np.float64)
+        center = self._cells_of(point)
+        max_radius = int(np.max(np.maximum(center, self.shape - 1 - center)))
+        rings = min(max_radius, int(np.ceil(radius / self.cell_size)))
+        found = [self._windows_in(self._ring(center, r), mask) for r in range(rings + 1)]
+        windows, distances = self._sorted(point, np.concatenate(found))
+        inside = distances <= radius
+        return windows[inside], distances[inside]
@@ -0,0 +1,203 @@
+import math
+import numpy as np
+from map import Map
+from map_state import NO_INDEX, WINDOW_CLEAN
+
+
+def _bits_for(n_values: int) -> int:
+    return max(1, math.ceil(math.log2(n_values)))
+
+
+class StateEncoder:
+    """
+    Packs the parts of a map that matter for the tabular agent into one
+    integer, used as the QLearningAgent.q_table key.
+
+    Positions become location indices (0 base station, 1 + w window w,
+    num_windows + 1 anywhere else, see MapTopology) and battery levels are
+    put in battery_buckets buckets of max_level / battery_buckets, bucket 0
+    meaning exactly empty. Bits from low to high:
+
+        window w clean                        bit w
+        cleaner c, at num_windows + c * cleaner_bits:
+            location, battery bucket, is_cleaning, is_charging
+        drone, at num_windows + num_cleaners * cleaner_bits:
+            location, load (cleaner index + 1, 0 for none), battery bucket
+
+    fields() unpacks a key into (drone, cleaner batteries, window bits,
+    cleaners), the shape MapSimulation.compute_reward works on.
+    """
+
+    def __init__(self, num_cleaners: int, num_windows: int, battery_buckets: int = 10, max_level: float = 100.0):
+        self.num_cleaners = num_cleaners
+        self.num_windows = num_windows
+        self.battery_buckets = battery_buckets
+        self.bucket_width = max_level / battery_buckets
+
+        self.location_bits = _bits_for(num_windows + 2)
+        self.battery_bits = _bits_for(battery_buckets + 1)
+        self.load_bits = _bits_for(num_cleaners + 1)
+        self.cleaner_bits = self.location_bits + self.battery_bits + 2
+        self.drone_bits = self.location_bits + self.load_bits + self.battery_bits
+        self.cleaner_offset = num_windows
+        self.drone_offset = num_windows + num_cleaners * self.cleaner_bits
+        self.total_bits = self.drone_offset + self.drone_bits
+
+    # ---- Discretization ----
+    def bucket(self, level: float) -> int:
+        if level <= 0.0:
+            return 0
+        return min(self.battery_buckets, math.ceil(level / self.bucket_width))
+
+    def buckets(self, levels: np.ndarray) -> np.ndarray:
+        """bucket() of every level in an array."""
+        buckets = np.minimum(self.battery_buckets, np.ceil(levels / self.bucket_width))
+        return np.where(levels <= 0.0, 0, buckets).astype(np.int64)
+
+    def _location(self, map_state: Map, pos) -> int:
+        location = map_state.topology.location_of(pos)
+        return self.num_windows + 1 if location is None else location
+
+    def _cleaner_value(self, location, bucket, is_cleaning, is_charging):
+        value = location | bucket << self.location_bits
+        value = value | is_cleaning << (self.location_bits + self.battery_bits)
+        return value | is_charging << (self.location_bits + self.battery_bits + 1)
+
+    def _drone_value(self, location, load, bucket):
+        return location | load << self.location_bits | bucket << (self.location_bits + self.load_bits)
+
+    # ---- Encoding ----
+    def encode(self, map_state: Map) -> int:
+        """Key of one map."""
+        arrays = map_state.arrays
+        window_bits = np.packbits(arrays.window_state == WINDOW_CLEAN, bitorder='little')
+        key = int.from_bytes(window_bits.tobytes(), 'little')
+        batteries = arrays.battery_levels()
+        for c_idx in range(self.num_cleaners):
+            value = self._cleaner_value(
+                self._location(map_state, arrays.cleaner_pos[c_idx]),
+                self.bucket(batteries[c_idx]),
+                int(arrays.cleaner_is_cleaning[c_idx]),
+                int(arrays.cleaner_is_charging[c_idx]),
+            )
+            key |= value << (self.cleaner_offset + c_idx * self.cleaner_bits)
+        drone = self._drone_value(
+            self._location(map_state, arrays.drone_pos[0]),
+            int(arrays.drone_load[0]) + 1,
+            self.bucket(arrays.drone_battery[0]),
+        )
+        return key | drone << self.drone_offset
+
+    def encode_batch(self, maps) -> np.ndarray:
+        """
+        Keys of a batch of maps given as stacked (B, ...) arrays with the
+        field names of VectorMapSimulation. Returns an int64 array when
+        total_bits fits in 63 bits, otherwise an object array of Python ints.
+        """
+        locations = np.concatenate([maps.base_pos[:, None, :], maps.window_pos], axis=1)
+        cleaner_locations = self._batch_locations(maps.cleaner_pos, locations)
+        drone_locations = self._batch_locations(maps.drone_pos[:, None, :], locations)[:, 0]
+
+        cleaners = self._cleaner_value(
+            cleaner_locations,
+            self.buckets(maps.cleaner_battery),
+            maps.cleaner_is_cleaning.astype(np.int64),
+            maps.cleaner_is_charging.astype(np.int64),
+        )
+        drone = self._drone_value(
+            drone_locations,
+            maps.drone_load.astype(np.int64) + 1,
+            self.buckets(maps.drone_battery),
+        )
+        bits = np.concatenate([
+            (maps.window_state == WINDOW_CLEAN).astype(np.uint8),
+            self._to_bits(cleaners, self.cleaner_bits),
+            self._to_bits(drone[:, None], self.drone_bits),
+        ], axis=1)
+        packed = np.packbits(bits, axis=1, bitorder='little')
+        if self.total_bits <= 63:
+            words = np.zeros((len(packed), 8), dtype=np.uint8)
+            words[:, :packed.shape[1]] = packed
+            return words.view('<i8')[:, 0].copy()
+        keys = np.empty(len(packed), dtype=object)
+        for i, row in enumerate(packed):
+            keys[i] = int.from_bytes(row.tobytes(), 'little')
+        return keys
+
+    def _batch_locations(self, pos: np.ndarray, locations: np.ndarray) -> np.ndarray:
+        # (B, N, 3) positions against (B, L, 3) locations -> (B, N) location indices
+        same = np.all(pos[:, :, None, :] == locations[:, None, :, :], axis=3)
+        return np.where(same.any(axis=2), same.argmax(axis=2), self.num_windows + 1)
+
+    @staticmethod
+    def _to_bits(values: np.ndarray, width: int) -> np.ndarray:
+        # (B, N) values -> (B, N * width) bits, lowest bit first
+        shifts = np.arange(width, dtype=np.int64)
+        bits = (values[:, :, None] >> shifts) & 1
+        return bits.reshape(len(values), -1).astype(np.uint8)
+
+    # ---- Decoding ----
+    def fields(self, key: int):
+        """
+        (drone, batteries, windows, cleaners) of a key: drone is (location,
+        load, battery bucket), batteries the cleaner battery buckets, windows
+        the clean bits and cleaners (location, is_cleaning, is_charging).
+        """
+        key = int(key)
+        windows = tuple((key >> w) & 1 for w in range(self.num_windows))
+        location_mask = (1 << self.location_bits) - 1
+        battery_mask = (1 << self.battery_bits) - 1
+        batteries = []
+        cleaners = []
+        for c_idx in range(self.num_cleaners):
+            value = key >> (self.cleaner_offset + c_idx * self.cleaner_bits)
+            batteries.append((value >> self.location_bits) & battery_mask)
+            flags = value >> (self.location_bits + self.battery_bits)
+            cleaners.append((value & location_mask, flags & 1, (flags >> 1) & 1))
+        value = key >> self.drone_offset
+        drone = (
+            value & location_mask,
+            (value >> self.location_bits) & ((1 << self.load_bits) - 1),
+            (value >> (self.location_bits + self.load_bits)) & battery_mask,
+        )
+        return drone, tuple(batteries), windows, tuple(cleaners)
+
+
+class DQNLayout:
+    """
+    Fixed float32 feature layout of MapSimulation.get_dqn_state for one
+    number of cleaners and windows:
+
+        [0:5]                      drone x, y, z, battery, has load (1/0)
+        [5 + 5c : 10 + 5c]         cleaner c x, y, z, battery, is cleaning (1/0)
+        [window_offset + 4w : +4]  window w x, y, z, is clean (1/0)
+
+    with window_offset = 5 + 5 * num_cleaners and size = window_offset + 4 * num_windows.
+    """
+
+    DRONE_WIDTH = 5
+    CLEANER_WIDTH = 5
+    WINDOW_WIDTH = 4
+
+    def __init__(self, num_cleaners: int, num_windows: int):
+        self.num_cleaners = num_cleaners
+        self.num_windows = num_windows
+        self.cleaner_offset = self.DRONE_WIDTH
+        self.window_offset = self.cleaner_offset + self.CLEANER_WIDTH * num_cleaners
+        self.size = self.window_offset + self.WINDOW_WIDTH * num_windows
+
+    def write(self, map_state: Map, out: np.ndarray) -> np.ndarray:
+        """Write the features of map_state into out, a (size,) float32 array or a row of a (B, size) one."""
+        arrays = map_state.arrays
+        drone = out[:self.cleaner_offset]
+        drone[:3] = arrays.drone_pos[0]
+        drone[3] = arrays.drone_battery[0]
+        drone[4] = arrays.drone_load[0] != NO_INDEX
+        cleaners = out[self.cleaner_offset:self.window_offset].reshape(self.num_cleaners, self.CLEANER_WIDTH)
+        cleaners[:, :3] = arrays.cleaner_pos
+        cleaners[:, 3] = arrays.battery_levels()
+        cleaners[:, 4] = arrays.cleaner_is_cleaning
+        windows = out[self.window_offset:self.size].reshape(self.num_windows, self.WINDOW_WIDTH)
+        windows[:, :3] = arrays.window_pos
+        windows[:, 3] = arrays.window_state  # WINDOW_CLEAN is 1, WINDOW_DIRTY 0
+        return out
@@ -0,0 +1,103 @@
+import random
+import numpy as np
+from map import Map, random_map_generater
+from map_simulation import MapSimulation
+from mcts_planner import HeuristicController
+from clener_actioons import ChargeCleanerAction
+
+
+class _StepwiseBatteries:
+    """
+    The per-update battery bookkeeping the lazy model replaced: every update
+    drains each running process up to the current time, and the suction of
+    every cleaner on a window from its last_update_time.
+    """
+
+    def __init__(self, map_state: Map):
+        arrays = map_state.arrays
+        self.map = map_state
+        self.levels = arrays.battery_levels().tolist()
+        self.last_update = arrays.cleaner_last_update.tolist()
+        self.processes = [None] * arrays.num_cleaners
+        self.was_on_window = [False] * arrays.num_cleaners
+        self.late_starts = 0
+        self.charges = 0
+        self.pickups = 0
+
+    def start(self, map_state: Map):
+        now = map_state.time
+        for i, process in enumerate(map_state.cleaning_processes):
+            if process is not None and (self.processes[i] is None or self.processes[i][0] is not process):
+                # A process's first update counts from its larsted_update_time, which starts at 0
+                assert process.larsted_update_time == 0.0
+                self.late_starts += now > 0.0
+                self.processes[i] = [process, process.larsted_update_time, process.battery_rate(map_state)]
+
+    def update(self, map_state: Map):
+        now = map_state.time
+        for i, entry in enumerate(self.processes):
+            if entry is None:
+                continue
+            process, last, rate = entry
+            end = min(now, process.end_time)
+            # Cleaning stops at empty, charging at full
+            level = self.levels[i] - rate * (end - last)
+            self.levels[i] = max(0.0, level) if rate > 0.0 else min(100.0, level) if rate < 0.0 else level
+            entry[1] = end
+            if process.end_time <= now:
+                if isinstance(process, ChargeCleanerAction):
+                    self.levels[i] = 100.0
+                    self.charges += 1
+                self.processes[i] = None
+        for i, cleaner in enumerate(map_state.cleaners):
+            on_window = cleaner.on_window is not None
+            if on_window:
+                self.levels[i] = max(0.0, self.levels[i] - map_state.arrays.cleaner_suction[0] * (now - self.last_update[i]))
+                self.last_update[i] = now
+            self.pickups += self.was_on_window[i] and not on_window
+            self.was_on_window[i] = on_window
+
+
+def test_lazy_levels_match_a_stepwise_drain(monkeypatch):
+    random.seed(5)
+    np.random.seed(5)
+    map_state = random_map_generater(3, 12)
+    sim = MapSimulation(map_state)
+    controller = HeuristicController(sim)
+    reference = _StepwiseBatteries(map_state)
+    update = Map.update_cleaning_processes
+
+    def tracked_update(self):
+        # Only the mission map, not the copies the simulation looks ahead with
+        if self is not map_state:
+            return update(self)
+        reference.start(self)
+        update(self)
+        reference.update(self)
+        assert np.allclose(self.arrays.battery_levels(), reference.levels), self.time
+
+    monkeypatch.setattr(Map, 'update_cleaning_processes', tracked_update)
+    for _ in range(150):
+        sim.apply_action(controller.plan(map_state), map_state, in_place=True)
+    assert reference.late_starts > 0
+    assert reference.charges > 0
+    assert reference.pickups > 0
+
+
+def test_suction_stops_when_a_cleaner_leaves_its_window():
+    random.seed(1)
+    np.random.seed(1)
+    map_state = random_map_generater(3, 12)
+    cleaner = map_state.cleaners[0]
+    cleaner.on_window = map_state.windows[0]
+    map_state.time = 10.0
+    map_state.update_cleaning_processes()
+    map_state.time = 20.0
+    map_state.update_cleaning_processes()
+    on_window = cleaner.battery_level
+    suction = map_state.arrays.cleaner_suction[0]
+    assert np.isclose(on_window, 200.0 - suction * 20.0)
+    cleaner.on_window = None
+    map_state.time = 50.0
+    map_state.update_cleaning_processes()
+    assert cleaner.battery_level == on_window
@@ -0,0 +1,80 @@
+import random
+import numpy as np
+from map import random_map_generater
+from map_simulation import MapSimulation
+from map_state import MapState
+
+
+def _mission(seed=0, cleaners=3, windows=12, steps=6):
+    random.seed(seed)
+    np.random.seed(seed)
+    map_state = random_map_generater(cleaners, windows)
+    sim = MapSimulation(map_state)
+    for _ in range(steps):
+        map_state = sim.step(map_state)
+    return sim, map_state
+
+
+def _snapshot(map_state):
+    arrays = map_state.arrays
+    fresh = arrays.copy()
+    fresh.forget_digest()
+    return {
+        'arrays': {field: getattr(arrays, field).copy() for field in MapState.MUTABLE_FIELDS},
+        'time': map_state.time,
+        'processes': [None if process is None else (id(process), dict(vars(process))) for process in map_state.cleaning_processes],
+        'heap': list(map_state.process_heap),
+        'started': list(map_state.started_processes),
+        'digest': fresh.digest(),
+    }
+
+
+def _assert_restored(map_state, snapshot):
+    now = _snapshot(map_state)
+    for field, array in snapshot['arrays'].items():
+        assert np.array_equal(now['arrays'][field], array), field
+    for key in ('time', 'processes', 'heap', 'started', 'digest'):
+        assert now[key] == snapshot[key], key
+    # The digest kept up by write() is the one computed from scratch
+    assert map_state.arrays.digest() == snapshot['digest']
+
+
+def _apply_allowed(sim, map_state, choice):
+    allowed = np.flatnonzero(sim.allowed_mask(map_state))
+    action = sim.action_table(map_state)[int(allowed[choice % len(allowed)])]
+    sim.apply_action(action, map_state, in_place=True)
+
+
+def test_nested_rollback_restores_the_map():
+    sim, map_state = _mission()
+    map_state.arrays.digest()
+    before = _snapshot(map_state)
+    map_state.begin_transaction()
+    _apply_allowed(sim, map_state, 1)
+    middle = _snapshot(map_state)
+    map_state.begin_transaction()
+    _apply_allowed(sim, map_state, 2)
+    _apply_allowed(sim, map_state, 0)
+    map_state.rollback()
+    _assert_restored(map_state, middle)
+    map_state.rollback()
+    _assert_restored(map_state, before)
+    assert map_state.arrays.journal is None
+
+
+def test_rollback_undoes_position_updates():
+    _, map_state = _mission(steps=0)
+    start = map_state.drone.pos3d
+    map_state.begin_transaction()
+    map_state.drone.pos3d += np.array([1.0, 2.0, 3.0])
+    map_state.cleaners[0].pos3d += 1.0
+    map_state.rollback()
+    assert np.array_equal(map_state.drone.pos3d, start)
+    assert np.array_equal(map_state.arrays.cleaner_pos[0], map_state.arrays.base_pos)
+
+
+def test_position_getters_do_not_alias_the_state():
+    _, map_state = _mission(steps=0)
+    pos = map_state.drone.pos3d
+    pos += 5.0
+    assert not np.array_equal(map_state.arrays.drone_pos[0], pos)
@@ -0,0 +1,20 @@
+import random
+import numpy as np
+from events import EventStream, RingBufferSink, RUN_ENDED
+from map import random_map_generater
+from map_simulation import MapSimulation
+from mpc_controller import MPCController
+
+
+def test_mission_keeps_every_cleaner_charged():
+    for seed in (0, 2):
+        random.seed(seed)
+        np.random.seed(seed)
+        sim = MapSimulation(random_map_generater(4, 100))
+        sim.controller = MPCController(sim)
+        sink = RingBufferSink()
+        sim.events = EventStream(sink)
+        sim.run(200)
+        assert not sink.events(RUN_ENDED), sink.events(RUN_ENDED)
+        assert sim.map.arrays.battery_levels().min() > 0.0
+        assert np.count_nonzero(sim.map.arrays.window_state) > 20
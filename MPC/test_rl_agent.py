@@ -0,0 +1,13 @@
+import numpy as np
+from rl_agent import QLearningAgent
+
+
+def test_get_qs_grows_past_initial_capacity():
+    agent = QLearningAgent(3, capacity=2)
+    for state in range(5):
+        agent.get_qs(state)[state % 3] = state
+    assert agent.q_table.capacity >= 5
+    for state in range(5):
+        qs = agent.get_qs(state)
+        assert qs[state % 3] == state
+        assert np.count_nonzero(qs) == (1 if state else 0)
@@ -0,0 +1,64 @@
+import copy
+import random
+import numpy as np
+from map import random_map_generater
+from map_simulation import MapSimulation
+from map_state import MapState
+from transition_cache import TransitionCache
+
+
+def _mission(seed=0, steps=6):
+    random.seed(seed)
+    np.random.seed(seed)
+    map_state = random_map_generater(3, 12)
+    sim = MapSimulation(map_state)
+    for _ in range(steps):
+        map_state = sim.step(map_state)
+    return sim, map_state
+
+
+def _state(map_state):
+    return (
+        [getattr(map_state.arrays, field).tolist() for field in MapState.MUTABLE_FIELDS],
+        map_state.time,
+        [None if process is None else (type(process).__name__, vars(process)) for process in map_state.cleaning_processes],
+        sorted(end_time for end_time, _, _ in map_state.process_heap),
+        list(map_state.started_processes),
+    )
+
+
+def _allowed_actions(sim, map_state):
+    table = sim.action_table(map_state)
+    return [table[int(i)] for i in np.flatnonzero(sim.allowed_mask(map_state))]
+
+
+def test_hit_equals_recomputed_transition():
+    sim, map_state = _mission()
+    plain = copy.copy(sim)
+    plain.transition_cache = None
+    sim.transition_cache = TransitionCache()
+    for action in _allowed_actions(sim, map_state):
+        sim.apply_action(action, map_state)
+        hits = sim.transition_cache.hits
+        cached = sim.apply_action(action, map_state)
+        assert sim.transition_cache.hits == hits + 1
+        assert _state(cached) == _state(plain.apply_action(action, map_state))
+
+
+def test_in_place_hit_rolls_back():
+    sim, map_state = _mission()
+    sim.transition_cache = TransitionCache()
+    map_state.arrays.digest()
+    before = _state(map_state)
+    for action in _allowed_actions(sim, map_state):
+        expected = _state(sim.apply_action(action, map_state))
+        hits = sim.transition_cache.hits
+        map_state.begin_transaction()
+        sim.apply_action(action, map_state, in_place=True)
+        assert sim.transition_cache.hits == hits + 1
+        assert _state(map_state) == expected
+        map_state.rollback()
+        assert _state(map_state) == before
+        fresh = map_state.arrays.copy()
+        fresh.forget_digest()
+        assert map_state.arrays.digest() == fresh.digest()
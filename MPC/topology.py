@@ -0,0 +1,147 @@
+from collections import OrderedDict
+import itertools
+import numpy as np
+from spatial_index import WindowGrid
+
+
+class MapTopology:
+    """
+    Cached flight distances between the fixed locations of a map.
+
+    Location 0 is the base station and location 1 + w is window w. The drone
+    and the cleaners only ever stand on one of these, so the flight actions
+    look their distance, duration and energy up here instead of doing the
+    vector math on every run. The tables are built the first time they are
+    needed and thrown away by invalidate() when the base or a window moves.
+
+    Maps with more than DENSE_LIMIT locations get their rows computed one at
+    a time instead of as a full matrix, keeping only the most recently used
+    rows of each table up to ROW_CACHE_BYTES, and flight() works out a
+    single pair directly. Maps with more than GRID_LIMIT windows answer
+    nearest-window queries from window_grid instead of a full distance row.
+    """
+
+    DENSE_LIMIT = 512
+    GRID_LIMIT = 1024
+    BLOCK_ROWS = 128  # rows of the dense distance matrix computed at a time
+    ROW_CACHE_BYTES = 8 * 2**20  # per table, at least a few rows are kept whatever the map size
+    _layout_ids = itertools.count()
+
+    def __init__(self, base_pos: np.ndarray, window_pos: np.ndarray):
+        # Same arrays as in MapState, so in-place changes are seen after invalidate()
+        self.base_pos = base_pos
+        self.window_pos = window_pos
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget all cached tables, call this after the geometry has changed."""
+        self.layout_id = next(self._layout_ids)  # unique per topology and geometry, see TransitionCache
+        self._locations = None
+        self._location_index = None
+        self._distances = None  # (L, L) when dense
+        self._distance_rows = OrderedDict()  # location -> row, least recently used first
+        self._cost_tables = {}  # (speed, power) -> (durations, energies) when dense
+        self._cost_rows = OrderedDict()  # (speed, power, location) -> (durations, energies), least recently used first
+        self._window_grid = None
+
+    @property
+    def locations(self) -> np.ndarray:
+        """(L, 3) positions, base station first then the windows."""
+        if self._locations is None:
+            self._locations = np.vstack([self.base_pos[None, :], self.window_pos])
+        return self._locations
+
+    @property
+    def window_grid(self) -> WindowGrid:
+        """Spatial index over the windows (spatial_index.py)."""
+        if self._window_grid is None:
+            self._window_grid = WindowGrid(self.window_pos)
+        return self._window_grid
+
+    @property
+    def uses_grid(self) -> bool:
+        return len(self.window_pos) > self.GRID_LIMIT
+
+    @property
+    def is_dense(self) -> bool:
+        return len(self.locations) <= self.DENSE_LIMIT
+
+    def location_of(self, pos) -> int | None:
+        """Location index of an exact position, None if it is not a known location."""
+        if self._location_index is None:
+            self._location_index = {}
+            for i, location in enumerate(self.locations):
+                self._location_index.setdefault(location.tobytes(), i)
+        return self._location_index.get(np.asarray(pos, dtype=np.float64).tobytes())
+
+    def distances(self, location: int) -> np.ndarray:
+        """Distance from one location to every location."""
+        if self.is_dense:
+            if self._distances is None:
+                self._distances = self._distance_matrix()
+            return self._distances[location]
+        row = self._distance_rows.get(location)
+        if row is None:
+            row = np.linalg.norm(self.locations - self.locations[location], axis=1)
+            self._keep_row(self._distance_rows, location, row)
+        else:
+            self._distance_rows.move_to_end(location)
+        return row
+
+    def _distance_matrix(self) -> np.ndarray:
+        # Block by block, so the (rows, L, 3) offsets stay small
+        locations = self.locations
+        distances = np.empty((len(locations), len(locations)))
+        for start in range(0, len(locations), self.BLOCK_ROWS):
+            block = locations[start:start + self.BLOCK_ROWS]
+            distances[start:start + len(block)] = np.linalg.norm(block[:, None, :] - locations[None, :, :], axis=2)
+        return distances
+
+    def _keep_row(self, rows: OrderedDict, key, row):
+        rows[key] = row
+        row_bytes = sum(part.nbytes for part in row) if isinstance(row, tuple) else row.nbytes
+        if len(rows) > max(4, self.ROW_CACHE_BYTES // row_bytes):
+            rows.popitem(last=False)
+
+    def costs(self, location: int, speed: float, power: float):
+        """(durations, energies) of flying from one location to every location."""
+        key = (speed, power)
+        if self.is_dense:
+            tables = self._cost_tables.get(key)
+            if tables is None:
+                self.distances(location)
+                durations = self._distances / speed
+                tables = (durations, durations * power)
+                self._cost_tables[key] = tables
+            return tables[0][location], tables[1][location]
+        key = (speed, power, location)
+        row = self._cost_rows.get(key)
+        if row is None:
+            durations = self.distances(location) / speed
+            row = (durations, durations * power)
+            self._keep_row(self._cost_rows, key, row)
+        else:
+            self._cost_rows.move_to_end(key)
+        return row
+
+    def flight(self, from_pos, to_pos, speed: float, power: float):
+        """
+        Distance, duration and energy of flying from from_pos to to_pos.
+
+        Falls back to computing them directly if one of the positions is not
+        a map location.
+        """
+        start = self.location_of(from_pos)
+        end = self.location_of(to_pos)
+        if start is None or end is None:
+            distance = np.linalg.norm(from_pos - to_pos)
+            duration = distance / speed
+            return distance, duration, duration * power
+        if not self.is_dense:
+            # One pair, the same arithmetic as a row of distances() and costs()
+            locations = self.locations
+            distance = np.linalg.norm(locations[end:end + 1] - locations[start], axis=1)[0]
+            duration = distance / speed
+            return distance, duration, duration * power
+        durations, energies = self.costs(start, speed, power)
+        return self.distances(start)[end], durations[end], energies[end]
@@ -1,23 +1,32 @@
+import sys
 import numpy as np
 from map_simulation import MapSimulation
 from map import random_map_generater
 from rl_agent import QLearningAgent
+from parallel_rollouts import ParallelRollouts
 
 if __name__ == "__main__":
+    # python train_rl_agent.py [workers], more than one worker plays the episodes in parallel
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 1
     np.random.seed(42)
     sim = MapSimulation(random_map_generater(num_cleaners=2, num_windows=5), real_time=False)
-    # Get number of possible drone actions
-    n_actions = len(sim._build_drone_actions(sim.map))
+    # Get number of possible drone actions (ids in the action table)
+    n_actions = len(sim.action_table(sim.map))
     agent = QLearningAgent(n_actions=n_actions)
 
     episodes = 10
     max_steps = 100
+    if workers > 1:
+        with ParallelRollouts(num_cleaners=2, num_windows=5, workers=workers, max_steps=max_steps, seed=42) as rollouts:
+            for ep, total_reward in enumerate(rollouts.train(agent, episodes)):
+                print(f"Episode {ep+1}: total reward = {total_reward}")
+        sys.exit()
     for ep in range(episodes):
         sim.map = random_map_generater(num_cleaners=2, num_windows=5)
         state = sim.get_state()
         total_reward = 0
         for step in range(max_steps):
-            action = agent.select_action(state)
+            action = agent.select_action(state, sim.allowed_mask(sim.map))
             next_state, reward, done, new_map = sim.rl_step(action, sim.map)
             agent.update(state, action, reward, next_state, done)
             state = next_state
@@ -0,0 +1,295 @@
+import bisect
+import collections
+import json
+import os
+import time
+import numpy as np
+from map import Map
+from map_state import WINDOW_CLEAN, WINDOW_DIRTY
+from basestation import Base_station
+from drone import Transport_drone
+from cleaner import Robot_cleaner
+
+INDEX_FILE = 'index.json'
+STATIC_FILE = 'static.npz'
+
+
+def _columns(num_cleaners: int, num_windows: int) -> dict:
+    # name -> (dtype, shape of one row)
+    C, W = num_cleaners, num_windows
+    return {
+        'time': ('float64', ()),
+        'action_id': ('int32', ()),
+        'drone_pos': ('float64', (3,)),
+        'drone_battery': ('float64', ()),
+        'drone_ucupied': ('bool', ()),
+        'drone_load': ('int32', ()),
+        'cleaner_pos': ('float64', (C, 3)),
+        'cleaner_battery': ('float64', (C,)),
+        'cleaner_is_cleaning': ('bool', (C,)),
+        'cleaner_is_charging': ('bool', (C,)),
+        'cleaner_on_window': ('int32', (C,)),
+        'window_clean': ('uint8', ((W + 7) // 8,)),  # np.packbits of window_state == WINDOW_CLEAN
+    }
+
+
+class TrajectoryRecorder:
+    """
+    Records a run column by column into a directory.
+
+    Every record() appends one row per column (time, drone action id,
+    drone, cleaner and window state) to preallocated chunk_size-row
+    buffers. A full chunk is written as one .npy file per column
+    (<column>_<chunk>.npy) and index.json is updated, so memory stays at
+    one chunk however long the run is. flush() also writes the partial
+    chunk, which is rewritten as it fills up.
+
+    The geometry that does not change during a run goes to static.npz once,
+    so TrajectoryReader can rebuild maps without the original one.
+
+    Action ids are the ids of the ActionTable for MapSimulation and the
+    index into all_drone_actions for simulation.py.
+    """
+
+    def __init__(self, directory: str, map_state: Map, chunk_size: int = 4096):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        arrays = map_state.arrays
+        self.num_cleaners = arrays.num_cleaners
+        self.num_windows = arrays.num_windows
+        self.columns = _columns(self.num_cleaners, self.num_windows)
+        self.buffers = {
+            name: np.zeros((chunk_size,) + shape, dtype=dtype) for name, (dtype, shape) in self.columns.items()
+        }
+        self.rows = 0  # rows recorded, spilled or not
+        self.chunk_first_time = []  # time of the first row of every chunk
+        os.makedirs(directory, exist_ok=True)
+        np.savez(
+            os.path.join(directory, STATIC_FILE),
+            base_pos=arrays.base_pos, window_pos=arrays.window_pos, window_width=arrays.window_width,
+            window_height=arrays.window_height, window_cleaning_time=arrays.window_cleaning_time,
+            drone_capacity=arrays.drone_capacity, cleaner_capacity=arrays.cleaner_capacity,
+            cleaner_names=np.array([str(name) for name in arrays.cleaner_names]),
+            window_names=np.array([str(name) for name in arrays.window_names]),
+        )
+
+    def record(self, map_state: Map, action_id: int = -1):
+        """Append the current state of map_state, reached with the drone action action_id (-1 for none)."""
+        row = self.rows % self.chunk_size
+        if row == 0:
+            self.chunk_first_time.append(float(map_state.time))
+        arrays = map_state.arrays
+        buffers = self.buffers
+        buffers['time'][row] = map_state.time
+        buffers['action_id'][row] = action_id
+        buffers['drone_pos'][row] = arrays.drone_pos[0]
+        buffers['drone_battery'][row] = arrays.drone_battery[0]
+        buffers['drone_ucupied'][row] = arrays.drone_ucupied[0]
+        buffers['drone_load'][row] = arrays.drone_load[0]
+        buffers['cleaner_pos'][row] = arrays.cleaner_pos
+        buffers['cleaner_battery'][row] = arrays.battery_levels()
+        buffers['cleaner_is_cleaning'][row] = arrays.cleaner_is_cleaning
+        buffers['cleaner_is_charging'][row] = arrays.cleaner_is_charging
+        buffers['cleaner_on_window'][row] = arrays.cleaner_on_window
+        buffers['window_clean'][row] = np.packbits(arrays.window_state == WINDOW_CLEAN)
+        self.rows += 1
+        if row + 1 == self.chunk_size:
+            self._spill(self.chunk_size)
+
+    def flush(self):
+        """Write the rows of the partial chunk too."""
+        filled = self.rows % self.chunk_size
+        if filled:
+            self._spill(filled)
+        else:
+            self._write_index()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _spill(self, filled: int):
+        chunk = (self.rows - 1) // self.chunk_size
+        for name, buffer in self.buffers.items():
+            np.save(os.path.join(self.directory, f'{name}_{chunk:05d}.npy'), buffer[:filled])
+        self._write_index()
+
+    def _write_index(self):
+        index = {
+            'rows': self.rows,
+            'chunk_size': self.chunk_size,
+            'num_cleaners': self.num_cleaners,
+            'num_windows': self.num_windows,
+            'chunk_first_time': self.chunk_first_time,
+            'columns': {name: [dtype, list(shape)] for name, (dtype, shape) in self.columns.items()},
+        }
+        path = os.path.join(self.directory, INDEX_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(path + '.tmp', path)
+
+
+class TrajectoryReader:
+    """
+    Random access to a TrajectoryRecorder directory.
+
+    Chunks are opened as memory maps when a row in them is first read, and
+    only the last max_open_chunks of them stay open, so reading a range
+    touches just the chunks it spans. Rows are found by step (row number)
+    or by simulated time through step_at().
+
+    Replayed maps carry the recorded positions, batteries, window states
+    and drone load, not the running cleaner processes, so they are for
+    looking at and analysing a run rather than for simulating on from.
+    """
+
+    def __init__(self, directory: str, max_open_chunks: int = 8):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.rows = index['rows']
+        self.chunk_size = index['chunk_size']
+        self.num_cleaners = index['num_cleaners']
+        self.num_windows = index['num_windows']
+        self.chunk_first_time = index['chunk_first_time']
+        self.columns = {name: (dtype, tuple(shape)) for name, (dtype, shape) in index['columns'].items()}
+        with np.load(os.path.join(directory, STATIC_FILE)) as static:
+            self.static = {name: static[name] for name in static.files}
+        self.max_open_chunks = max_open_chunks
+        self._chunks = collections.OrderedDict()  # (column, chunk) -> memmap, least recently used first
+        self._template = None
+
+    def __len__(self):
+        return self.rows
+
+    # ---- Columns ----
+    def _chunk(self, name: str, chunk: int) -> np.ndarray:
+        key = (name, chunk)
+        array = self._chunks.get(key)
+        if array is None:
+            array = np.load(os.path.join(self.directory, f'{name}_{chunk:05d}.npy'), mmap_mode='r')
+            self._chunks[key] = array
+            if len(self._chunks) > self.max_open_chunks * len(self.columns):
+                self._chunks.popitem(last=False)
+        else:
+            self._chunks.move_to_end(key)
+        return array
+
+    def _step(self, step: int) -> int:
+        if step < 0:
+            step += self.rows
+        if not 0 <= step < self.rows:
+            raise IndexError(f'step {step} out of range for {self.rows} recorded steps')
+        return step
+
+    def column(self, name: str, start: int = 0, stop: int = None) -> np.ndarray:
+        """Rows start:stop of one column, read from the chunks they span only."""
+        stop = self.rows if stop is None else min(stop, self.rows)
+        if start >= stop:
+            dtype, shape = self.columns[name]
+            return np.zeros((0,) + shape, dtype=dtype)
+        parts = []
+        for chunk in range(start // self.chunk_size, (stop - 1) // self.chunk_size + 1):
+            offset = chunk * self.chunk_size
+            parts.append(self._chunk(name, chunk)[max(start - offset, 0):stop - offset])
+        return np.concatenate(parts)
+
+    def row(self, step: int) -> dict:
+        """Every column of one step."""
+        step = self._step(step)
+        chunk, offset = divmod(step, self.chunk_size)
+        return {name: np.array(self._chunk(name, chunk)[offset]) for name in self.columns}
+
+    def step_at(self, sim_time: float) -> int:
+        """Last step recorded at or before sim_time (0 if sim_time is before the first one)."""
+        chunk = max(0, bisect.bisect_right(self.chunk_first_time, sim_time) - 1)
+        times = self._chunk('time', chunk)
+        return max(0, chunk * self.chunk_size + int(np.searchsorted(times, sim_time, side='right')) - 1)
+
+    # ---- Maps ----
+    def empty_map(self) -> Map:
+        """A map with the recorded geometry, load() a step into it."""
+        if self._template is None:
+            static = self.static
+            drone = Transport_drone(init_state=[0, 0, 0, 0, 0, 0])
+            drone.battery_capacity = float(static['drone_capacity'][0])
+            cleaners = [
+                Robot_cleaner(name=str(name), battery_capacity=float(capacity), pos3d=static['base_pos'])
+                for name, capacity in zip(static['cleaner_names'], static['cleaner_capacity'])
+            ]
+            self._template = Map.from_window_arrays(
+                Base_station(pos3d=static['base_pos']), drone, cleaners,
+                static['window_pos'], static['window_width'], static['window_height'], static['window_cleaning_time'],
+                window_names=[str(name) for name in static['window_names']],
+            )
+        return self._template.copy()
+
+    def load(self, step: int, map_state: Map) -> Map:
+        """Overwrite map_state with the recorded state of step, in place (a LiveVisualizer redraws it)."""
+        values = self.row(step)
+        arrays = map_state.arrays
+        now = float(values['time'])
+        map_state.time = now
+        arrays.drone_pos[0] = values['drone_pos']
+        arrays.drone_battery[0] = values['drone_battery']
+        arrays.drone_ucupied[0] = values['drone_ucupied']
+        arrays.drone_load[0] = values['drone_load']
+        arrays.cleaner_pos[:] = values['cleaner_pos']
+        # The recorded level, frozen at the step time
+        arrays.cleaner_battery[:] = values['cleaner_battery']
+        arrays.cleaner_battery_t0[:] = now
+        arrays.cleaner_battery_rate[:] = 0.0
+        arrays.cleaner_suction_on[:] = False
+        arrays.battery_time[0] = now
+        arrays.cleaner_is_cleaning[:] = values['cleaner_is_cleaning']
+        arrays.cleaner_is_charging[:] = values['cleaner_is_charging']
+        arrays.cleaner_on_window[:] = values['cleaner_on_window']
+        clean = np.unpackbits(values['window_clean'], count=self.num_windows).astype(bool)
+        arrays.window_state[:] = np.where(clean, WINDOW_CLEAN, WINDOW_DIRTY)
+        arrays.drone_dirty[:] = True
+        arrays.cleaner_dirty[:] = True
+        arrays.window_dirty[:] = True
+        arrays.forget_digest()
+        map_state.cleaning_processes = [None] * self.num_cleaners
+        map_state.process_heap = []
+        map_state.started_processes = []
+        return map_state
+
+    def map_at(self, step: int = None, sim_time: float = None) -> Map:
+        """New map in the state of a step, or of the last step at or before sim_time."""
+        if step is None:
+            step = self.step_at(sim_time)
+        return self.load(step, self.empty_map())
+
+    def replay(self, start: int = 0, stop: int = None, map_state: Map = None):
+        """Yield (step, map) for steps start:stop, loading every step into the same map."""
+        if map_state is None:
+            map_state = self.empty_map()
+        stop = self.rows if stop is None else min(stop, self.rows)
+        for step in range(start, stop):
+            yield step, self.load(step, map_state)
+
+    def replay_time(self, start_time: float, end_time: float, map_state: Map = None):
+        """replay() of the steps recorded from start_time up to end_time."""
+        start = self.step_at(start_time)
+        stop = self.step_at(end_time) + 1
+        return self.replay(start, stop, map_state)
+
+    def play(self, visualizer, start_time: float = 0.0, end_time: float = None, speed: float = 1.0):
+        """
+        Replay into visualizer.map (a LiveVisualizer) at speed times the
+        simulated time. Blocks, so run it in a thread next to
+        visualizer.show() like run_with_visualization.py does.
+        """
+        if end_time is None:
+            end_time = float(self.column('time', self.rows - 1)[0])
+        last = None
+        for _, map_state in self.replay_time(start_time, end_time, visualizer.map):
+            if last is not None and speed > 0:
+                time.sleep(max(0.0, map_state.time - last) / speed)
+            last = map_state.time
@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from map import Map
+from map_state import MapState
+
+# Rough size of a cached Map besides its arrays (the objects, the process copies and the dict entry)
+_ENTRY_OVERHEAD = 2048
+# Written on every in place hit, the fingerprint does not cover them
+_DIRTY_FIELDS = tuple(field for field in MapState.MUTABLE_FIELDS if field not in MapState.DIGEST_FIELDS)
+
+
+class TransitionCache:
+    """
+    LRU cache of MapSimulation.apply_action results, opt-in through
+    MapSimulation.transition_cache.
+
+    The key is built without a pass over the arrays: the action, the
+    drone_only flag, the layout (MapTopology.layout_id, which changes with
+    the geometry), the time, the running processes and MapState.digest(),
+    which write() keeps up to date. Since the digest is only a hash, a hit
+    is confirmed by comparing the exact bytes of the mutable arrays with
+    the ones stored with the entry. A hit is then the transition
+    apply_action would compute, as long as the simulation parameters did
+    not change since. The cached maps are private snapshots, a hit hands
+    out a copy, or for in_place calls assigns the fields the transition
+    changed into the map.
+
+    A hit still costs that compare and a copy, so the cache is meant for
+    replaying episodes on one layout, where most transitions come back.
+    Leave it off for the planners: MCTSPlanner and MPCController search
+    over continuous time, rarely reach a state twice and run slower with
+    it. With admit_after above 1 a transition is only stored once it
+    missed that many times, which saves snapshots of states never seen
+    again but also delays the hits of an episode replayed only once.
+
+    Entries are evicted least recently used first once there are more than
+    max_entries or their estimated size passes max_bytes. Call clear()
+    after changing the simulation parameters.
+    """
+
+    def __init__(self, max_entries: int = 100_000, max_bytes: int = 256 * 2**20, admit_after: int = 1):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.admit_after = admit_after
+        # key -> (fingerprint of the source map, map snapshot, fields that changed, size in bytes)
+        self._entries = OrderedDict()
+        self._seen = OrderedDict()  # key -> misses so far, for keys not stored yet, least recently seen first
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        self._entries.clear()
+        self._seen.clear()
+        self.nbytes = 0
+
+    @staticmethod
+    def fingerprint(map_state: Map) -> tuple:
+        """Exact bytes of every mutable array apply_action reads, in DIGEST_FIELDS order."""
+        arrays = map_state.arrays
+        return tuple(getattr(arrays, field).tobytes() for field in MapState.DIGEST_FIELDS)
+
+    @staticmethod
+    def key(action, map_state: Map, drone_only: bool) -> tuple:
+        processes = tuple(
+            None if process is None else (type(process).__name__,) + tuple(vars(process).values())
+            for process in map_state.cleaning_processes
+        )
+        return (
+            type(action).__name__, tuple(vars(action).values()), drone_only, map_state.topology.layout_id,
+            map_state.arrays.digest(), map_state.time, processes, tuple(map_state.started_processes),
+        )
+
+    def lookup(self, action, map_state: Map, drone_only: bool):
+        """
+        ((cached result, fields it changed), None) on a hit, do not change
+        the returned map. (None, ticket) on a miss, where ticket is None
+        unless the result should be stored with put(ticket, result). Call
+        it before map_state changes.
+        """
+        key = self.key(action, map_state, drone_only)
+        entry = self._entries.get(key)
+        if entry is not None:
+            source = self.fingerprint(map_state)
+            if entry[0] == source:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return (entry[1], entry[2]), None
+            self.misses += 1
+            return None, (key, source)
+        self.misses += 1
+        seen = self._seen.pop(key, 0) + 1
+        if seen < self.admit_after:
+            self._seen[key] = seen
+            if len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+            return None, None
+        return None, (key, self.fingerprint(map_state))
+
+    def put(self, ticket, result: Map):
+        """Store a snapshot of result for the ticket of lookup()."""
+        key, source = ticket
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[3]
+        snapshot = result.copy()
+        arrays = snapshot.arrays
+        changed = tuple(
+            field for field, before in zip(MapState.DIGEST_FIELDS, source) if getattr(arrays, field).tobytes() != before
+        ) + _DIRTY_FIELDS
+        size = _ENTRY_OVERHEAD + sum(getattr(arrays, field).nbytes for field in MapState.MUTABLE_FIELDS) + sum(map(len, source))
+        self._entries[key] = (source, snapshot, changed, size)
+        self.nbytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self.nbytes > self.max_bytes):
+            _, (_, _, _, old_size) = self._entries.popitem(last=False)
+            self.nbytes -= old_size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries), 'bytes': self.nbytes, 'hits': self.hits,
+            'misses': self.misses, 'evictions': self.evictions, 'hit_rate': self.hit_rate,
+        }
@@ -0,0 +1,348 @@
+import time
+import numpy as np
+from map import Map
+from map_state import NO_INDEX, WINDOW_DIRTY, WINDOW_CLEAN
+
+# Action ids, same order as MapSimulation.new_build_drone_actions:
+# null, fly to base and charge, drop off cleaner at base, one drop per window, one pickup per cleaner
+ACTION_NULL = 0
+ACTION_FLY_TO_BASE_AND_CHARGE = 1
+ACTION_DROP_OFF_AT_BASE = 2
+FIRST_WINDOW_ACTION = 3
+
+# Running cleaner process per cleaner (Map.cleaning_processes)
+PROCESS_NONE = 0
+PROCESS_CLEAN = 1
+PROCESS_CHARGE = 2
+
+
+class VectorMapSimulation:
+    """
+    Steps B independent maps in lockstep, one macro action per map per call.
+
+    Every map has the same number of cleaners and windows and is stored as
+    stacked (B, ...) arrays with the same fields as MapState. The drone actions
+    follow DropCleanerOffAtWindow, PickupCleanerByFlying, FlyToBaseAndCharge and
+    DropOffCleanerAtBaseByFlying from map_actions.py (flying to the target is
+    part of each of them, like FlyToWindow), and the cleaners follow
+    CleanWindowAction / ChargeCleanerAction from clener_actioons.py, the same
+    way MapSimulation.apply_action does it.
+
+    Actions that are not allowed on a map act as NullAction. The
+    advance_allowedv2 lookahead is not part of the environment, use
+    allowed_mask() to pick valid actions. Maps that are done (all windows
+    clean or a cleaner battery at 0) are replaced with a new random map.
+    """
+
+    def __init__(self, num_maps: int, num_cleaners: int, num_windows: int, seed=None):
+        self.num_maps = num_maps
+        self.num_cleaners = num_cleaners
+        self.num_windows = num_windows
+        self.num_actions = FIRST_WINDOW_ACTION + num_windows + num_cleaners
+        self.rng = np.random.default_rng(seed)
+
+        # Same parameters as MapSimulation
+        self.drone_speed = 5.0
+        self.flying_power_consumption = 0.5
+        self.pickup_drop_power = 1.0
+        self.pickup_drop_duration = 2.0
+        self.charging_rate_drone = 20.0
+        self.charging_rate_cleaner = 10.0
+        self.cleaning_power_consumption = 0.2
+        self.cleaner_min_charge_duration = 2.0
+        self.cleaner_suction_consumption = 0.2  # Map.cleaner_suction_consumption
+
+        B, C, W = num_maps, num_cleaners, num_windows
+        self._rows = np.arange(B)
+        self.time = np.zeros(B, dtype=np.float64)
+        self.steps = np.zeros(B, dtype=np.int64)
+        self.base_pos = np.zeros((B, 3), dtype=np.float64)
+
+        self.drone_pos = np.zeros((B, 3), dtype=np.float64)
+        self.drone_battery = np.zeros(B, dtype=np.float64)
+        self.drone_capacity = np.zeros(B, dtype=np.float64)
+        self.drone_ucupied = np.zeros(B, dtype=bool)
+        self.drone_load = np.full(B, NO_INDEX, dtype=np.int32)
+
+        self.cleaner_pos = np.zeros((B, C, 3), dtype=np.float64)
+        self.cleaner_battery = np.zeros((B, C), dtype=np.float64)
+        self.cleaner_capacity = np.zeros((B, C), dtype=np.float64)
+        self.cleaner_is_cleaning = np.zeros((B, C), dtype=bool)
+        self.cleaner_is_charging = np.zeros((B, C), dtype=bool)
+        self.cleaner_on_window = np.full((B, C), NO_INDEX, dtype=np.int32)
+        self.cleaner_last_update = np.zeros((B, C), dtype=np.float64)
+
+        self.process_kind = np.zeros((B, C), dtype=np.int8)
+        self.process_end = np.zeros((B, C), dtype=np.float64)
+        self.process_last_update = np.zeros((B, C), dtype=np.float64)  # larsted_update_time of the process
+
+        self.window_pos = np.zeros((B, W, 3), dtype=np.float64)
+        self.window_cleaning_time = np.zeros((B, W), dtype=np.float64)
+        self.window_state = np.zeros((B, W), dtype=np.int8)
+
+        self.reset()
+
+    # ---- Map setup ----
+    def reset(self, mask=None):
+        """Replace the maps selected by mask (all by default) with new random maps."""
+        if mask is None:
+            mask = np.ones(self.num_maps, dtype=bool)
+        n = int(np.count_nonzero(mask))
+        if n == 0:
+            return
+        C, W = self.num_cleaners, self.num_windows
+        # Same layout and distributions as random_map_generater
+        self.time[mask] = 0.0
+        self.steps[mask] = 0
+        self.base_pos[mask] = 0.0
+
+        self.drone_pos[mask] = 0.0
+        self.drone_battery[mask] = 100.0
+        self.drone_capacity[mask] = 100.0
+        self.drone_ucupied[mask] = False
+        self.drone_load[mask] = NO_INDEX
+
+        self.cleaner_pos[mask] = 0.0
+        self.cleaner_battery[mask] = 200.0
+        self.cleaner_capacity[mask] = 200.0
+        self.cleaner_is_cleaning[mask] = False
+        self.cleaner_is_charging[mask] = False
+        self.cleaner_on_window[mask] = NO_INDEX
+        self.cleaner_last_update[mask] = 0.0
+        self.process_kind[mask] = PROCESS_NONE
+        self.process_end[mask] = 0.0
+        self.process_last_update[mask] = 0.0
+
+        low = np.array([-50.0, -50.0, 10.0])
+        high = np.array([50.0, 50.0, 100.0])
+        self.window_pos[mask] = self.rng.uniform(low, high, size=(n, W, 3))
+        self.window_cleaning_time[mask] = self.rng.uniform(5, 10, size=(n, W))
+        self.window_state[mask] = WINDOW_DIRTY
+
+    def load_map(self, index: int, map_obj: Map):
+        """Copy a Map into slot index, it must have the same number of cleaners and windows."""
+        arrays = map_obj.arrays
+        self.time[index] = map_obj.time
+        self.steps[index] = 0
+        self.base_pos[index] = arrays.base_pos
+        self.drone_pos[index] = arrays.drone_pos[0]
+        self.drone_battery[index] = arrays.drone_battery[0]
+        self.drone_capacity[index] = arrays.drone_capacity[0]
+        self.drone_ucupied[index] = arrays.drone_ucupied[0]
+        self.drone_load[index] = arrays.drone_load[0]
+        self.cleaner_pos[index] = arrays.cleaner_pos
+        self.cleaner_battery[index] = arrays.battery_levels()
+        self.cleaner_capacity[index] = arrays.cleaner_capacity
+        self.cleaner_is_cleaning[index] = arrays.cleaner_is_cleaning
+        self.cleaner_is_charging[index] = arrays.cleaner_is_charging
+        self.cleaner_on_window[index] = arrays.cleaner_on_window
+        # Map keeps its batteries lazily (see MapState), this simulation wants them as of the last update
+        self.cleaner_last_update[index] = np.where(arrays.cleaner_suction_on, arrays.battery_time[0], arrays.cleaner_last_update)
+        self.window_pos[index] = arrays.window_pos
+        self.window_cleaning_time[index] = arrays.window_cleaning_time
+        self.window_state[index] = arrays.window_state
+        self.process_kind[index] = PROCESS_NONE
+        self.process_end[index] = 0.0
+        self.process_last_update[index] = 0.0
+        for c_idx, process in enumerate(map_obj.cleaning_processes):
+            if process is None:
+                continue
+            self.process_kind[index, c_idx] = PROCESS_CHARGE if hasattr(process, 'charge_rate') else PROCESS_CLEAN
+            self.process_end[index, c_idx] = process.end_time
+            self.process_last_update[index, c_idx] = arrays.battery_time[0]
+
+    # ---- Allowed actions ----
+    def allowed_mask(self):
+        """(B, num_actions) bool array of the actions whose is_allowed() holds on each map."""
+        W = self.num_windows
+        carrying = self.drone_load != NO_INDEX
+        mask = np.empty((self.num_maps, self.num_actions), dtype=bool)
+        mask[:, ACTION_NULL] = True
+        mask[:, ACTION_FLY_TO_BASE_AND_CHARGE] = self.drone_battery < 99.9
+        mask[:, ACTION_DROP_OFF_AT_BASE] = carrying
+        mask[:, FIRST_WINDOW_ACTION:FIRST_WINDOW_ACTION + W] = (
+            (carrying & ~self.drone_ucupied)[:, None] & (self.window_state != WINDOW_CLEAN)
+        )
+        mask[:, FIRST_WINDOW_ACTION + W:] = ~carrying[:, None] & ~self.cleaner_is_cleaning
+        return mask
+
+    def _is_allowed(self, actions):
+        return self.allowed_mask()[self._rows, actions]
+
+    # ---- Simulation ----
+    def _drain_drone(self, mask, energy_cost):
+        energy_used_percent = energy_cost / self.drone_capacity * 100.0
+        battery = self.drone_battery - energy_used_percent
+        self.drone_battery = np.where(mask, np.maximum(battery, 0.0), self.drone_battery)
+
+    def _run_drone_actions(self, actions):
+        rows = self._rows
+        W = self.num_windows
+        is_charge = actions == ACTION_FLY_TO_BASE_AND_CHARGE
+        to_base = is_charge | (actions == ACTION_DROP_OFF_AT_BASE)
+        is_window = (actions >= FIRST_WINDOW_ACTION) & (actions < FIRST_WINDOW_ACTION + W)
+        is_pickup = actions >= FIRST_WINDOW_ACTION + W
+        window_index = np.where(is_window, actions - FIRST_WINDOW_ACTION, 0)
+        cleaner_index = np.where(is_pickup, actions - FIRST_WINDOW_ACTION - W, 0)
+
+        # 1. Fly to the target if not already there
+        target = self.drone_pos.copy()
+        target[to_base] = self.base_pos[to_base]
+        target[is_window] = self.window_pos[rows[is_window], window_index[is_window]]
+        target[is_pickup] = self.cleaner_pos[rows[is_pickup], cleaner_index[is_pickup]]
+        offset = self.drone_pos - target
+        flying = np.any(offset != 0.0, axis=1)
+        duration = np.sqrt(np.einsum('ij,ij->i', offset, offset)) / self.drone_speed
+        self._drain_drone(flying, duration * self.flying_power_consumption)
+        self.time += np.where(flying, duration, 0.0)
+        self.drone_pos[flying] = target[flying]
+        carried = flying & (self.drone_load != NO_INDEX)
+        self.cleaner_pos[rows[carried], self.drone_load[carried]] = self.drone_pos[carried]
+
+        carrying = self.drone_load != NO_INDEX
+        drop_energy = self.pickup_drop_duration * self.pickup_drop_power
+
+        # 2a. Drop off the cleaner at the window
+        drop = is_window & carrying
+        b, c = rows[drop], self.drone_load[drop]
+        self.cleaner_pos[b, c] = self.window_pos[b, window_index[drop]]
+        self.cleaner_on_window[b, c] = window_index[drop]
+        # 2b. Drop off the cleaner at the base
+        drop_base = to_base & carrying
+        self.cleaner_pos[rows[drop_base], self.drone_load[drop_base]] = self.base_pos[drop_base]
+        # 2c. Pick up the cleaner
+        pickup = is_pickup & ~carrying
+        b, c = rows[pickup], cleaner_index[pickup]
+        self.cleaner_is_cleaning[b, c] = False
+        self.cleaner_pos[b, c] = self.drone_pos[pickup]
+        self.cleaner_on_window[b, c] = NO_INDEX
+
+        handled = drop | drop_base | pickup
+        self.drone_load[drop | drop_base] = NO_INDEX
+        self.drone_load[pickup] = cleaner_index[pickup]
+        self._drain_drone(handled, drop_energy)
+        self.time += np.where(handled, self.pickup_drop_duration, 0.0)
+
+        # 3. Charge the drone
+        charge = is_charge & (self.drone_battery < 99.9)
+        current_energy = self.drone_battery / 100.0 * self.drone_capacity
+        energy_needed = self.drone_capacity - current_energy
+        duration = np.maximum(energy_needed / self.charging_rate_drone, 2.0)
+        self.drone_battery[charge] = 100.0
+        self.time += np.where(charge, duration, 0.0)
+
+    def _run_cleaner_processes(self):
+        rows = self._rows[:, None]
+        on_window = self.cleaner_on_window
+        has_window = on_window != NO_INDEX
+        window_index = np.where(has_window, on_window, 0)
+        window_pos = self.window_pos[rows, window_index]
+        at_base = np.all(self.cleaner_pos == self.base_pos[:, None, :], axis=2)
+        idle = ~self.cleaner_is_charging & ~self.cleaner_is_cleaning
+
+        # Start new processes, cleaning before charging (MapSimulation._choose_cleaner_action)
+        start_clean = (
+            has_window
+            & np.all(self.cleaner_pos == window_pos, axis=2)
+            & (self.cleaner_battery > 40.0)
+            & idle
+            & (self.window_state[rows, window_index] == WINDOW_DIRTY)
+        )
+        start_charge = at_base & idle & (self.cleaner_battery < 99.9) & ~start_clean
+        now = np.broadcast_to(self.time[:, None], start_clean.shape)
+
+        self.cleaner_is_cleaning |= start_clean
+        clean_end = now + self.window_cleaning_time[rows, window_index]
+
+        current_energy = self.cleaner_battery / 100.0 * self.cleaner_capacity
+        energy_needed = self.cleaner_capacity - current_energy
+        if self.charging_rate_cleaner > 0:
+            charge_duration = energy_needed / self.charging_rate_cleaner
+        else:
+            charge_duration = np.zeros_like(energy_needed)
+        charge_duration = np.maximum(charge_duration, self.cleaner_min_charge_duration)
+        self.cleaner_is_charging |= start_charge
+
+        started = start_clean | start_charge
+        self.process_kind[start_clean] = PROCESS_CLEAN
+        self.process_kind[start_charge] = PROCESS_CHARGE
+        self.process_end = np.where(start_clean, clean_end, np.where(start_charge, now + charge_duration, self.process_end))
+        self.process_last_update[started] = 0.0
+
+        # Map.update_cleaning_processes
+        running = self.process_kind != PROCESS_NONE
+        done = running & (self.process_end <= now)
+        update_time = np.where(done, self.process_end, now)
+        run_time = update_time - self.process_last_update
+        self.process_last_update = np.where(running, update_time, self.process_last_update)
+
+        cleaning = self.process_kind == PROCESS_CLEAN
+        charging = self.process_kind == PROCESS_CHARGE
+        drain_pct = (self.cleaning_power_consumption * run_time / self.cleaner_capacity) * 100.0
+        gain_pct = (self.charging_rate_cleaner * run_time / self.cleaner_capacity) * 100.0
+        battery = self.cleaner_battery
+        battery = np.where(cleaning, np.maximum(0.0, battery - drain_pct), battery)
+        battery = np.where(charging & done, 100.0, battery)
+        battery = np.where(charging, np.minimum(100.0, battery + gain_pct), battery)
+
+        clean_done = done & cleaning
+        b, c = np.nonzero(clean_done)
+        self.window_state[b, self.cleaner_on_window[b, c]] = WINDOW_CLEAN
+        self.cleaner_is_cleaning &= ~clean_done
+        self.cleaner_is_charging &= ~(done & charging)
+        self.process_kind[done] = PROCESS_NONE
+
+        # Suction drain while a cleaner sits on a window
+        suction = battery - self.cleaner_suction_consumption * (now - self.cleaner_last_update)
+        self.cleaner_battery = np.where(has_window, np.maximum(suction, 0.0), battery)
+        self.cleaner_last_update = np.where(has_window, now, self.cleaner_last_update)
+
+    def step(self, actions):
+        """
+        Apply one drone action id per map, then run the cleaners.
+
+        Returns:
+            (rewards, dones, info) with one entry per map. Finished maps are
+            reset before returning, their final time and step count are in
+            info['episode_time'] and info['episode_steps'] (nan / -1 for maps
+            that are still running).
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        actions = np.where(self._is_allowed(actions), actions, ACTION_NULL)
+        prev_clean = np.count_nonzero(self.window_state == WINDOW_CLEAN, axis=1)
+        prev_empty = np.any(self.cleaner_battery == 0.0, axis=1)
+
+        self._run_drone_actions(actions)
+        self._run_cleaner_processes()
+        self.steps += 1
+
+        # Same reward and end condition as MapSimulation.compute_reward / run
+        all_clean = np.all(self.window_state == WINDOW_CLEAN, axis=1)
+        any_empty = np.any(self.cleaner_battery == 0.0, axis=1)
+        cleaned = np.count_nonzero(self.window_state == WINDOW_CLEAN, axis=1) - prev_clean
+        rewards = 1000.0 * cleaned - 1000.0 * (any_empty & ~prev_empty) - 1.0
+        dones = all_clean | any_empty
+
+        info = {
+            'episode_time': np.where(dones, self.time, np.nan),
+            'episode_steps': np.where(dones, self.steps, -1),
+        }
+        self.reset(dones)
+        return rewards, dones, info
+
+
+if __name__ == "__main__":
+    vec_sim = VectorMapSimulation(num_maps=256, num_cleaners=2, num_windows=5, seed=42)
+    rng = np.random.default_rng(0)
+    n_calls = 200
+    episodes = 0
+    start = time.perf_counter()
+    for _ in range(n_calls):
+        mask = vec_sim.allowed_mask()
+        mask[:, ACTION_NULL] = False
+        # Random allowed non-null action per map
+        actions = np.argmax(mask * rng.random(mask.shape), axis=1)
+        rewards, dones, info = vec_sim.step(actions)
+        episodes += int(np.count_nonzero(dones))
+    elapsed = time.perf_counter() - start
+    print(f"{n_calls * vec_sim.num_maps / elapsed:.0f} environment steps per second, {episodes} episodes finished")
@@ -1,13 +1,94 @@
 import numpy as np
+from map_state import MapState, WINDOW_STATE_NAMES, WINDOW_STATE_CODES
+
+
 class Window:
+    """View of one window row in a MapState (see map_state.py)."""
+
     def __init__(self, pos3d, width, height, state,cleaing_time, name=None):
+        # A window made on its own gets a one-row state, Map rebinds it to the shared one
+        self._s = MapState(num_drones=0, num_cleaners=0, num_windows=1)
+        self._i = 0
+        self._map = None
         self.name=name
         self.pos3d = np.array(pos3d, dtype=np.float64)  # (x, y, z) position of the window
         self.width = width
         self.height = height
         self.state = state  # 'clean' or 'dirty'
         self.cleaning_time = cleaing_time  # time required to clean the window
-        self.this_id = id(self)
-        self.states = [self.pos3d, self.cleaning_time, self.state]
         self.cleaner = None  # Robot_cleaner assigned to clean this window
-    
+
+    @classmethod
+    def view(cls, state: MapState, index: int, owner_map):
+        window = cls.__new__(cls)
+        window._bind(state, index, owner_map)
+        window.cleaner = None
+        return window
+
+    def _bind(self, state: MapState, index: int, owner_map):
+        self._s = state
+        self._i = index
+        self._map = owner_map
+
+    def _set(self, array, value):
+        # Write this window's row and flag it as changed (simulation.py re-checks its actions)
+        self._s.write(array, self._i, value)
+        self._s.window_dirty[self._i] = True
+
+    @property
+    def this_id(self):
+        return id(self)
+
+    @property
+    def name(self):
+        return self._s.window_names[self._i]
+
+    @name.setter
+    def name(self, value):
+        self._s.window_names[self._i] = value
+
+    @property
+    def pos3d(self):
+        # A copy, writing into the row directly would bypass write() and the journal
+        return self._s.window_pos[self._i].copy()
+
+    @pos3d.setter
+    def pos3d(self, value):
+        self._set(self._s.window_pos, value)
+        self._s.topology.invalidate()
+
+    @property
+    def width(self):
+        return float(self._s.window_width[self._i])
+
+    @width.setter
+    def width(self, value):
+        self._set(self._s.window_width, value)
+
+    @property
+    def height(self):
+        return float(self._s.window_height[self._i])
+
+    @height.setter
+    def height(self, value):
+        self._set(self._s.window_height, value)
+
+    @property
+    def cleaning_time(self):
+        return float(self._s.window_cleaning_time[self._i])
+
+    @cleaning_time.setter
+    def cleaning_time(self, value):
+        self._set(self._s.window_cleaning_time, value)
+
+    @property
+    def state(self):
+        return WINDOW_STATE_NAMES[self._s.window_state[self._i]]
+
+    @state.setter
+    def state(self, value):
+        self._set(self._s.window_state, WINDOW_STATE_CODES[value])
+
+    @property
+    def states(self):
+        return [self.pos3d, self.cleaning_time, self.state]